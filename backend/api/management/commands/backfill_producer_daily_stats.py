@@ -0,0 +1,26 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import Producer
+from api.services.producer_stats_service import ProducerStatsService
+
+
+class Command(BaseCommand):
+    help = "Rebuild producer daily statistics rollups from orders"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--producer",
+            default=None,
+            help="Rebuild rollups of a single producer only (producer id)",
+        )
+
+    def handle(self, *args, **options):
+        producer = None
+        if options["producer"] is not None:
+            try:
+                producer = Producer.objects.get(id=options["producer"])
+            except (Producer.DoesNotExist, ValidationError):
+                raise CommandError(f"Producer {options['producer']} not found") from None
+        rows = ProducerStatsService().rebuild(producer=producer)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} producer daily stats rows"))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api.services.counter_service import counter_service
+
+
+class Command(BaseCommand):
+    help = "Flush buffered popularity counters (views_count, in_cart_count) to the database"
+
+    def handle(self, *args, **options):
+        updated = counter_service.flush()
+        self.stdout.write(self.style.SUCCESS(f"Flushed counters for {updated} rows"))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api.services.chat_service import ChatService
+
+
+class Command(BaseCommand):
+    help = "Rebuild chat thread summaries (inbox read model) from chat messages"
+
+    def handle(self, *args, **options):
+        threads = ChatService.rebuild_threads()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {threads} chat threads"))
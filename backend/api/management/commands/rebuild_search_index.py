@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api.services.search_service import DishSearchService
+
+
+class Command(BaseCommand):
+    help = "Rebuild the dish full-text search index"
+
+    def handle(self, *args, **options):
+        indexed = DishSearchService().rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} dishes"))
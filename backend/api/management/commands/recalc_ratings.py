@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from api.services.bulk_rating_service import BulkRatingService
+
+
+class Command(BaseCommand):
+    help = "Recalculate ratings of all producers and dishes in bulk"
+
+    def handle(self, *args, **options):
+        producers, dishes = BulkRatingService().recalc_all()
+        self.stdout.write(
+            self.style.SUCCESS(f"Updated ratings for {producers} producers and {dishes} dishes")
+        )
@@ -0,0 +1,26 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import Producer
+from api.services.slot_occupancy_service import SlotOccupancyService
+
+
+class Command(BaseCommand):
+    help = "Correct delivery slot occupancy counters from orders"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--producer",
+            default=None,
+            help="Correct counters of a single producer only (producer id)",
+        )
+
+    def handle(self, *args, **options):
+        producer = None
+        if options["producer"] is not None:
+            try:
+                producer = Producer.objects.get(id=options["producer"])
+            except (Producer.DoesNotExist, ValidationError):
+                raise CommandError(f"Producer {options['producer']} not found") from None
+        rows = SlotOccupancyService().reconcile(producer=producer)
+        self.stdout.write(self.style.SUCCESS(f"Corrected {rows} slot occupancy counters"))
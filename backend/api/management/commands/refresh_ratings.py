@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from api.services.rating_refresh_service import rating_refresh_queue
+
+
+class Command(BaseCommand):
+    help = "Recalculate ratings of producers and dishes marked since the previous run"
+
+    def handle(self, *args, **options):
+        producers, dishes = rating_refresh_queue.refresh()
+        self.stdout.write(
+            self.style.SUCCESS(f"Refreshed ratings for {producers} producers and {dishes} dishes")
+        )
@@ -5,14 +5,25 @@ from django.utils import timezone
 
 
 class Command(BaseCommand):
-    help = "Run background jobs: process outbox and periodic cleanups"
+    help = "Run background jobs: process outbox, flush counters, refresh ratings and periodic cleanups"
 
     def add_arguments(self, parser):
         parser.add_argument(
             "--outbox-interval",
             type=int,
             default=10,
-            help="Interval in seconds between process_outbox_events runs",
+            help="Interval in seconds between process_outbox_events and flush_counters runs",
+        )
+        parser.add_argument(
+            "--skip-outbox",
+            action="store_true",
+            help="Do not process the outbox here (run_outbox_dispatcher is running)",
+        )
+        parser.add_argument(
+            "--rating-interval",
+            type=int,
+            default=60,
+            help="Interval in seconds between refresh_ratings runs",
         )
         parser.add_argument(
             "--cleanup-interval",
@@ -24,13 +35,22 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         outbox_interval = options["outbox_interval"]
         cleanup_interval = options["cleanup_interval"]
+        rating_interval = options["rating_interval"]
         last_cleanup_at = timezone.now()
+        last_rating_at = last_cleanup_at
+        skip_outbox = options["skip_outbox"]
         while True:
-            call_command("process_outbox_events")
+            if not skip_outbox:
+                call_command("process_outbox_events")
+            call_command("flush_counters")
             now = timezone.now()
+            if (now - last_rating_at).total_seconds() >= rating_interval:
+                call_command("refresh_ratings")
+                last_rating_at = now
             if (now - last_cleanup_at).total_seconds() >= cleanup_interval:
                 call_command("cleanup_outbox_events")
                 call_command("cleanup_gift_idempotency")
+                call_command("reconcile_slot_occupancy")
                 last_cleanup_at = now
             time.sleep(outbox_interval)
 
@@ -0,0 +1,54 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from api.services.outbox_dispatcher import OutboxDispatcher
+
+
+class Command(BaseCommand):
+    help = "Run the long-lived outbox dispatcher (LISTEN/NOTIFY on PostgreSQL, adaptive polling elsewhere)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4, help="Number of publisher threads")
+        parser.add_argument("--batch-size", type=int, default=100, help="Events claimed per batch")
+        parser.add_argument(
+            "--min-interval",
+            type=float,
+            default=0.5,
+            help="Polling interval in seconds while events keep arriving",
+        )
+        parser.add_argument(
+            "--max-interval",
+            type=float,
+            default=10.0,
+            help="Upper bound of the polling interval when the outbox is idle",
+        )
+        parser.add_argument(
+            "--stats-interval",
+            type=float,
+            default=60.0,
+            help="Interval in seconds between throughput and lag reports",
+        )
+        parser.add_argument(
+            "--no-notify",
+            action="store_true",
+            help="Do not use LISTEN/NOTIFY even on PostgreSQL",
+        )
+
+    def handle(self, *args, **options):
+        dispatcher = OutboxDispatcher(
+            workers=options["workers"],
+            batch_size=options["batch_size"],
+            min_interval=options["min_interval"],
+            max_interval=options["max_interval"],
+            use_notify=not options["no_notify"],
+        )
+
+        def stop(signum, frame):
+            dispatcher.stop()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        self.stdout.write("Outbox dispatcher started")
+        dispatcher.run(stats_interval=options["stats_interval"])
+        self.stdout.write(self.style.SUCCESS(f"Outbox dispatcher stopped: {dispatcher.stats.snapshot()}"))
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0061_add_manual_closed_date"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SlotOccupancy",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("slot_start", models.DateTimeField(help_text="Начало слота доставки")),
+                ("orders_count", models.PositiveIntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("producer", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="slot_occupancies", to="api.producer")),
+            ],
+            options={
+                "unique_together": {("producer", "slot_start")},
+            },
+        ),
+    ]
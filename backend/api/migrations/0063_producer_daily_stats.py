@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0062_slot_occupancy"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProducerDailyStats",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("date", models.DateField()),
+                ("completed_count", models.PositiveIntegerField(default=0)),
+                ("cancelled_count", models.PositiveIntegerField(default=0)),
+                ("revenue", models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ("dishes", models.JSONField(blank=True, default=dict, help_text="{dish_name: {count, revenue}} по завершённым заказам")),
+                ("toppings", models.JSONField(blank=True, default=dict, help_text="{topping_name: count} по завершённым заказам")),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("producer", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="daily_stats", to="api.producer")),
+            ],
+            options={
+                "unique_together": {("producer", "date")},
+            },
+        ),
+    ]
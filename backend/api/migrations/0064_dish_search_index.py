@@ -0,0 +1,205 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:48
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+POSTGRES_FORWARD = [
+    """
+    ALTER TABLE api_dishsearchdocument ADD COLUMN search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(title, '')), 'A')
+        || setweight(to_tsvector('simple', coalesce(body, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX api_dishsearch_vector_gin ON api_dishsearchdocument USING GIN (search_vector)",
+]
+POSTGRES_BACKWARD = [
+    "DROP INDEX IF EXISTS api_dishsearch_vector_gin",
+    "ALTER TABLE api_dishsearchdocument DROP COLUMN IF EXISTS search_vector",
+]
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE api_dishsearch_fts USING fts5(
+        title, body,
+        content='api_dishsearchdocument', content_rowid='id',
+        prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER api_dishsearch_fts_ai AFTER INSERT ON api_dishsearchdocument BEGIN
+        INSERT INTO api_dishsearch_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END
+    """,
+    """
+    CREATE TRIGGER api_dishsearch_fts_ad AFTER DELETE ON api_dishsearchdocument BEGIN
+        INSERT INTO api_dishsearch_fts(api_dishsearch_fts, rowid, title, body)
+        VALUES ('delete', old.id, old.title, old.body);
+    END
+    """,
+    """
+    CREATE TRIGGER api_dishsearch_fts_au AFTER UPDATE ON api_dishsearchdocument BEGIN
+        INSERT INTO api_dishsearch_fts(api_dishsearch_fts, rowid, title, body)
+        VALUES ('delete', old.id, old.title, old.body);
+        INSERT INTO api_dishsearch_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END
+    """,
+]
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS api_dishsearch_fts_au",
+    "DROP TRIGGER IF EXISTS api_dishsearch_fts_ad",
+    "DROP TRIGGER IF EXISTS api_dishsearch_fts_ai",
+    "DROP TABLE IF EXISTS api_dishsearch_fts",
+]
+
+
+def _run(schema_editor, statements):
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def create_search_index(apps, schema_editor):
+    """Индекс поверх DishSearchDocument, зависящий от СУБД."""
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        _run(schema_editor, POSTGRES_FORWARD)
+    elif vendor == "sqlite":
+        _run(schema_editor, SQLITE_FORWARD)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        _run(schema_editor, POSTGRES_BACKWARD)
+    elif vendor == "sqlite":
+        _run(schema_editor, SQLITE_BACKWARD)
+
+
+# Копия стеммера из api.services.search_service на момент миграции:
+# миграция не должна зависеть от последующих изменений сервиса.
+_VOWELS = "аеиоуыэюя"
+_PERFECTIVE_GERUND = re.compile(r"(?:(?<=[ая])(?:в|вши|вшись)|ив|ивши|ившись|ыв|ывши|ывшись)$")
+_REFLEXIVE = re.compile(r"(?:ся|сь)$")
+_ADJECTIVE = r"(?:ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых|ую|юю|ая|яя|ою|ею)"
+_PARTICIPLE = r"(?:(?<=[ая])(?:ем|нн|вш|ющ|щ)|ивш|ывш|ующ)"
+_ADJECTIVAL = re.compile(rf"{_PARTICIPLE}?{_ADJECTIVE}$")
+_VERB = re.compile(
+    r"(?:(?<=[ая])(?:ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)"
+    r"|ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|ено|ят|ует|уют"
+    r"|ит|ыт|ены|ить|ыть|ишь|ую|ю)$"
+)
+_NOUN = re.compile(
+    r"(?:а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|ем|ам|ом|о|у"
+    r"|ах|иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$"
+)
+_DERIVATIONAL = re.compile(r"(?:ост|ость)$")
+_SUPERLATIVE = re.compile(r"(?:ейше|ейш)$")
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _regions(word):
+    rv = r1 = r2 = len(word)
+    for i, ch in enumerate(word):
+        if ch in _VOWELS:
+            rv = i + 1
+            break
+    for i in range(1, len(word)):
+        if word[i - 1] in _VOWELS and word[i] not in _VOWELS:
+            r1 = i + 1
+            break
+    for i in range(r1 + 1, len(word)):
+        if word[i - 1] in _VOWELS and word[i] not in _VOWELS:
+            r2 = i + 1
+            break
+    return rv, r2
+
+
+def _cut(pattern, text):
+    match = pattern.search(text)
+    if match is None:
+        return text, False
+    return text[: match.start()], True
+
+
+def stem(word):
+    """Основа русского слова по алгоритму Snowball; прочие слова не меняются."""
+    word = word.lower().replace("ё", "е")
+    rv, r2 = _regions(word)
+    head, tail = word[:rv], word[rv:]
+
+    tail, found = _cut(_PERFECTIVE_GERUND, tail)
+    if not found:
+        tail, _ = _cut(_REFLEXIVE, tail)
+        for pattern in (_ADJECTIVAL, _VERB, _NOUN):
+            tail, found = _cut(pattern, tail)
+            if found:
+                break
+
+    if tail.endswith("и"):
+        tail = tail[:-1]
+
+    match = _DERIVATIONAL.search(tail)
+    if match and rv + match.start() >= r2:
+        tail = tail[: match.start()]
+
+    tail, found = _cut(_SUPERLATIVE, tail)
+    if tail.endswith("нн"):
+        tail = tail[:-1]
+    elif not found and tail.endswith("ь"):
+        tail = tail[:-1]
+    return head + tail
+
+
+def tokenize(text):
+    return [token.lower() for token in _TOKEN_RE.findall(text or "")]
+
+
+def normalize(text):
+    """Стеммированный текст для индексации."""
+    return " ".join(stem(token) for token in tokenize(text))
+
+
+def populate_search_documents(apps, schema_editor):
+    """Документы для существующих блюд (как DishSearchService.build_document); индекс СУБД заполняется триггерами."""
+    Dish = apps.get_model("api", "Dish")
+    DishSearchDocument = apps.get_model("api", "DishSearchDocument")
+    documents = []
+    for dish in Dish.objects.select_related("category", "producer").iterator(chunk_size=500):
+        body_parts = [
+            dish.description,
+            dish.composition,
+            dish.category.name if dish.category_id else "",
+            dish.producer.name if dish.producer_id else "",
+        ]
+        documents.append(
+            DishSearchDocument(
+                dish_id=dish.pk,
+                title=normalize(dish.name),
+                body=normalize(" ".join(part for part in body_parts if part)),
+            )
+        )
+    DishSearchDocument.objects.bulk_create(documents, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0063_producer_daily_stats"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DishSearchDocument",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("title", models.TextField(blank=True, default="")),
+                ("body", models.TextField(blank=True, default="")),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("dish", models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name="search_document", to="api.dish")),
+            ],
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+        migrations.RunPython(populate_search_documents, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:20
+
+from django.db import migrations
+
+POSTGRES_FORWARD = [
+    """
+    CREATE OR REPLACE FUNCTION api_outboxevent_notify() RETURNS trigger AS $$
+    BEGIN
+        PERFORM pg_notify('outbox_events', NEW.aggregate_type);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER api_outboxevent_notify_ai
+    AFTER INSERT ON api_outboxevent
+    FOR EACH ROW EXECUTE FUNCTION api_outboxevent_notify()
+    """,
+]
+POSTGRES_BACKWARD = [
+    "DROP TRIGGER IF EXISTS api_outboxevent_notify_ai ON api_outboxevent",
+    "DROP FUNCTION IF EXISTS api_outboxevent_notify()",
+]
+
+
+def create_notify_trigger(apps, schema_editor):
+    # LISTEN/NOTIFY есть только в PostgreSQL; в остальных СУБД диспетчер опрашивает таблицу
+    if schema_editor.connection.vendor == "postgresql":
+        for statement in POSTGRES_FORWARD:
+            schema_editor.execute(statement)
+
+
+def drop_notify_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        for statement in POSTGRES_BACKWARD:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0064_dish_search_index"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_notify_trigger, drop_notify_trigger),
+    ]
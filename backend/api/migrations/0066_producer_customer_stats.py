@@ -0,0 +1,66 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:21
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_customer_stats(apps, schema_editor):
+    # Та же группировка, что в ProducerCustomerStatsService.rebuild, на исторических моделях
+    Order = apps.get_model("api", "Order")
+    ProducerCustomerStats = apps.get_model("api", "ProducerCustomerStats")
+    rows = (
+        Order.objects.filter(status="COMPLETED", user__isnull=False)
+        .annotate(order_producer_id=Coalesce("producer_id", "dish__producer_id"))
+        .values("order_producer_id", "user_id")
+        .annotate(
+            order_count=Count("id"),
+            total_spent=Sum("total_price"),
+            last_order_at=Max("created_at"),
+        )
+        .order_by()
+    )
+    ProducerCustomerStats.objects.bulk_create(
+        [
+            ProducerCustomerStats(
+                producer_id=row["order_producer_id"],
+                user_id=row["user_id"],
+                order_count=row["order_count"],
+                total_spent=row["total_spent"] or 0,
+                last_order_at=row["last_order_at"],
+            )
+            for row in rows
+            if row["order_producer_id"] is not None
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0065_outbox_notify_trigger"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProducerCustomerStats",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("order_count", models.PositiveIntegerField(default=0)),
+                ("total_spent", models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ("last_order_at", models.DateTimeField(blank=True, null=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("producer", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="customer_stats", to="api.producer")),
+                ("user", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="producer_stats", to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                "indexes": [models.Index(fields=["producer", "order_count"], name="api_produce_produce_b2e67e_idx")],
+                "unique_together": {("producer", "user")},
+            },
+        ),
+        migrations.RunPython(backfill_customer_stats, migrations.RunPython.noop),
+    ]
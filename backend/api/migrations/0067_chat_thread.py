@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:24
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0066_producer_customer_stats"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ChatThread",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("last_message_at", models.DateTimeField(blank=True, null=True)),
+                ("last_message_text", models.CharField(blank=True, max_length=255)),
+                ("low_unread_count", models.PositiveIntegerField(default=0)),
+                ("high_unread_count", models.PositiveIntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("last_message", models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name="+", to="api.chatmessage")),
+                ("order", models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name="chat_threads", to="api.order")),
+                ("user_high", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="+", to=settings.AUTH_USER_MODEL)),
+                ("user_low", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="+", to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                "indexes": [models.Index(fields=["user_low", "-last_message_at"], name="api_chatthr_user_lo_f15454_idx"), models.Index(fields=["user_high", "-last_message_at"], name="api_chatthr_user_hi_325045_idx")],
+                "constraints": [models.UniqueConstraint(condition=models.Q(("order__isnull", False)), fields=("user_low", "user_high", "order"), name="chat_thread_unique_order"), models.UniqueConstraint(condition=models.Q(("order__isnull", True)), fields=("user_low", "user_high"), name="chat_thread_unique_direct")],
+            },
+        ),
+    ]
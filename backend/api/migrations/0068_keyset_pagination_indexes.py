@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:32
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0067_chat_thread"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="chatmessage",
+            index=models.Index(fields=["sender", "created_at", "id"], name="api_chatmes_sender__595edf_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="chatmessage",
+            index=models.Index(fields=["recipient", "created_at", "id"], name="api_chatmes_recipie_4cc79f_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="notification",
+            index=models.Index(fields=["user", "-created_at", "-id"], name="api_notific_user_id_1e0a51_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(fields=["user", "-created_at", "-id"], name="api_order_user_id_73e58f_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="review",
+            index=models.Index(fields=["producer", "-created_at", "-id"], name="api_review_produce_ed3d13_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="review",
+            index=models.Index(fields=["user", "-created_at", "-id"], name="api_review_user_id_39f4a6_idx"),
+        ),
+    ]
@@ -4,6 +4,7 @@ import django.utils.timezone
 from django.conf import settings
 from django.db import models
 
+from core.cache import CachedModelQuerySet
 from core.validators import (
     DeliveryPricingRulesValidator,
     DeliveryZonesValidator,
@@ -137,6 +138,8 @@ class Producer(models.Model):
         max_digits=9, decimal_places=6, blank=True, null=True
     )
 
+    objects = CachedModelQuerySet.as_manager()
+
     @property
     def base_commission_rate(self):
         return 0.10 if self.producer_type == "INDIVIDUAL_ENTREPRENEUR" else 0.05
@@ -192,6 +195,8 @@ class Category(models.Model):
         related_name="subcategories",
     )
 
+    objects = CachedModelQuerySet.as_manager()
+
     def __str__(self):
         return self.name
 
@@ -254,10 +259,26 @@ class Dish(models.Model):
     sort_score = models.FloatField(default=0)
     repeat_purchase_count = models.PositiveIntegerField(default=0)
 
+    objects = CachedModelQuerySet.as_manager()
+
     def __str__(self):
         return self.name
 
 
+class DishSearchDocument(models.Model):
+    """Стеммированный текст блюда для полнотекстового индекса (см. DishSearchService)."""
+
+    dish = models.OneToOneField(
+        Dish, on_delete=models.CASCADE, related_name="search_document"
+    )
+    title = models.TextField(blank=True, default="")
+    body = models.TextField(blank=True, default="")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Search document for {self.dish_id}"
+
+
 class DishImage(models.Model):
     dish = models.ForeignKey(Dish, on_delete=models.CASCADE, related_name="images")
     image = models.URLField()
@@ -381,6 +402,8 @@ class Order(models.Model):
     ready_at = models.DateTimeField(null=True, blank=True)
     delivered_at = models.DateTimeField(null=True, blank=True)
     cancelled_at = models.DateTimeField(null=True, blank=True)
+    # Последний переход в COMPLETED или из него (OrderSummaryService)
+    completion_changed_at = models.DateTimeField(null=True, blank=True, db_index=True)
     cancelled_by = models.CharField(
         max_length=20, choices=CANCELLED_BY_CHOICES, null=True, blank=True
     )
@@ -513,6 +536,8 @@ class Order(models.Model):
             models.Index(fields=["created_at"]),
             models.Index(fields=["status"]),
             models.Index(fields=["tinkoff_payment_id"]),
+            # Курсорная пагинация списков покупателя (KeysetPagination)
+            models.Index(fields=["user", "-created_at", "-id"]),
         ]
 
     def __str__(self):
@@ -577,6 +602,12 @@ class Review(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["producer", "-created_at", "-id"]),
+            models.Index(fields=["user", "-created_at", "-id"]),
+        ]
+
     def __str__(self):
         return f"Review for {self.order.id}"
 
@@ -741,10 +772,67 @@ class ChatMessage(models.Model):
     is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["sender", "created_at", "id"]),
+            models.Index(fields=["recipient", "created_at", "id"]),
+        ]
+
     def __str__(self):
         return f"Message {self.id} from {self.sender}"
 
 
+class ChatThread(models.Model):
+    """
+    Сводка переписки пары пользователей по заказу (или без заказа) для списка чатов.
+
+    Пара хранится упорядоченно: user_low - пользователь с меньшим id.
+    Обновляется ChatService в одной транзакции с сообщениями.
+    """
+
+    SNIPPET_LENGTH = 255
+
+    user_low = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+"
+    )
+    user_high = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+"
+    )
+    order = models.ForeignKey(
+        Order, on_delete=models.CASCADE, related_name="chat_threads", null=True, blank=True
+    )
+
+    last_message = models.ForeignKey(
+        ChatMessage, on_delete=models.SET_NULL, related_name="+", null=True, blank=True
+    )
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    last_message_text = models.CharField(max_length=SNIPPET_LENGTH, blank=True)
+    low_unread_count = models.PositiveIntegerField(default=0)
+    high_unread_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user_low", "user_high", "order"],
+                condition=models.Q(order__isnull=False),
+                name="chat_thread_unique_order",
+            ),
+            models.UniqueConstraint(
+                fields=["user_low", "user_high"],
+                condition=models.Q(order__isnull=True),
+                name="chat_thread_unique_direct",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["user_low", "-last_message_at"]),
+            models.Index(fields=["user_high", "-last_message_at"]),
+        ]
+
+    def __str__(self):
+        return f"Thread {self.user_low_id}-{self.user_high_id} ({self.order_id})"
+
+
 class ChatComplaint(models.Model):
     reporter = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -974,6 +1062,9 @@ class Notification(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     link = models.CharField(max_length=255, blank=True)
 
+    class Meta:
+        indexes = [models.Index(fields=["user", "-created_at", "-id"])]
+
     def __str__(self):
         return self.title
 
@@ -1047,6 +1138,81 @@ class FavoriteDish(models.Model):
         return f"{self.user} favorited {self.dish}"
 
 
+class SlotOccupancy(models.Model):
+    """Счётчик активных запланированных заказов продавца в слоте доставки."""
+
+    producer = models.ForeignKey(
+        Producer, on_delete=models.CASCADE, related_name="slot_occupancies"
+    )
+    slot_start = models.DateTimeField(help_text="Начало слота доставки")
+    orders_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = [["producer", "slot_start"]]
+
+    def __str__(self):
+        return f"{self.producer} {self.slot_start:%Y-%m-%d %H:%M} - {self.orders_count}"
+
+
+class ProducerDailyStats(models.Model):
+    """Дневная сводка заказов продавца (по дате создания заказа) для статистики."""
+
+    producer = models.ForeignKey(
+        Producer, on_delete=models.CASCADE, related_name="daily_stats"
+    )
+    date = models.DateField()
+    completed_count = models.PositiveIntegerField(default=0)
+    cancelled_count = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    dishes = models.JSONField(
+        default=dict, blank=True, help_text="{dish_name: {count, revenue}} по завершённым заказам"
+    )
+    toppings = models.JSONField(
+        default=dict, blank=True, help_text="{topping_name: count} по завершённым заказам"
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = [["producer", "date"]]
+
+    def __str__(self):
+        return f"{self.producer} {self.date}"
+
+
+class ProducerCustomerStats(models.Model):
+    """Сводка завершённых заказов покупателя в магазине для аналитики повторных покупок."""
+
+    producer = models.ForeignKey(
+        Producer, on_delete=models.CASCADE, related_name="customer_stats"
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="producer_stats"
+    )
+    order_count = models.PositiveIntegerField(default=0)
+    total_spent = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    last_order_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = [["producer", "user"]]
+        indexes = [models.Index(fields=["producer", "order_count"])]
+
+    def __str__(self):
+        return f"{self.producer} / {self.user}"
+
+
+class JobCheckpoint(models.Model):
+    """Контрольная точка периодической задачи: момент начала её последнего прохода."""
+
+    name = models.CharField(max_length=100, unique=True)
+    value = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.value:%Y-%m-%d %H:%M}"
+
+
 # Add the Chat model with is_archived field
 # Note: We won't add the Chat model here since it causes migration issues.
 # Instead, we'll add is_archived to the existing ChatMessage model later
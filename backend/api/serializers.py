@@ -178,27 +178,9 @@ class CategorySerializer(serializers.ModelSerializer):
         fields = ["id", "name", "parent", "subcategories"]
 
     def get_subcategories(self, obj):
-        import logging
-        logger = logging.getLogger(__name__)
-        
-        # Use prefetched subcategories to avoid N+1 queries
-        # The subcategories should be prefetched in viewset with prefetch_related('subcategories')
-        if hasattr(obj, '_prefetched_objects_cache') and 'subcategories' in obj._prefetched_objects_cache:
-            subcategories = obj._prefetched_objects_cache['subcategories']
-            logger.warning(
-                f"[CategorySerializer] Using prefetched subcategories for category {obj.id} ({obj.name}), "
-                f"count: {len(subcategories)}"
-            )
-            return CategorySerializer(subcategories, many=True).data
-        
-        # Fallback to query if not prefetched
-        if obj.subcategories.exists():
-            logger.warning(
-                f"[CategorySerializer] WARNING: Not prefetched! Querying subcategories for category {obj.id} ({obj.name}), "
-                f"count: {obj.subcategories.count()}"
-            )
-            return CategorySerializer(obj.subcategories.all(), many=True).data
-        return []
+        from api.services.category_tree_service import CategoryTreeService
+
+        return CategoryTreeService.get_tree().serialize_children(obj.id)
 
 
 class DishImageSerializer(serializers.ModelSerializer):
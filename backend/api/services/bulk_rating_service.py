@@ -0,0 +1,228 @@
+"""
+Массовый пересчёт рейтингов магазинов и блюд.
+
+Формула та же, что в RatingService (веса по возрасту отзыва, байесовское
+сглаживание, SLA, споры, штрафы), но агрегаты для всех объектов
+считаются несколькими запросами с GROUP BY, а результат пишется через
+bulk_update - только для изменившихся строк. Используется ночной
+задачей update_producer_ratings и командой recalc_ratings.
+"""
+
+from datetime import timedelta
+from typing import Dict, Iterable, Optional, Tuple
+
+from django.db import transaction
+from django.db.models import Case, Count, F, FloatField, Q, Sum, Value, When
+from django.db.models.functions import Cast, Least
+
+from api.models import Dish, Dispute, Order, Producer, Review
+from api.services.rating_service import RatingService
+from core.logging import get_logger
+
+logger = get_logger(__name__)
+
+
+class BulkRatingService(RatingService):
+    """Пересчёт рейтингов пачкой: фиксированное число запросов на любое число объектов."""
+
+    UPDATE_BATCH_SIZE = 500
+    # Изменения меньше этого порога не записываются
+    EPSILON = 1e-9
+
+    # ------------------------------------------------------------------
+    # SQL-выражения формулы
+    # ------------------------------------------------------------------
+
+    def _weight_expression(self, now):
+        # (now - created_at).days <= N  <=>  created_at > now - (N + 1) дней
+        return Case(
+            *[
+                When(created_at__gt=now - timedelta(days=max_age_days + 1), then=Value(weight))
+                for max_age_days, weight in self.REVIEW_AGE_WEIGHTS
+            ],
+            default=Value(self.OLD_REVIEW_WEIGHT),
+            output_field=FloatField(),
+        )
+
+    @staticmethod
+    def _weighted(weights: Iterable[Tuple[float, str]], total_weight: float):
+        expression = None
+        for weight, field in weights:
+            term = Value(weight) * Cast(field, FloatField())
+            expression = term if expression is None else expression + term
+        return expression / Value(total_weight)
+
+    def _producer_score_expression(self):
+        total_weight = (
+            self.config.weight_taste
+            + self.config.weight_appearance
+            + self.config.weight_service
+        ) or 1
+        score = self._weighted(
+            [
+                (self.config.weight_taste, "rating_taste"),
+                (self.config.weight_appearance, "rating_appearance"),
+                (self.config.weight_service, "rating_service"),
+            ],
+            total_weight,
+        )
+        return Case(
+            When(refund_accepted=True, then=Least(score, Value(3.0))),
+            default=score,
+            output_field=FloatField(),
+        )
+
+    def _dish_score_expression(self):
+        total_weight = self.config.dish_weight_taste + self.config.dish_weight_appearance
+        if total_weight <= 0:
+            return Value(0.0, output_field=FloatField())
+        return self._weighted(
+            [
+                (self.config.dish_weight_taste, "rating_taste"),
+                (self.config.dish_weight_appearance, "rating_appearance"),
+            ],
+            total_weight,
+        )
+
+    # ------------------------------------------------------------------
+    # Агрегаты
+    # ------------------------------------------------------------------
+
+    def _review_aggregates(self, group_by: str, score, now, ids=None) -> Dict:
+        """{id: (взвешенный рейтинг, число отзывов)} по отзывам, сгруппированным по group_by."""
+        reviews = Review.objects.all()
+        if ids is not None:
+            reviews = reviews.filter(**{f"{group_by}__in": ids})
+        rows = (
+            reviews.annotate(review_weight=self._weight_expression(now), review_score=score)
+            .values(group_by)
+            .annotate(
+                reviews_count=Count("id"),
+                weighted_sum=Sum(F("review_score") * F("review_weight")),
+                weight_total=Sum("review_weight"),
+            )
+            .order_by()
+        )
+        result = {}
+        for row in rows:
+            weight_total = row["weight_total"] or 0.0
+            raw = row["weighted_sum"] / weight_total if weight_total else 0.0
+            result[row[group_by]] = (raw, row["reviews_count"])
+        return result
+
+    def _order_counts(self, window_start, ids=None) -> Dict:
+        orders = Order.objects.filter(
+            created_at__gte=window_start, status__in=["COMPLETED", "CANCELLED"]
+        )
+        if ids is not None:
+            orders = orders.filter(producer_id__in=ids)
+        rows = (
+            orders.values("producer_id")
+            .annotate(
+                total=Count("id"),
+                sla_cancelled=Count("id", filter=Q(status="CANCELLED", cancelled_by="SYSTEM")),
+            )
+            .order_by()
+        )
+        return {row["producer_id"]: (row["total"], row["sla_cancelled"]) for row in rows}
+
+    def _dispute_counts(self, window_start, ids=None) -> Dict:
+        disputes = Dispute.objects.filter(created_at__gte=window_start)
+        if ids is not None:
+            disputes = disputes.filter(order__producer_id__in=ids)
+        rows = (
+            disputes.values("order__producer_id")
+            .annotate(total=Count("id"), lost=Count("id", filter=Q(status="RESOLVED_BUYER_WON")))
+            .order_by()
+        )
+        return {row["order__producer_id"]: (row["total"], row["lost"]) for row in rows}
+
+    # ------------------------------------------------------------------
+    # Пересчёт
+    # ------------------------------------------------------------------
+
+    def _changed(self, current, new) -> bool:
+        return abs(float(current or 0) - float(new)) > self.EPSILON
+
+    @transaction.atomic
+    def recalc_producers(self, producer_ids: Optional[Iterable] = None) -> int:
+        """Пересчитать рейтинги магазинов (всех или producer_ids); возвращает число обновлённых."""
+        ids = list(producer_ids) if producer_ids is not None else None
+        now = self._now()
+        window_start = now - timedelta(days=self.config.rating_window_days)
+        reviews = self._review_aggregates("producer_id", self._producer_score_expression(), now, ids)
+        orders = self._order_counts(window_start, ids)
+        disputes = self._dispute_counts(window_start, ids)
+
+        producers = Producer.objects.only("id", "rating", "rating_count", "penalty_points")
+        if ids is not None:
+            producers = producers.filter(id__in=ids)
+
+        changed = []
+        for producer in producers.iterator(chunk_size=self.UPDATE_BATCH_SIZE):
+            raw_rating, count = reviews.get(producer.id, (0.0, 0))
+            if count == 0:
+                rating = 0.0
+            else:
+                orders_total, sla_cancelled = orders.get(producer.id, (0, 0))
+                disputes_total, lost = disputes.get(producer.id, (0, 0))
+                combined = self._combine_producer_rating(
+                    self._apply_bayesian_smoothing(raw_rating, count),
+                    self._sla_score_from_counts(orders_total, sla_cancelled),
+                    self._dispute_score_from_counts(orders_total, disputes_total, lost),
+                )
+                rating = self._apply_penalties(combined, producer)
+            if producer.rating_count != count or self._changed(producer.rating, rating):
+                producer.rating = rating
+                producer.rating_count = count
+                changed.append(producer)
+
+        Producer.objects.bulk_update(
+            changed, ["rating", "rating_count"], batch_size=self.UPDATE_BATCH_SIZE
+        )
+        return len(changed)
+
+    @transaction.atomic
+    def recalc_dishes(self, dish_ids: Optional[Iterable] = None) -> int:
+        """Пересчитать рейтинги блюд (всех или dish_ids) по текущим рейтингам магазинов."""
+        ids = list(dish_ids) if dish_ids is not None else None
+        reviews = self._review_aggregates(
+            "order__dish_id", self._dish_score_expression(), self._now(), ids
+        )
+
+        dishes = Dish.objects.select_related("producer").only(
+            "id", "rating", "rating_count", "sort_score", "producer__rating"
+        )
+        if ids is not None:
+            dishes = dishes.filter(id__in=ids)
+
+        changed = []
+        for dish in dishes.iterator(chunk_size=self.UPDATE_BATCH_SIZE):
+            raw_rating, count = reviews.get(dish.id, (0.0, 0))
+            producer_rating = float(dish.producer.rating or 0)
+            if count == 0:
+                rating, sort_score = 0.0, producer_rating
+            else:
+                rating = self._apply_bayesian_smoothing(raw_rating, count)
+                sort_score = 0.7 * rating + 0.3 * producer_rating
+            if (
+                dish.rating_count != count
+                or self._changed(dish.rating, rating)
+                or self._changed(dish.sort_score, sort_score)
+            ):
+                dish.rating = rating
+                dish.rating_count = count
+                dish.sort_score = sort_score
+                changed.append(dish)
+
+        Dish.objects.bulk_update(
+            changed, ["rating", "rating_count", "sort_score"], batch_size=self.UPDATE_BATCH_SIZE
+        )
+        return len(changed)
+
+    def recalc_all(self) -> Tuple[int, int]:
+        """Пересчитать все магазины, затем все блюда; возвращает (магазинов, блюд) обновлено."""
+        producers = self.recalc_producers()
+        dishes = self.recalc_dishes()
+        logger.info("ratings_recalculated", producers=producers, dishes=dishes)
+        return producers, dishes
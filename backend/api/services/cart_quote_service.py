@@ -0,0 +1,154 @@
+"""
+Расчёт стоимости всей корзины.
+
+Позиции корзины группируются по магазину: доставка считается один раз
+на магазин, время готовности магазина - максимум по его позициям.
+Блюда и магазины загружаются одним запросом, промокод - одним запросом
+на все магазины корзины, настройки доставки берутся из
+DeliveryQuoteEngine.
+"""
+
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from django.utils import timezone
+
+from api.models import Cart, CartItem, Producer, PromoCode
+from api.services.delivery_quote_service import (
+    DeliveryQuote,
+    DeliveryQuoteEngine,
+    QuoteRequest,
+)
+
+
+@dataclass
+class CartItemQuote:
+    item: CartItem
+    quote: DeliveryQuote
+
+    def as_dict(self, delivery_price: float = 0.0, total_price: Optional[float] = None) -> dict:
+        return {
+            "id": str(self.item.id),
+            "dish": str(self.item.dish_id),
+            "dish_name": self.item.dish.name,
+            "quantity": self.item.quantity,
+            "price": float(self.item.dish.price),
+            "items_price": self.quote.items_price,
+            "delivery_price": delivery_price,
+            "total_price": (
+                self.quote.items_price + delivery_price if total_price is None else total_price
+            ),
+            "estimated_cooking_time": self.quote.cooking_time_minutes,
+        }
+
+
+@dataclass
+class ProducerQuote:
+    producer: Producer
+    items: List[CartItemQuote] = field(default_factory=list)
+    promo: Optional[PromoCode] = None
+
+    @property
+    def summary(self) -> DeliveryQuote:
+        """Сводный расчёт магазина: одна доставка на все его позиции."""
+        first = self.items[0].quote
+        return DeliveryQuote(
+            delivery_price=first.delivery_price,
+            surcharge=first.surcharge,
+            items_price=sum(item.quote.items_price for item in self.items),
+            cooking_time_minutes=max(item.quote.cooking_time_minutes for item in self.items),
+            zone=first.zone,
+        )
+
+    def item_prices(self) -> List[Tuple[float, float, float]]:
+        """
+        (доставка, скидка, итог) по позициям так, как они станут заказами:
+        доставка магазина - на первую позицию, скидка списывается по порядку.
+        """
+        _, remaining_discount = self.summary.apply_promo(self.promo)
+        prices = []
+        for index, item in enumerate(self.items):
+            delivery_price = item.quote.delivery_price if index == 0 else 0.0
+            price = item.quote.items_price + delivery_price
+            discount = min(remaining_discount, price)
+            remaining_discount -= discount
+            prices.append((delivery_price, discount, price - discount))
+        return prices
+
+    def as_dict(self) -> dict:
+        summary = self.summary
+        total_price, discount_amount = summary.apply_promo(self.promo)
+        return {
+            "producer": str(self.producer.id),
+            "producer_name": self.producer.name,
+            "items": [
+                item.as_dict(delivery_price=delivery_price, total_price=item_total)
+                for item, (delivery_price, _, item_total) in zip(
+                    self.items, self.item_prices(), strict=True
+                )
+            ],
+            "items_price": summary.items_price,
+            "delivery_price": summary.delivery_price,
+            "discount_amount": discount_amount,
+            "promo_code": self.promo.code if self.promo else None,
+            "total_price": total_price,
+            "estimated_cooking_time": summary.cooking_time_minutes,
+        }
+
+
+class CartQuoteService:
+    """Расчёт корзины по магазинам за фиксированное число запросов."""
+
+    def __init__(self, engine: Optional[DeliveryQuoteEngine] = None):
+        self.engine = engine or DeliveryQuoteEngine()
+
+    def quote_items(
+        self,
+        items: List[CartItem],
+        latitude=None,
+        longitude=None,
+        delivery_type: str = "BUILDING",
+        promo_code_text: Optional[str] = None,
+        when: Optional[datetime] = None,
+    ) -> List[ProducerQuote]:
+        """
+        Рассчитать позиции (с загруженными dish и dish.producer).
+
+        Промокод применяется к магазину, которому он принадлежит.
+        """
+        when = when or timezone.now()
+        quotes = self.engine.quote_many(
+            QuoteRequest(item.dish, item.quantity, latitude, longitude, when, delivery_type)
+            for item in items
+        )
+
+        groups: Dict[str, ProducerQuote] = {}
+        for item, quote in zip(items, quotes, strict=True):
+            producer = item.dish.producer
+            group = groups.setdefault(str(producer.pk), ProducerQuote(producer))
+            group.items.append(CartItemQuote(item, quote))
+
+        if promo_code_text and groups:
+            promo = PromoCode.objects.filter(
+                code=promo_code_text, is_used=False, producer_id__in=list(groups)
+            ).first()
+            if promo is not None:
+                groups[str(promo.producer_id)].promo = promo
+        return list(groups.values())
+
+    def quote_cart(self, cart: Cart, **options) -> dict:
+        """Ответ эндпоинта расчёта корзины: магазины и общий итог."""
+        items = list(
+            cart.items.select_related("dish", "dish__producer").order_by("dish__producer_id", "id")
+        )
+        producers = [group.as_dict() for group in self.quote_items(items, **options)]
+        return {
+            "producers": producers,
+            "delivery_price": sum(group["delivery_price"] for group in producers),
+            "discount_amount": sum(group["discount_amount"] for group in producers),
+            "total_price": sum(group["total_price"] for group in producers),
+            "estimated_cooking_time": max(
+                (group["estimated_cooking_time"] for group in producers), default=0
+            ),
+        }
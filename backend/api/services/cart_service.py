@@ -11,6 +11,7 @@ from django.db.models import F, Max, Sum
 
 from ..models import Cart, CartItem, Dish
 from ..models_new import SavedCartItem
+from .counter_service import counter_service
 
 logger = logging.getLogger(__name__)
 
@@ -120,8 +121,7 @@ class CartService:
 
         # Увеличить счетчик
         if created:
-            dish.in_cart_count = F('in_cart_count') + 1
-            dish.save(update_fields=["in_cart_count"])
+            counter_service.increment(Dish, dish.pk, "in_cart_count")
 
         logger.info(f"Added {quantity}x {dish.name} to cart for user {user.email}")
         return item, created
@@ -149,8 +149,7 @@ class CartService:
         try:
             item = cart.items.get(dish=dish, selected_toppings=selected_toppings)
             item.delete()
-            dish.in_cart_count = max(0, dish.in_cart_count - 1)
-            dish.save(update_fields=["in_cart_count"])
+            counter_service.increment(Dish, dish.pk, "in_cart_count", -1)
             logger.info(f"Removed {dish.name} from cart for user {user.email}")
             return True
         except CartItem.DoesNotExist:
@@ -206,11 +205,10 @@ class CartService:
 
         # Уменьшить счетчики перед очисткой
         items = cart.items.all()
-        count = items.count()
-        for item in items:
-            dish = item.dish
-            dish.in_cart_count = max(0, dish.in_cart_count - 1)
-            dish.save(update_fields=["in_cart_count"])
+        dish_ids = list(items.values_list("dish_id", flat=True))
+        count = len(dish_ids)
+        for dish_id in dish_ids:
+            counter_service.increment(Dish, dish_id, "in_cart_count", -1)
 
         items.delete()
         logger.info(f"Cleared cart for user {user.email}, removed {count} items")
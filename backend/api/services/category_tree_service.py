@@ -0,0 +1,111 @@
+"""
+Сервис дерева категорий с кэшированием в процессе и в Django cache.
+"""
+
+import uuid
+from typing import Dict, FrozenSet, List, Optional
+
+from api.models import Category
+from core.cache import cache_service
+
+
+class CategoryTree:
+    """Неизменяемый снимок дерева категорий: узлы, дети и множества потомков."""
+
+    def __init__(self, rows):
+        # rows: [(id, name, parent_id)] в порядке выборки из БД
+        self.nodes: Dict[str, dict] = {}
+        self.children: Dict[str, List[str]] = {}
+        self.roots: List[str] = []
+        for category_id, name, parent_id in rows:
+            key = str(category_id)
+            parent_key = str(parent_id) if parent_id else None
+            self.nodes[key] = {"id": key, "name": name, "parent": parent_key}
+            self.children.setdefault(key, [])
+        for key, node in self.nodes.items():
+            parent_key = node["parent"]
+            if parent_key in self.nodes:
+                self.children[parent_key].append(key)
+            else:
+                self.roots.append(key)
+        self.descendants: Dict[str, FrozenSet[str]] = {}
+        for key in self.nodes:
+            self._collect_descendants(key)
+
+    def _collect_descendants(self, key: str) -> FrozenSet[str]:
+        if key in self.descendants:
+            return self.descendants[key]
+        # Итеративный обход, чтобы глубокие деревья не упирались в лимит рекурсии
+        result = {key}
+        stack = list(self.children[key])
+        while stack:
+            child = stack.pop()
+            if child in result:
+                continue
+            result.add(child)
+            stack.extend(self.children[child])
+        self.descendants[key] = frozenset(result)
+        return self.descendants[key]
+
+    @staticmethod
+    def _normalize(category_id) -> Optional[str]:
+        try:
+            return str(uuid.UUID(str(category_id)))
+        except (TypeError, ValueError, AttributeError):
+            return None
+
+    def contains(self, category_id) -> bool:
+        return self._normalize(category_id) in self.nodes
+
+    def descendant_ids(self, category_id) -> FrozenSet[str]:
+        """Id категории и всех её потомков любой глубины (пустое множество, если нет такой)."""
+        return self.descendants.get(self._normalize(category_id), frozenset())
+
+    def serialize(self, category_id) -> Optional[dict]:
+        """Узел в формате CategorySerializer с вложенными подкатегориями."""
+        key = self._normalize(category_id)
+        if key not in self.nodes:
+            return None
+        node = self.nodes[key]
+        return {
+            "id": node["id"],
+            "name": node["name"],
+            "parent": node["parent"],
+            "subcategories": self.serialize_children(key),
+        }
+
+    def serialize_children(self, category_id) -> List[dict]:
+        key = self._normalize(category_id)
+        return [self.serialize(child) for child in self.children.get(key, [])]
+
+    def serialize_list(self, only_roots: bool = False) -> List[dict]:
+        keys = self.roots if only_roots else list(self.nodes)
+        return [self.serialize(key) for key in keys]
+
+
+class CategoryTreeService:
+    """
+    Дерево категорий в кэше с тегом "category".
+
+    Снимок читается через cache_service.fetch: префикс "categories" входит
+    в CACHE_L1_PREFIXES, поэтому в установившемся режиме дерево берётся из
+    памяти процесса без обращений к БД и к общему кэшу. Изменение Category
+    сбрасывает тег во всех процессах (сигнал invalidate_cache_tags).
+    """
+
+    TREE_KEY = "categories:tree"
+    TAG = "category"
+    TREE_TIMEOUT = 24 * 3600
+
+    @classmethod
+    def invalidate(cls) -> None:
+        """Инвалидировать дерево во всех процессах."""
+        cache_service.invalidate_tags(cls.TAG)
+
+    @staticmethod
+    def _build() -> CategoryTree:
+        return CategoryTree(Category.objects.values_list("id", "name", "parent_id"))
+
+    @classmethod
+    def get_tree(cls) -> CategoryTree:
+        return cache_service.fetch(cls.TREE_KEY, cls._build, cls.TREE_TIMEOUT, tags=[cls.TAG])
@@ -5,10 +5,18 @@
 import logging
 from typing import Dict, List
 
-from django.db.models import Avg, Q
+from django.db import transaction
+from django.db.models import Avg, F, Q
 
-from ..models import ChatMessage
-from ..models_new import CommunicationRating, MessageTemplate
+from ..models import ChatMessage, ChatThread
+from .push_service import push_to_users
+
+# Шаблоны сообщений и оценки общения ещё не перенесены в api.models;
+# без них модуль должен импортироваться ради переписки и списка чатов
+try:
+    from ..models_new import CommunicationRating, MessageTemplate
+except ImportError:
+    CommunicationRating = MessageTemplate = None
 
 logger = logging.getLogger(__name__)
 
@@ -35,66 +43,96 @@ class ChatService:
 
         return messages
 
+    @staticmethod
+    def _pair(first_id, second_id):
+        """Упорядоченная пара id для ChatThread: (user_low_id, user_high_id)."""
+        return (first_id, second_id) if first_id <= second_id else (second_id, first_id)
+
+    @staticmethod
+    def _thread_lookup(first_id, second_id, order_id) -> Dict:
+        user_low_id, user_high_id = ChatService._pair(first_id, second_id)
+        return {"user_low_id": user_low_id, "user_high_id": user_high_id, "order_id": order_id}
+
+    @staticmethod
+    def _unread_field(thread_user_low_id, reader_id) -> str:
+        return "low_unread_count" if reader_id == thread_user_low_id else "high_unread_count"
+
+    @staticmethod
+    @transaction.atomic
+    def record_message(message: ChatMessage) -> ChatThread:
+        """
+        Учесть новое сообщение в сводке переписки: последнее сообщение и
+        счётчик непрочитанных получателя. Вызывается в транзакции создания
+        сообщения.
+        """
+        lookup = ChatService._thread_lookup(message.sender_id, message.recipient_id, message.order_id)
+        thread, _ = ChatThread.objects.select_for_update().get_or_create(**lookup)
+        if thread.last_message_at is None or message.created_at >= thread.last_message_at:
+            thread.last_message = message
+            thread.last_message_at = message.created_at
+            thread.last_message_text = (message.content or "")[: ChatThread.SNIPPET_LENGTH]
+        unread_field = ChatService._unread_field(thread.user_low_id, message.recipient_id)
+        if not message.is_read:
+            setattr(thread, unread_field, getattr(thread, unread_field) + 1)
+        thread.save()
+
+        push_to_users(
+            [message.sender_id, message.recipient_id],
+            "chat_message",
+            {
+                "id": str(message.id),
+                "sender": str(message.sender_id),
+                "recipient": str(message.recipient_id),
+                "order": str(message.order_id) if message.order_id else None,
+                "content": message.content,
+                "attachment": message.attachment,
+                "message_type": message.message_type,
+                "created_at": message.created_at.isoformat(),
+                "recipient_unread_count": getattr(thread, unread_field),
+            },
+        )
+        return thread
+
+    @staticmethod
+    def get_threads(user) -> List[ChatThread]:
+        """Переписки пользователя, новые сверху (один запрос по индексам ChatThread)."""
+        return list(
+            ChatThread.objects.filter(Q(user_low=user) | Q(user_high=user))
+            .select_related("user_low", "user_high")
+            .order_by(F("last_message_at").desc(nulls_last=True))
+        )
+
     @staticmethod
     def get_conversation_partners(user) -> List[Dict]:
         """
         Получить список пользователей, с которыми была переписка.
 
-        Возвращает список уникальных собеседников с информацией о последних сообщениях.
+        Возвращает список уникальных собеседников с информацией о последних
+        сообщениях. Строится по ChatThread одним запросом: переписки по разным
+        заказам с одним собеседником сводятся в одну запись.
         """
-        from django.contrib.auth import get_user_model
-        from django.db.models import Q
-        
-        User = get_user_model()
-        
-        # Получить всех уникальных собеседников за один запрос
-        partner_ids = set()
-        messages = ChatMessage.objects.filter(
-            Q(sender=user) | Q(recipient=user)
-        ).values_list('sender', 'recipient')
-        
-        for sender_id, recipient_id in messages:
-            if sender_id != user.id:
-                partner_ids.add(sender_id)
-            if recipient_id != user.id:
-                partner_ids.add(recipient_id)
-        
-        # Загрузить всех партнеров за один запрос
-        partners_dict = {
-            str(u.id): u for u in User.objects.filter(id__in=partner_ids)
-        }
-        
-        # Получить статистику для каждого партнера
-        result = []
-        for partner_id in partner_ids:
-            partner_user = partners_dict.get(str(partner_id))
-            if not partner_user:
-                continue
-            
-            # Получить последнее сообщение и количество непрочитанных
-            last_message = ChatMessage.objects.filter(
-                (Q(sender=user, recipient=partner_user) | Q(sender=partner_user, recipient=user))
-            ).order_by('-created_at').first()
-            
-            unread_count = ChatMessage.objects.filter(
-                sender=partner_user,
-                recipient=user,
-                is_read=False
-            ).count()
-            
-            result.append({
-                'partner_id': str(partner_id),
-                'partner_name': partner_user.username or partner_user.email,
-                'last_message_time': last_message.created_at if last_message else None,
-                'last_message_text': last_message.text if last_message else '',
-                'unread_count': unread_count
-            })
-        
-        # Сортировать по времени последнего сообщения
-        result.sort(key=lambda x: x['last_message_time'] or '', reverse=True)
-        return result
+        result = {}
+        for thread in ChatService.get_threads(user):
+            is_low = thread.user_low_id == user.id
+            partner = thread.user_high if is_low else thread.user_low
+            unread_count = thread.low_unread_count if is_low else thread.high_unread_count
+            entry = result.get(partner.id)
+            if entry is None:
+                # Переписки упорядочены по времени: первая - самая свежая
+                result[partner.id] = {
+                    'partner_id': str(partner.id),
+                    'partner_name': partner.username or partner.email,
+                    'order_id': str(thread.order_id) if thread.order_id else None,
+                    'last_message_time': thread.last_message_at,
+                    'last_message_text': thread.last_message_text,
+                    'unread_count': unread_count,
+                }
+            else:
+                entry['unread_count'] += unread_count
+        return list(result.values())
 
     @staticmethod
+    @transaction.atomic
     def mark_messages_as_read(user, sender_id: str) -> int:
         """
         Отметить сообщения от отправителя как прочитанные.
@@ -107,9 +145,63 @@ class ChatService:
             is_read=False
         ).update(is_read=True)
 
+        user_low_id, user_high_id = ChatService._pair(user.id, int(sender_id))
+        ChatThread.objects.filter(user_low_id=user_low_id, user_high_id=user_high_id).update(
+            **{ChatService._unread_field(user_low_id, user.id): 0}
+        )
+
         logger.info(f"Marked {count} messages as read for user {user.email}")
         return count
 
+    @staticmethod
+    @transaction.atomic
+    def mark_message_as_read(message: ChatMessage) -> bool:
+        """
+        Отметить одно сообщение как прочитанное получателем.
+
+        Возвращает False, если сообщение уже было прочитано.
+        """
+        if not ChatMessage.objects.filter(pk=message.pk, is_read=False).update(is_read=True):
+            return False
+        message.is_read = True
+        lookup = ChatService._thread_lookup(message.sender_id, message.recipient_id, message.order_id)
+        unread_field = ChatService._unread_field(lookup["user_low_id"], message.recipient_id)
+        ChatThread.objects.filter(**lookup, **{f"{unread_field}__gt": 0}).update(
+            **{unread_field: F(unread_field) - 1}
+        )
+        return True
+
+    @staticmethod
+    @transaction.atomic
+    def rebuild_threads() -> int:
+        """
+        Пересчитать ChatThread из ChatMessage (backfill и исправление расхождений).
+
+        Возвращает количество записанных переписок.
+        """
+        threads = {}
+        messages = ChatMessage.objects.order_by('created_at').values_list(
+            'id', 'sender_id', 'recipient_id', 'order_id', 'content', 'is_read', 'created_at'
+        )
+        for message_id, sender_id, recipient_id, order_id, content, is_read, created_at in (
+            messages.iterator()
+        ):
+            lookup = ChatService._thread_lookup(sender_id, recipient_id, order_id)
+            key = tuple(lookup.values())
+            thread = threads.get(key)
+            if thread is None:
+                thread = threads[key] = ChatThread(**lookup)
+            thread.last_message_id = message_id
+            thread.last_message_at = created_at
+            thread.last_message_text = (content or "")[: ChatThread.SNIPPET_LENGTH]
+            if not is_read:
+                unread_field = ChatService._unread_field(thread.user_low_id, recipient_id)
+                setattr(thread, unread_field, getattr(thread, unread_field) + 1)
+
+        ChatThread.objects.all().delete()
+        ChatThread.objects.bulk_create(threads.values(), batch_size=1000)
+        return len(threads)
+
     @staticmethod
     def get_unread_count(user) -> int:
         """
@@ -0,0 +1,296 @@
+"""
+Оформление всей корзины одной транзакцией.
+
+Корзина превращается в заказы (по заказу на позицию, Order остаётся
+однотоварным). Проверки выполняются один раз на магазин: открытость,
+запланированное время и вместимость слота. Признак постоянного
+покупателя определяется одним запросом на все магазины. Заказы
+создаются через bulk_create, на оформление пишется одно OutboxEvent.
+
+Доставка и скидка промокода относятся к магазину: доставка
+начисляется первому заказу магазина, скидка распределяется по заказам
+магазина по порядку.
+"""
+
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from dateutil import parser
+from django.db import transaction
+from django.utils import timezone
+
+from api.models import Cart, Dish, Order, OutboxEvent, PromoCode
+from api.services.cart_quote_service import CartQuoteService, ProducerQuote
+from api.services.counter_service import counter_service
+from api.services.delivery_quote_service import DeliveryQuoteEngine
+from api.services.scheduling_service import SchedulingService
+from api.services.slot_occupancy_service import SlotOccupancyService
+from core.cache import CommonCacheKeys, model_cache_service
+from core.logging import get_logger
+
+logger = get_logger(__name__)
+
+
+class CheckoutError(Exception):
+    """Корзину нельзя оформить; detail отдаётся клиенту как есть."""
+
+    def __init__(self, detail):
+        super().__init__(detail)
+        self.detail = detail
+
+
+@dataclass
+class CheckoutResult:
+    checkout_id: uuid.UUID
+    orders: List[Order]
+
+    @property
+    def total_price(self) -> float:
+        return sum(float(order.total_price) for order in self.orders)
+
+
+class CartCheckoutService:
+    """Оформление корзины пользователя в заказы."""
+
+    ADDRESS_FIELDS = [
+        "delivery_address_text",
+        "delivery_comment",
+        "apartment",
+        "entrance",
+        "floor",
+        "intercom",
+    ]
+
+    def __init__(self):
+        self.scheduling = SchedulingService()
+        self.slots = SlotOccupancyService()
+
+    # ------------------------------------------------------------------
+    # Проверки
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _parse_scheduled_time(value) -> Optional[datetime]:
+        if not value:
+            return None
+        try:
+            scheduled_time = parser.isoparse(value)
+        except (ValueError, TypeError):
+            raise CheckoutError({"scheduled_delivery_time": "Invalid datetime format"}) from None
+        if timezone.is_naive(scheduled_time):
+            scheduled_time = timezone.make_aware(scheduled_time)
+        return scheduled_time
+
+    def _check_store_open(self, group: ProducerQuote, check_time: datetime, now: datetime) -> None:
+        producer = group.producer
+        is_open, closure_reason = self.scheduling.is_store_open_now(producer, check_time)
+        if is_open:
+            return
+        next_open = self.scheduling.get_next_open_datetime(producer, now)
+        messages = {
+            "MANUAL": "Магазин временно закрыт продавцом.",
+            "SCHEDULE": "Магазин сейчас закрыт по расписанию.",
+            "ARCHIVED": "Магазин недоступен.",
+        }
+        error_msg = messages.get(closure_reason, "Магазин закрыт.")
+        if next_open:
+            error_msg += f" Следующее открытие: {next_open.strftime('%d.%m в %H:%M')}"
+        raise CheckoutError(
+            {
+                "detail": error_msg,
+                "producer": str(producer.pk),
+                "closure_reason": closure_reason,
+                "next_open_at": next_open.isoformat() if next_open else None,
+            }
+        )
+
+    def _check_scheduled_time(self, group: ProducerQuote, scheduled_time: datetime) -> None:
+        # Время подготовки определяет самая долгая позиция магазина
+        slowest = max(
+            group.items,
+            key=lambda item: DeliveryQuoteEngine.cooking_time(item.item.dish, item.item.quantity, None),
+        )
+        is_valid, error_msg = self.scheduling.validate_scheduled_time(
+            producer=group.producer,
+            dish=slowest.item.dish,
+            quantity=slowest.item.quantity,
+            scheduled_time=scheduled_time,
+            delivery_time_minutes=slowest.quote.zone_time_minutes,
+        )
+        if is_valid and group.producer.max_orders_per_slot > 0:
+            free = group.producer.max_orders_per_slot - self.slots.get_count(
+                group.producer, scheduled_time
+            )
+            if free < len(group.items):
+                is_valid = False
+                error_msg = "Выбранное время уже заполнено. Пожалуйста, выберите другое время"
+        if not is_valid:
+            raise CheckoutError(
+                {"scheduled_delivery_time": error_msg, "producer": str(group.producer.pk)}
+            )
+
+    @staticmethod
+    def _check_quantities(group: ProducerQuote) -> None:
+        for item_quote in group.items:
+            dish = item_quote.item.dish
+            if dish.max_quantity_per_order and item_quote.item.quantity > int(dish.max_quantity_per_order):
+                raise CheckoutError(
+                    {"detail": f"Максимум {dish.max_quantity_per_order} шт. на заказ", "dish": str(dish.pk)}
+                )
+
+    # ------------------------------------------------------------------
+    # Оформление
+    # ------------------------------------------------------------------
+
+    def _build_orders(
+        self,
+        user,
+        group: ProducerQuote,
+        commission_rate: float,
+        data: dict,
+        scheduled_time: Optional[datetime],
+        deadline: datetime,
+    ) -> List[Order]:
+        profile = getattr(user, "profile", None)
+        orders = []
+        for item_quote, (delivery_price, discount, total_price) in zip(
+            group.items, group.item_prices(), strict=True
+        ):
+            item, quote = item_quote.item, item_quote.quote
+            orders.append(
+                Order(
+                    user=user,
+                    user_name=data.get("user_name") or user.get_full_name() or user.username,
+                    phone=data.get("phone") or getattr(profile, "phone", "") or "",
+                    dish=item.dish,
+                    producer=group.producer,
+                    quantity=item.quantity,
+                    selected_toppings=item.selected_toppings,
+                    status="WAITING_FOR_PAYMENT",
+                    is_urgent=bool(data.get("is_urgent", False)),
+                    delivery_type=data.get("delivery_type", "BUILDING"),
+                    delivery_latitude=data.get("delivery_latitude") or None,
+                    delivery_longitude=data.get("delivery_longitude") or None,
+                    delivery_price=delivery_price,
+                    total_price=total_price,
+                    discount_amount=discount,
+                    applied_promo_code=group.promo if discount else None,
+                    estimated_cooking_time=quote.cooking_time_minutes,
+                    commission_rate_snapshot=commission_rate,
+                    commission_amount=(total_price - delivery_price) * commission_rate,
+                    acceptance_deadline=deadline,
+                    scheduled_delivery_time=scheduled_time,
+                    **{field: data.get(field) or "" for field in self.ADDRESS_FIELDS},
+                )
+            )
+        return orders
+
+    def checkout(self, user, data: dict) -> CheckoutResult:
+        """
+        Оформить корзину пользователя.
+
+        data - поля запроса: адрес и координаты доставки, delivery_type,
+        promo_code_text, scheduled_delivery_time, is_urgent, phone, user_name.
+        Бросает CheckoutError, если корзину нельзя оформить.
+        """
+        now = timezone.now()
+        cart = Cart.objects.filter(user=user).first()
+        items = (
+            list(cart.items.select_related("dish", "dish__producer").order_by("dish__producer_id", "id"))
+            if cart
+            else []
+        )
+        if not items:
+            raise CheckoutError({"detail": "Корзина пуста"})
+
+        groups = CartQuoteService().quote_items(
+            items,
+            latitude=data.get("delivery_latitude"),
+            longitude=data.get("delivery_longitude"),
+            delivery_type=data.get("delivery_type", "BUILDING"),
+            promo_code_text=data.get("promo_code_text"),
+            when=now,
+        )
+
+        scheduled_time = self._parse_scheduled_time(data.get("scheduled_delivery_time"))
+        for group in groups:
+            self._check_quantities(group)
+            self._check_store_open(group, scheduled_time or now, now)
+            if scheduled_time:
+                self._check_scheduled_time(group, scheduled_time)
+
+        repeat_producers = set(
+            Order.objects.filter(
+                user=user,
+                dish__producer_id__in=[group.producer.pk for group in groups],
+                status="COMPLETED",
+            )
+            .values_list("dish__producer_id", flat=True)
+            .distinct()
+        )
+
+        if scheduled_time:
+            deadline = max(scheduled_time - timedelta(hours=2), now + timedelta(hours=1))
+        else:
+            deadline = now + timedelta(minutes=30 if data.get("is_urgent") else 60)
+
+        checkout_id = uuid.uuid4()
+        with transaction.atomic():
+            promos = [group.promo for group in groups if group.promo is not None]
+            if promos and PromoCode.objects.filter(
+                pk__in=[promo.pk for promo in promos], is_used=False
+            ).update(is_used=True) != len(promos):
+                raise CheckoutError({"promo_code_text": "Промокод уже использован"})
+
+            if scheduled_time:
+                for group in groups:
+                    if not self.slots.reserve(
+                        group.producer,
+                        scheduled_time,
+                        group.producer.max_orders_per_slot,
+                        count=len(group.items),
+                    ):
+                        raise CheckoutError(
+                            {
+                                "scheduled_delivery_time": "Выбранное время уже заполнено. Пожалуйста, выберите другое время",
+                                "producer": str(group.producer.pk),
+                            }
+                        )
+
+            orders = []
+            for group in groups:
+                commission_rate = float(group.producer.total_commission_rate)
+                if group.producer.pk in repeat_producers:
+                    commission_rate = max(0.0, commission_rate - 0.01)
+                orders.extend(
+                    self._build_orders(user, group, commission_rate, data, scheduled_time, deadline)
+                )
+            Order.objects.bulk_create(orders, batch_size=500)
+            # bulk_create не отправляет post_save: теги списков заказов
+            # сбрасываются здесь так же, как в api.signals.invalidate_cache_tags
+            tags = {model_cache_service.model_tag(Order)}
+            for order in orders:
+                tags.update(CommonCacheKeys.order_tags(order))
+            model_cache_service.invalidate_tags(*tags)
+            transaction.on_commit(lambda: model_cache_service.invalidate_tags(*tags))
+
+            OutboxEvent.objects.create(
+                aggregate_type="checkout",
+                aggregate_id=checkout_id,
+                event_type="CHECKOUT_COMPLETED",
+                payload={
+                    "user_id": user.pk,
+                    "order_ids": [str(order.pk) for order in orders],
+                    "producer_ids": [str(group.producer.pk) for group in groups],
+                    "total_price": sum(float(order.total_price) for order in orders),
+                    "scheduled_delivery_time": scheduled_time.isoformat() if scheduled_time else None,
+                },
+            )
+            cart.items.all().delete()
+
+        for item in items:
+            counter_service.increment(Dish, item.dish_id, "in_cart_count", -1)
+        logger.info("cart_checkout_completed", checkout_id=str(checkout_id), orders=len(orders))
+        return CheckoutResult(checkout_id=checkout_id, orders=orders)
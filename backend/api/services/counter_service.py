@@ -0,0 +1,161 @@
+"""
+Отложенная запись счётчиков популярности (views_count, in_cart_count и т.п.).
+
+Инкременты накапливаются в Django cache и периодически переносятся в БД
+командой flush_counters одним UPDATE с F() на модель, поэтому горячие
+пути (просмотр блюда, корзина) не пишут в строку Dish.
+
+Счётчики живут в поколениях: сброс переключает поколение, после чего
+читает и удаляет ключи прежнего. Инкременты, пришедшие в момент
+переключения, а также накопленное при потере кэша теряются - для
+счётчиков популярности это допустимо.
+
+Буфер работает только на общем кэше (Redis): flush_counters выполняется
+отдельным процессом. С кэшем в памяти процесса (LocMemCache) инкременты
+пишутся в БД сразу.
+"""
+
+from collections import defaultdict
+from typing import Dict, Iterable, Optional, Tuple
+
+from django.apps import apps
+from django.core.cache import cache
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Greatest
+
+from core.cache import is_shared_cache
+from core.logging import get_logger
+
+logger = get_logger(__name__)
+
+
+class CounterService:
+    """Буфер инкрементов счётчиков моделей в Django cache."""
+
+    GENERATION_KEY = "counters:generation"
+    SEQUENCE_KEY = "counters:{generation}:seq"
+    DIRTY_KEY = "counters:{generation}:dirty:{index}"
+    VALUE_KEY = "counters:{generation}:{label}:{field}:{pk}"
+    # Ключи поколения живут дольше любого разумного интервала сброса
+    TIMEOUT = 24 * 3600
+    # Сколько строк обновлять одним UPDATE
+    UPDATE_BATCH_SIZE = 500
+
+    def __init__(self, buffered: Optional[bool] = None):
+        # None - буферизовать, если кэш общий для процессов
+        self.buffered = buffered
+
+    def is_buffered(self) -> bool:
+        return is_shared_cache() if self.buffered is None else self.buffered
+
+    def _generation(self) -> int:
+        generation = cache.get(self.GENERATION_KEY)
+        if generation is None:
+            cache.add(self.GENERATION_KEY, 1, None)
+            generation = cache.get(self.GENERATION_KEY, 1)
+        return generation
+
+    @staticmethod
+    def _incr(key: str, delta: int, timeout: int) -> int:
+        try:
+            return cache.incr(key, delta)
+        except ValueError:
+            # Ключ ещё не создан или истёк; add безопасен при гонке с другим процессом
+            cache.add(key, 0, timeout)
+            return cache.incr(key, delta)
+
+    def increment(self, model, pk, field: str, delta: int = 1) -> None:
+        """Добавить delta к счётчику field объекта pk модели model."""
+        if not delta:
+            return
+        if not self.is_buffered():
+            # Greatest не даёт уйти в минус PositiveIntegerField-счётчикам
+            model.objects.filter(pk=pk).update(**{field: Greatest(F(field) + delta, Value(0))})
+            return
+        generation = self._generation()
+        key = self.VALUE_KEY.format(
+            generation=generation, label=model._meta.label_lower, field=field, pk=pk
+        )
+        if cache.add(key, delta, self.TIMEOUT):
+            # Первый инкремент в поколении: регистрируем ключ для сброса
+            index = self._incr(
+                self.SEQUENCE_KEY.format(generation=generation), 1, self.TIMEOUT
+            )
+            cache.set(
+                self.DIRTY_KEY.format(generation=generation, index=index),
+                (model._meta.label_lower, field, str(pk)),
+                self.TIMEOUT,
+            )
+        else:
+            self._incr(key, delta, self.TIMEOUT)
+
+    def _collect(self, generation: int) -> Dict[Tuple[str, str], Dict[str, int]]:
+        """{(label, field): {pk: delta}} для поколения; ключи поколения удаляются."""
+        sequence_key = self.SEQUENCE_KEY.format(generation=generation)
+        count = cache.get(sequence_key) or 0
+        dirty_keys = [
+            self.DIRTY_KEY.format(generation=generation, index=index)
+            for index in range(1, count + 1)
+        ]
+        entries = list(cache.get_many(dirty_keys).values())
+        value_keys = [
+            self.VALUE_KEY.format(generation=generation, label=label, field=field, pk=pk)
+            for label, field, pk in entries
+        ]
+        values = cache.get_many(value_keys)
+
+        deltas: Dict[Tuple[str, str], Dict[str, int]] = defaultdict(dict)
+        for (label, field, pk), key in zip(entries, value_keys, strict=True):
+            delta = values.get(key)
+            if delta:
+                deltas[(label, field)][pk] = delta
+
+        cache.delete_many([sequence_key, *dirty_keys, *value_keys])
+        return deltas
+
+    @staticmethod
+    def _chunks(items: list, size: int) -> Iterable[list]:
+        for start in range(0, len(items), size):
+            yield items[start : start + size]
+
+    def flush(self) -> int:
+        """Перенести накопленные инкременты в БД; возвращает число обновлённых строк."""
+        previous = self._generation()
+        try:
+            cache.incr(self.GENERATION_KEY)
+        except ValueError:
+            cache.set(self.GENERATION_KEY, previous + 1, None)
+
+        by_model: Dict[str, Dict[str, Dict[str, int]]] = defaultdict(dict)
+        for (label, field), pk_deltas in self._collect(previous).items():
+            by_model[label][field] = pk_deltas
+
+        updated = 0
+        for label, fields in by_model.items():
+            model = apps.get_model(label)
+            pks = sorted({pk for pk_deltas in fields.values() for pk in pk_deltas})
+            for chunk in self._chunks(pks, self.UPDATE_BATCH_SIZE):
+                chunk_set = set(chunk)
+                updates = {}
+                for field, pk_deltas in fields.items():
+                    whens = [
+                        When(pk=pk, then=Value(delta))
+                        for pk, delta in pk_deltas.items()
+                        if pk in chunk_set
+                    ]
+                    if not whens:
+                        continue
+                    # Greatest не даёт уйти в минус PositiveIntegerField-счётчикам
+                    updates[field] = Greatest(
+                        F(field)
+                        + Case(*whens, default=Value(0), output_field=IntegerField()),
+                        Value(0),
+                    )
+                updated += model.objects.filter(pk__in=chunk).update(**updates)
+
+        if updated:
+            logger.info("counters_flushed", rows=updated)
+        return updated
+
+
+counter_service = CounterService()
@@ -0,0 +1,308 @@
+"""
+Расчёт стоимости доставки и времени приготовления заказа.
+
+Зоны доставки, наценки по времени и базовые цены магазина компилируются
+один раз в неизменяемую структуру (CompiledDeliveryPricing) и хранятся
+в памяти процесса под версией магазина из Django cache. Версия
+увеличивается сигналом при сохранении Producer, поэтому расчёт не
+разбирает JSON, не сортирует зоны и не сравнивает строки времени на
+каждом запросе.
+"""
+
+import bisect
+import math
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from api.models import Dish, Producer
+from core.cache import CacheService, LocalLRUCache
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    r = 6371.0
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = math.radians(lat2 - lat1)
+    dlambda = math.radians(lon2 - lon1)
+    a = (
+        math.sin(dphi / 2) ** 2
+        + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    )
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    return r * c
+
+
+def _to_float(value) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _hhmm_to_minutes(value) -> Optional[int]:
+    try:
+        hours, minutes = str(value).split(":")
+        hours, minutes = int(hours), int(minutes)
+    except (TypeError, ValueError):
+        return None
+    if 0 <= hours <= 23 and 0 <= minutes <= 59:
+        return hours * 60 + minutes
+    return None
+
+
+@dataclass(frozen=True)
+class CompiledZone:
+    radius_km: float
+    price_to_building: Optional[float]
+    price_to_door: Optional[float]
+    time_minutes: int
+
+    def price(self, delivery_type: str, default: float) -> float:
+        price = self.price_to_building if delivery_type == "BUILDING" else self.price_to_door
+        return default if price is None else price
+
+
+@dataclass(frozen=True)
+class CompiledDeliveryPricing:
+    """Неизменяемый снимок настроек доставки магазина."""
+
+    origin: Optional[Tuple[float, float]]
+    price_to_building: float
+    price_to_door: float
+    # Зоны по возрастанию радиуса и их радиусы для бинарного поиска
+    zones: Tuple[CompiledZone, ...]
+    zone_radii: Tuple[float, ...]
+    # (начало, конец, наценка) в минутах от полуночи
+    rules: Tuple[Tuple[int, int, float], ...]
+
+    @classmethod
+    def from_producer(cls, producer: Producer) -> "CompiledDeliveryPricing":
+        origin = None
+        if producer.latitude is not None and producer.longitude is not None:
+            latitude, longitude = _to_float(producer.latitude), _to_float(producer.longitude)
+            if latitude is not None and longitude is not None:
+                origin = (latitude, longitude)
+
+        zones = []
+        for zone in producer.delivery_zones or []:
+            if not isinstance(zone, dict):
+                continue
+            radius = _to_float(zone.get("radius_km") or 0)
+            if radius is None or radius <= 0:
+                continue
+            time_minutes = _to_float(zone.get("time_minutes") or 0)
+            zones.append(
+                CompiledZone(
+                    radius_km=radius,
+                    price_to_building=_to_float(zone.get("price_to_building")),
+                    price_to_door=_to_float(zone.get("price_to_door")),
+                    time_minutes=max(int(time_minutes or 0), 0),
+                )
+            )
+        zones.sort(key=lambda zone: zone.radius_km)
+
+        rules = []
+        for rule in producer.delivery_pricing_rules or []:
+            if not isinstance(rule, dict):
+                continue
+            start = _hhmm_to_minutes(rule.get("start"))
+            end = _hhmm_to_minutes(rule.get("end"))
+            surcharge = _to_float(rule.get("surcharge", 0))
+            if start is None or end is None or surcharge is None:
+                continue
+            rules.append((start, end, surcharge))
+
+        return cls(
+            origin=origin,
+            price_to_building=float(producer.delivery_price_to_building),
+            price_to_door=float(producer.delivery_price_to_door),
+            zones=tuple(zones),
+            zone_radii=tuple(zone.radius_km for zone in zones),
+            rules=tuple(rules),
+        )
+
+    def find_zone(self, latitude, longitude) -> Optional[CompiledZone]:
+        """Ближайшая зона, в радиус которой попадает точка доставки."""
+        if self.origin is None or not self.zones:
+            return None
+        if latitude in (None, "") or longitude in (None, ""):
+            return None
+        latitude, longitude = _to_float(latitude), _to_float(longitude)
+        if latitude is None or longitude is None:
+            return None
+        distance = haversine_km(self.origin[0], self.origin[1], latitude, longitude)
+        index = bisect.bisect_left(self.zone_radii, distance)
+        return self.zones[index] if index < len(self.zones) else None
+
+    def surcharge_at(self, when: datetime) -> float:
+        minute = when.hour * 60 + when.minute
+        return sum(amount for start, end, amount in self.rules if start <= minute <= end)
+
+
+@dataclass(frozen=True)
+class DeliveryQuote:
+    delivery_price: float
+    surcharge: float
+    items_price: float
+    cooking_time_minutes: int
+    zone: Optional[CompiledZone]
+
+    @property
+    def total_price(self) -> float:
+        return self.items_price + self.delivery_price
+
+    @property
+    def zone_time_minutes(self) -> Optional[int]:
+        return self.zone.time_minutes if self.zone is not None else None
+
+    def apply_promo(self, promo) -> Tuple[float, float]:
+        """(итоговая цена, скидка) с учётом промокода; promo может быть None."""
+        total_price = self.total_price
+        if promo is None:
+            return total_price, 0.0
+        if promo.reward_type == "DISCOUNT":
+            discount = _to_float(promo.reward_value)
+            if discount is None:
+                return total_price, 0.0
+            return max(0.0, total_price - discount), discount
+        if promo.reward_type == "FREE_DELIVERY":
+            return total_price - self.delivery_price, self.delivery_price
+        return total_price, 0.0
+
+
+@dataclass(frozen=True)
+class QuoteRequest:
+    dish: Dish
+    quantity: int = 1
+    latitude: object = None
+    longitude: object = None
+    when: Optional[datetime] = None
+    delivery_type: str = "BUILDING"
+
+
+class DeliveryQuoteEngine:
+    """Расчёт доставки по скомпилированным настройкам магазинов."""
+
+    VERSION_KEY = "delivery:pricing:version:{producer_id}"
+    LOCAL_CACHE_SIZE = 2048
+    # Поля Producer, из которых собирается CompiledDeliveryPricing
+    PRICING_FIELDS = frozenset(
+        {
+            "latitude",
+            "longitude",
+            "delivery_zones",
+            "delivery_pricing_rules",
+            "delivery_price_to_building",
+            "delivery_price_to_door",
+        }
+    )
+
+    # producer_id -> (версия, CompiledDeliveryPricing); актуальность проверяется по версии
+    _compiled = LocalLRUCache(
+        "delivery_pricing", max_entries=LOCAL_CACHE_SIZE, default_timeout=24 * 3600
+    )
+
+    @classmethod
+    def _version_key(cls, producer_id) -> str:
+        return cls.VERSION_KEY.format(producer_id=producer_id)
+
+    @classmethod
+    def invalidate(cls, producer_id) -> None:
+        """Сбросить скомпилированные настройки магазина во всех процессах."""
+        key = cls._version_key(producer_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, CacheService._new_generation(), None)
+
+    @classmethod
+    def invalidate_on_commit(cls, producer_id) -> None:
+        cls.invalidate(producer_id)
+        # Повторно после коммита, чтобы не закрепить снимок, собранный до коммита
+        transaction.on_commit(lambda: cls.invalidate(producer_id))
+
+    @classmethod
+    def _versions(cls, producer_ids: Sequence) -> dict:
+        keys = {cls._version_key(producer_id): str(producer_id) for producer_id in producer_ids}
+        found = cache.get_many(list(keys))
+        versions = {}
+        for key, producer_id in keys.items():
+            version = found.get(key)
+            if version is None:
+                # Версия из часов, как у тегов CacheService: после вытеснения
+                # ключа снимок, собранный под прежней версией, не совпадёт с новой
+                cache.add(key, CacheService._new_generation(), None)
+                version = cache.get(key)
+            versions[producer_id] = version
+        return versions
+
+    @classmethod
+    def compile(cls, producer: Producer, version: Optional[int] = None) -> CompiledDeliveryPricing:
+        producer_id = str(producer.pk)
+        if version is None:
+            version = cls._versions([producer_id])[producer_id]
+        found, cached = cls._compiled.get(producer_id)
+        if found and cached[0] == version:
+            return cached[1]
+        compiled = CompiledDeliveryPricing.from_producer(producer)
+        cls._compiled.set(producer_id, (version, compiled))
+        return compiled
+
+    @staticmethod
+    def cooking_time(dish: Dish, quantity: int, zone: Optional[CompiledZone]) -> int:
+        base_time = dish.cooking_time_minutes
+        total_time = base_time + base_time * 0.5 * (quantity - 1) if quantity > 1 else base_time
+        if zone is not None and zone.time_minutes > 0:
+            total_time += zone.time_minutes
+        return int(total_time)
+
+    def _quote(self, pricing: CompiledDeliveryPricing, request: QuoteRequest) -> DeliveryQuote:
+        zone = pricing.find_zone(request.latitude, request.longitude)
+        base_price = (
+            pricing.price_to_building
+            if request.delivery_type == "BUILDING"
+            else pricing.price_to_door
+        )
+        if zone is not None:
+            base_price = zone.price(request.delivery_type, base_price)
+        surcharge = pricing.surcharge_at(request.when or timezone.now())
+        return DeliveryQuote(
+            delivery_price=base_price + surcharge,
+            surcharge=surcharge,
+            items_price=float(request.dish.price) * request.quantity,
+            cooking_time_minutes=self.cooking_time(request.dish, request.quantity, zone),
+            zone=zone,
+        )
+
+    def quote(
+        self,
+        dish: Dish,
+        quantity: int = 1,
+        latitude=None,
+        longitude=None,
+        when: Optional[datetime] = None,
+        delivery_type: str = "BUILDING",
+    ) -> DeliveryQuote:
+        """Стоимость доставки, цена и время приготовления для одной позиции."""
+        request = QuoteRequest(dish, quantity, latitude, longitude, when, delivery_type)
+        return self._quote(self.compile(dish.producer), request)
+
+    def quote_many(self, requests: Iterable[QuoteRequest]) -> List[DeliveryQuote]:
+        """Расчёт для нескольких позиций: одна выборка версий на все магазины."""
+        requests = list(requests)
+        versions = self._versions({str(request.dish.producer_id) for request in requests})
+        compiled = {}
+        quotes = []
+        for request in requests:
+            producer_id = str(request.dish.producer_id)
+            if producer_id not in compiled:
+                compiled[producer_id] = self.compile(
+                    request.dish.producer, versions[producer_id]
+                )
+            quotes.append(self._quote(compiled[producer_id], request))
+        return quotes
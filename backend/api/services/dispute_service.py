@@ -7,6 +7,7 @@ from django.utils import timezone
 from api.models import Dispute, Order, Payment, Producer, Profile
 
 from .order_finance_service import OrderFinanceService
+from .order_summary_service import OrderSummaryService
 from .payment_service import PaymentService
 from .penalties import PenaltyService
 from .rating_service import RatingService
@@ -25,6 +26,7 @@ class DisputeService:
         self.payments = payments or PaymentService()
         self.penalties = penalties or PenaltyService()
         self.rating = RatingService()
+        self.summaries = OrderSummaryService()
 
     @transaction.atomic
     def open_for_order(
@@ -61,8 +63,10 @@ class DisputeService:
         )
 
         if order.status != "DISPUTE":
+            previous_status = order.status
             order.status = "DISPUTE"
             order.save(update_fields=["status"])
+            self.summaries.on_status_change(order, previous_status)
 
         return dispute
 
@@ -158,8 +162,10 @@ class DisputeService:
         if resolution_notes is not None:
             dispute.resolution_notes = resolution_notes
 
+        previous_status = order.status
         order.status = "CANCELLED"
         order.save(update_fields=["status"])
+        self.summaries.on_status_change(order, previous_status)
 
         return order, dispute
 
@@ -186,8 +192,10 @@ class DisputeService:
         if resolution_notes is not None:
             dispute.resolution_notes = resolution_notes
 
+        previous_status = order.status
         order.status = "COMPLETED"
         order.save(update_fields=["status"])
+        self.summaries.on_status_change(order, previous_status)
 
         return order, dispute
 
@@ -216,8 +224,10 @@ class DisputeService:
             dispute.resolution_notes = resolution_notes
 
         if order.status == "DISPUTE":
+            previous_status = order.status
             order.status = "COMPLETED"
             order.save(update_fields=["status"])
+            self.summaries.on_status_change(order, previous_status)
 
         return order, dispute
 
@@ -249,8 +259,10 @@ class DisputeService:
 
         # Обновляем статус заказа
         if order.status != "DISPUTE":
+            previous_status = order.status
             order.status = "DISPUTE"
             order.save(update_fields=["status"])
+            self.summaries.on_status_change(order, previous_status)
 
         # Отправляем уведомление магазину
         self._notify_producer_about_complaint(dispute)
@@ -286,11 +298,13 @@ class DisputeService:
         dispute.save(update_fields=["status", "resolution_notes", "resolved_at", "compensation_amount"])
 
         # Обновляем статус заказа
+        previous_status = order.status
         order.status = "CANCELLED"
         order.cancelled_at = timezone.now()
         order.cancelled_by = "SELLER"
         order.cancelled_reason = "Претензия принята"
         order.save(update_fields=["status", "cancelled_at", "cancelled_by", "cancelled_reason"])
+        self.summaries.on_status_change(order, previous_status)
 
         # Добавляем штраф магазину
         self.penalties.add_penalty(producer, 1)
@@ -375,11 +389,13 @@ class DisputeService:
             dispute.save(update_fields=["status", "resolution_notes", "compensation_amount", "resolved_at"])
 
             # Обновляем статус заказа
+            previous_status = order.status
             order.status = "CANCELLED"
             order.cancelled_at = timezone.now()
             order.cancelled_by = "ADMIN"
             order.cancelled_reason = "Спор решен в пользу покупателя"
             order.save(update_fields=["status", "cancelled_at", "cancelled_by", "cancelled_reason"])
+            self.summaries.on_status_change(order, previous_status)
 
             # Добавляем штраф магазину
             self.penalties.add_penalty(producer, 2)
@@ -416,8 +432,10 @@ class DisputeService:
             if order.payout_status == "NOT_ACCRUED":
                 self.finance.on_completed(order)
 
+            previous_status = order.status
             order.status = "COMPLETED"
             order.save(update_fields=["status"])
+            self.summaries.on_status_change(order, previous_status)
 
             logger.info(f"Dispute {dispute.id} resolved in favor of seller. Compensation: {compensation}")
 
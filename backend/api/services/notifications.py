@@ -3,6 +3,7 @@ import logging
 from django.urls import reverse
 
 from api.models import Notification, Order
+from api.services.push_service import push_to_users
 
 logger = logging.getLogger(__name__)
 
@@ -15,13 +16,25 @@ class NotificationService:
             return
         try:
             link = reverse("order-detail", args=[order.id]) if hasattr(order, "id") else ""
-            Notification.objects.create(
+            notification = Notification.objects.create(
                 user=user,
                 title=title,
                 message=message,
                 type="ORDER",
                 link=link,
             )
+            push_to_users(
+                [user.id],
+                "notification",
+                {
+                    "id": str(notification.id),
+                    "title": title,
+                    "message": message,
+                    "type": notification.type,
+                    "link": link,
+                    "order_id": str(order.id),
+                },
+            )
         except Exception as e:
             logger.error(f"Failed to create notification for user {user.id}: {e}", exc_info=True)
 
@@ -14,6 +14,7 @@ from django.utils import timezone
 
 from ..models import Dish, Order, OrderDraft, Producer, Profile
 from .notifications import NotificationService
+from .order_summary_service import OrderSummaryService
 from .payment_service import PaymentService
 from .penalty_service import PenaltyService
 
@@ -480,6 +481,7 @@ class OrderService:
             raise ValidationError("Вы можете отклонять только свои заказы")
 
         # Изменяем статус на CANCELLED_BY_SELLER
+        previous_status = order.status
         order.status = "CANCELLED"
         order.cancelled_by = "SELLER"  # Всегда SELLER (включая автоотмену по таймауту)
         order.cancelled_reason = reason
@@ -491,6 +493,7 @@ class OrderService:
             penalty_service.apply_order_rejection_penalty(producer, order)
 
         order.save(update_fields=["status", "cancelled_by", "cancelled_reason", "cancelled_at"])
+        OrderSummaryService().on_status_change(order, previous_status)
 
         logger.info(f"Order {order.id} rejected by producer {producer.id}. Reason: {reason}")
 
@@ -541,6 +544,7 @@ class OrderService:
             raise ValidationError("Вы можете отменять только свои заказы")
 
         # Изменяем статус на CANCELLED_BY_SELLER
+        previous_status = order.status
         order.status = "CANCELLED"
         order.cancelled_by = "SELLER"
         order.cancelled_reason = reason
@@ -554,6 +558,7 @@ class OrderService:
         order.cancellation_penalty_applied = True
 
         order.save(update_fields=["status", "cancelled_by", "cancelled_reason", "cancelled_at", "cancellation_penalty_applied"])
+        OrderSummaryService().on_status_change(order, previous_status)
 
         logger.info(f"Order {order.id} cancelled by seller {producer.id}. Reason: {reason}")
 
@@ -604,12 +609,14 @@ class OrderService:
 
         # Если нет finished_photo - отмена без потерь
         if not order.finished_photo:
+            previous_status = order.status
             order.status = "CANCELLED"
             order.cancelled_by = "BUYER"
             order.cancelled_reason = reason
             order.cancelled_at = timezone.now()
 
             order.save(update_fields=["status", "cancelled_by", "cancelled_reason", "cancelled_at"])
+            OrderSummaryService().on_status_change(order, previous_status)
 
             # Возвращаем деньги покупателю
             if order.current_payment:
@@ -625,11 +632,15 @@ class OrderService:
 
         # Если есть finished_photo - компенсация магазину 10%
         else:
+            previous_status = order.status
             order.status = "CANCELLED"
             order.cancelled_by = "BUYER"
             order.cancelled_reason = reason
             order.cancelled_at = timezone.now()
 
+            order.save(update_fields=["status", "cancelled_by", "cancelled_reason", "cancelled_at"])
+            OrderSummaryService().on_status_change(order, previous_status)
+
             # Компенсация магазину 10% (платформа платит)
             compensation_amount = order.total_price * Decimal("0.10")
             if order.producer:
@@ -9,8 +9,11 @@ from api.models import Order
 from .dispute_service import DisputeService
 from .notifications import NotificationService
 from .order_finance_service import OrderFinanceService
+from .order_summary_service import OrderSummaryService
 from .payment_service import PaymentService
 from .penalties import PenaltyService
+from .push_service import push_to_users
+from .rating_refresh_service import rating_refresh_queue
 
 
 class InvalidOrderTransition(Exception):
@@ -38,6 +41,8 @@ class OrderStatusService:
             payments=self.payments,
             penalties=self.penalties,
         )
+        self.summaries = OrderSummaryService()
+        self.ratings = rating_refresh_queue
 
     def _lock_order(self, order_id):
         try:
@@ -49,6 +54,26 @@ class OrderStatusService:
         except Order.DoesNotExist:
             raise InvalidOrderTransition(f"Order {order_id} not found")
 
+    def _after_status_change(self, order, previous_status):
+        """
+        Обновляет счётчики слотов, дневные сводки продавца и сводку его
+        покупателей после смены статуса, помечает рейтинг магазина к пересчёту
+        и отправляет новый статус покупателю и продавцу.
+        """
+        self.summaries.on_status_change(order, previous_status)
+        self.ratings.on_status_change(order, previous_status)
+        if order.status != previous_status:
+            producer = getattr(order.dish, "producer", None)
+            push_to_users(
+                [order.user_id, getattr(producer, "user_id", None)],
+                "order_status",
+                {
+                    "order_id": str(order.id),
+                    "status": order.status,
+                    "previous_status": previous_status,
+                },
+            )
+
     def _check_seller_permission(self, actor: OrderActor, producer_user):
         """
         Проверяет права доступа продавца к заказу.
@@ -64,6 +89,7 @@ class OrderStatusService:
         if order.status != "WAITING_FOR_PAYMENT":
             raise InvalidOrderTransition()
         if order.is_gift:
+            previous_status = order.status
             order.status = "WAITING_FOR_RECIPIENT"
             order.acceptance_deadline = None
             if not order.recipient_token:
@@ -71,9 +97,12 @@ class OrderStatusService:
 
                 order.recipient_token = get_random_string(32)
             order.save(update_fields=["status", "acceptance_deadline", "recipient_token"])
+            self._after_status_change(order, previous_status)
             return order
+        previous_status = order.status
         order.status = "WAITING_FOR_ACCEPTANCE"
         order.save(update_fields=["status"])
+        self._after_status_change(order, previous_status)
         return order
 
     @transaction.atomic
@@ -88,9 +117,11 @@ class OrderStatusService:
         if order.acceptance_deadline and now > order.acceptance_deadline:
             self._auto_cancel_not_accepted_locked(order)
             raise InvalidOrderTransition()
+        previous_status = order.status
         order.status = "COOKING"
         order.accepted_at = now
         order.save(update_fields=["status", "accepted_at"])
+        self._after_status_change(order, previous_status)
         if producer:
             producer.consecutive_rejections = 0
             producer.save(update_fields=["consecutive_rejections"])
@@ -112,11 +143,13 @@ class OrderStatusService:
                 producer.is_banned = True
             producer.save(update_fields=["rating", "consecutive_rejections", "is_banned"])
         now = timezone.now()
+        previous_status = order.status
         order.status = "CANCELLED"
         order.cancelled_at = now
         order.cancelled_by = "SELLER"
         order.cancelled_reason = reason
         order.save(update_fields=["status", "cancelled_at", "cancelled_by", "cancelled_reason"])
+        self._after_status_change(order, previous_status)
         self.notifications.order_cancelled(order)
         return order
 
@@ -129,12 +162,14 @@ class OrderStatusService:
         if order.status != "COOKING":
             raise InvalidOrderTransition()
         now = timezone.now()
+        previous_status = order.status
         if order.is_gift:
             order.status = "READY_FOR_REVIEW"
         else:
             order.status = "READY_FOR_DELIVERY"
         order.ready_at = now
         order.save(update_fields=["status", "ready_at"])
+        self._after_status_change(order, previous_status)
         self.notifications.order_ready(order)
         return order
 
@@ -146,8 +181,10 @@ class OrderStatusService:
         self._check_seller_permission(actor, producer_user)
         if order.status != "READY_FOR_REVIEW":
             raise InvalidOrderTransition()
+        previous_status = order.status
         order.status = "READY_FOR_DELIVERY"
         order.save(update_fields=["status"])
+        self._after_status_change(order, previous_status)
         return order
 
     @transaction.atomic
@@ -158,8 +195,10 @@ class OrderStatusService:
         self._check_seller_permission(actor, producer_user)
         if order.status not in ["READY_FOR_REVIEW", "READY_FOR_DELIVERY"]:
             raise InvalidOrderTransition()
+        previous_status = order.status
         order.status = "DELIVERING"
         order.save(update_fields=["status"])
+        self._after_status_change(order, previous_status)
         self.notifications.order_delivering(order)
         return order
 
@@ -175,9 +214,11 @@ class OrderStatusService:
         if order.status != "DELIVERING":
             raise InvalidOrderTransition()
         now = timezone.now()
+        previous_status = order.status
         order.status = "ARRIVED"
         order.delivered_at = now
         order.save(update_fields=["status", "delivered_at"])
+        self._after_status_change(order, previous_status)
         self.notifications.order_arrived(order)
         return order
 
@@ -199,10 +240,12 @@ class OrderStatusService:
         if order.status not in ["READY_FOR_REVIEW", "DELIVERING", "ARRIVED"]:
             raise InvalidOrderTransition()
         now = timezone.now()
+        previous_status = order.status
         order.status = "COMPLETED"
         if not order.delivered_at:
             order.delivered_at = now
         order.save(update_fields=["status", "delivered_at"])
+        self._after_status_change(order, previous_status)
         producer = getattr(order.dish, "producer", None)
         if producer:
             if hasattr(producer, "sales_count"):
@@ -290,8 +333,10 @@ class OrderStatusService:
             order.cancelled_by = "BUYER"
         order.cancelled_reason = reason
         order.cancelled_at = now
+        previous_status = order.status
         order.status = "CANCELLED"
         order.save(update_fields=["status", "cancelled_by", "cancelled_reason", "cancelled_at"])
+        self._after_status_change(order, previous_status)
         logger.info(f"Order {order.id} cancelled by {actor_role}. Reason: {reason}")
         self.finance.on_cancelled(order)
         self.notifications.order_cancelled(order)
@@ -311,11 +356,13 @@ class OrderStatusService:
         if timezone.now() <= late_threshold or order.status in ["COMPLETED", "CANCELLED", "READY_FOR_REVIEW"]:
             raise InvalidOrderTransition()
         now = timezone.now()
+        previous_status = order.status
         order.status = "CANCELLED"
         order.cancelled_at = now
         order.cancelled_by = "SYSTEM"
         order.cancelled_reason = "Late delivery"
         order.save(update_fields=["status", "cancelled_at", "cancelled_by", "cancelled_reason"])
+        self._after_status_change(order, previous_status)
         producer = order.dish.producer
         self.penalties.add_penalty(producer, 1)
         self.notifications.order_cancelled(order)
@@ -335,11 +382,13 @@ class OrderStatusService:
     def _auto_cancel_not_accepted_locked(self, order):
         producer = getattr(order.dish, "producer", None)
         now = timezone.now()
+        previous_status = order.status
         order.status = "CANCELLED"
         order.cancelled_by = "SYSTEM"
         order.cancelled_reason = "Acceptance timeout"
         order.cancelled_at = now
         order.save(update_fields=["status", "cancelled_by", "cancelled_reason", "cancelled_at"])
+        self._after_status_change(order, previous_status)
         if producer:
             self.penalties.add_penalty(producer, 1)
         self.notifications.order_cancelled(order)
@@ -0,0 +1,38 @@
+"""
+Сводки, зависящие от статуса заказа: счётчики слотов доставки
+(SlotOccupancy), дневная статистика продавца (ProducerDailyStats) и
+сводка его покупателей (ProducerCustomerStats).
+
+Все пути смены статуса (OrderStatusService, DisputeService, SLAService,
+отмены в OrderService и views) вызывают один хук, чтобы сводки не
+расходились с заказами; reconcile_slot_occupancy и backfill-команды
+остаются страховкой от расхождений. Хук же отмечает
+Order.completion_changed_at, по которому инкрементальный пересчёт
+повторных покупок выбирает заказы.
+"""
+
+from django.utils import timezone
+
+from api.models import Order
+
+from .producer_customer_stats_service import ProducerCustomerStatsService
+from .producer_stats_service import ProducerStatsService
+from .slot_occupancy_service import SlotOccupancyService
+
+
+class OrderSummaryService:
+    """Обновляет слоты и сводки продавца после смены статуса заказа."""
+
+    def __init__(self):
+        self.slots = SlotOccupancyService()
+        self.stats = ProducerStatsService()
+        self.customer_stats = ProducerCustomerStatsService()
+
+    def on_status_change(self, order: Order, previous_status) -> None:
+        """Учесть смену статуса заказа во всех сводках."""
+        if previous_status != order.status and "COMPLETED" in (previous_status, order.status):
+            order.completion_changed_at = timezone.now()
+            Order.objects.filter(pk=order.pk).update(completion_changed_at=order.completion_changed_at)
+        self.slots.on_status_change(order, previous_status)
+        self.stats.on_status_change(order, previous_status)
+        self.customer_stats.on_status_change(order, previous_status)
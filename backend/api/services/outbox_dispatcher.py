@@ -0,0 +1,355 @@
+"""
+Диспетчер outbox-событий.
+
+Диспетчер забирает пачку готовых событий, арендуя их (next_attempt_at
+сдвигается на время аренды), передаёт их публикатору (outbox_publishers)
+пулом потоков - по пачке на топик - и одной транзакцией записывает
+PublishedEvent и итоговые статусы событий.
+
+Порядок внутри агрегата (aggregate_type, aggregate_id) сохраняется:
+события агрегата попадают в одну пачку топика, после ошибки
+оставшиеся события агрегата откладываются, а событие не
+забирается, пока более раннее событие агрегата ждёт повтора или
+находится в аренде.
+
+В PostgreSQL диспетчер просыпается по LISTEN/NOTIFY (триггер на вставку
+в api_outboxevent), в остальных СУБД опрашивает таблицу с адаптивным
+интервалом.
+"""
+
+import select
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Dict, List, Optional, Tuple
+
+from django.core.cache import cache
+from django.db import connection, models, transaction
+from django.db.models import Exists, Min, OuterRef
+from django.utils import timezone
+
+from api.models import OutboxEvent, PublishedEvent
+from api.services.outbox_publishers import OutboxPublisher, get_publisher
+from core.logging import StructuredLogger
+
+MAX_ATTEMPTS = 10
+NOTIFY_CHANNEL = "outbox_events"
+
+logger = StructuredLogger("api.outbox")
+
+
+def _calculate_next_attempt(attempt_count: int, base_seconds: int = 30, max_minutes: int = 60):
+    backoff_seconds = base_seconds * (2 ** (attempt_count - 1))
+    max_seconds = max_minutes * 60
+    backoff_seconds = min(backoff_seconds, max_seconds)
+    return timezone.now() + timedelta(seconds=backoff_seconds)
+
+
+class DispatcherStats:
+    """Счётчики пропускной способности и задержки диспетчера."""
+
+    CACHE_KEY = "outbox:dispatcher:stats"
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.batches = 0
+        self.published = 0
+        self.failed = 0
+        self.dead_lettered = 0
+        self.deferred = 0
+        self.last_lag_seconds = 0.0
+        self.max_lag_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record_batch(self, published, failed, dead_lettered, deferred, lags: List[float]):
+        with self._lock:
+            self.batches += 1
+            self.published += published
+            self.failed += failed
+            self.dead_lettered += dead_lettered
+            self.deferred += deferred
+            if lags:
+                self.last_lag_seconds = max(lags)
+                self.max_lag_seconds = max(self.max_lag_seconds, self.last_lag_seconds)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            uptime = max(time.monotonic() - self.started_at, 1e-9)
+            return {
+                "uptime_seconds": round(uptime, 3),
+                "batches": self.batches,
+                "published": self.published,
+                "failed": self.failed,
+                "dead_lettered": self.dead_lettered,
+                "deferred": self.deferred,
+                "throughput_per_second": round(self.published / uptime, 3),
+                "last_lag_seconds": round(self.last_lag_seconds, 3),
+                "max_lag_seconds": round(self.max_lag_seconds, 3),
+            }
+
+
+class OutboxDispatcher:
+    """Пакетная публикация OutboxEvent с пулом потоков и bulk_update статусов."""
+
+    # На сколько событие арендуется диспетчером, забравшим его
+    LEASE_SECONDS = 300
+    STATE_FIELDS = [
+        "status",
+        "processed_at",
+        "attempt_count",
+        "error_message",
+        "dead_letter",
+        "next_attempt_at",
+    ]
+
+    def __init__(
+        self,
+        workers: int = 4,
+        batch_size: int = 100,
+        min_interval: float = 0.5,
+        max_interval: float = 10.0,
+        use_notify: bool = True,
+        publisher: Optional[OutboxPublisher] = None,
+    ):
+        self.publisher = publisher or get_publisher()
+        self.workers = workers
+        self.batch_size = batch_size
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.use_notify = use_notify
+        self.stats = DispatcherStats()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._listening_on = None
+        self._stopped = threading.Event()
+
+    # ------------------------------------------------------------------
+    # Захват пачки
+    # ------------------------------------------------------------------
+
+    def _ready_events(self, now):
+        # Более раннее событие агрегата в ожидании повтора или в аренде
+        blocking = OutboxEvent.objects.filter(
+            aggregate_type=OuterRef("aggregate_type"),
+            aggregate_id=OuterRef("aggregate_id"),
+            status="PENDING",
+            dead_letter=False,
+            created_at__lt=OuterRef("created_at"),
+            next_attempt_at__gt=now,
+        )
+        return (
+            OutboxEvent.objects.filter(dead_letter=False, status="PENDING")
+            .filter(models.Q(next_attempt_at__isnull=True) | models.Q(next_attempt_at__lte=now))
+            .filter(~Exists(blocking))
+        )
+
+    def claim_batch(self, limit: Optional[int] = None) -> List[OutboxEvent]:
+        """Забрать и арендовать пачку событий, готовых к публикации."""
+        now = timezone.now()
+        with transaction.atomic():
+            events = list(
+                self._ready_events(now)
+                .select_for_update(skip_locked=True)
+                .order_by("created_at")[: limit or self.batch_size]
+            )
+            if not events:
+                return []
+            events = self._drop_out_of_order(events)
+            lease_until = now + timedelta(seconds=self.LEASE_SECONDS)
+            for event in events:
+                event.next_attempt_at = lease_until
+            OutboxEvent.objects.bulk_update(events, ["next_attempt_at"])
+        return events
+
+    def _drop_out_of_order(self, events: List[OutboxEvent]) -> List[OutboxEvent]:
+        """
+        Убрать события, у агрегата которых есть более раннее незабранное
+        событие - например, заблокированное параллельным диспетчером.
+        """
+        claimed_ids = [event.id for event in events]
+        earliest = {
+            (row["aggregate_type"], row["aggregate_id"]): row["first_created_at"]
+            for row in OutboxEvent.objects.filter(
+                status="PENDING",
+                dead_letter=False,
+                aggregate_id__in={event.aggregate_id for event in events},
+            )
+            .exclude(id__in=claimed_ids)
+            .values("aggregate_type", "aggregate_id")
+            .annotate(first_created_at=Min("created_at"))
+        }
+        return [
+            event
+            for event in events
+            if (event.aggregate_type, event.aggregate_id) not in earliest
+            or event.created_at < earliest[(event.aggregate_type, event.aggregate_id)]
+        ]
+
+    # ------------------------------------------------------------------
+    # Публикация
+    # ------------------------------------------------------------------
+
+    def _group_by_topic(self, events: List[OutboxEvent]) -> Dict[str, List[OutboxEvent]]:
+        groups: Dict[str, List[OutboxEvent]] = OrderedDict()
+        for event in events:
+            groups.setdefault(self.publisher.topic_for(event), []).append(event)
+        return groups
+
+    def _publish(self, events: List[OutboxEvent]):
+        """
+        Отправить события публикатору: топики параллельно, внутри топика
+        одной пачкой. Публикатор не обращается к БД, поэтому потокам пула
+        соединения не нужны.
+        """
+        groups = self._group_by_topic(events)
+        if self.workers <= 1 or len(groups) == 1:
+            results = [self.publisher.publish_many(topic, group) for topic, group in groups.items()]
+        else:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="outbox-publisher"
+                )
+            results = list(self._executor.map(self.publisher.publish_many, groups, groups.values()))
+
+        published, failed, deferred = [], [], []
+        for group_published, group_failed, group_deferred in results:
+            published.extend(group_published)
+            failed.extend(group_failed)
+            deferred.extend(group_deferred)
+        return published, failed, deferred
+
+    def dispatch_batch(self, limit: Optional[int] = None) -> Tuple[int, int]:
+        """Обработать одну пачку; возвращает (забрано, опубликовано)."""
+        events = self.claim_batch(limit)
+        if not events:
+            return 0, 0
+
+        # Уже опубликованные (сбой после отправки) повторно не отправляются
+        already_published = set(
+            PublishedEvent.objects.filter(outbox_event__in=events).values_list(
+                "outbox_event_id", flat=True
+            )
+        )
+        published, failed, deferred = self._publish(
+            [event for event in events if event.id not in already_published]
+        )
+        now = timezone.now()
+        dead_lettered = 0
+        for event, exc in failed:
+            event.attempt_count += 1
+            event.error_message = str(exc)[:1000]
+            if event.attempt_count >= MAX_ATTEMPTS:
+                event.dead_letter = True
+                event.status = "DEAD"
+                event.next_attempt_at = None
+                dead_lettered += 1
+            else:
+                event.next_attempt_at = _calculate_next_attempt(event.attempt_count)
+        for event in deferred:
+            # Снимаем аренду: событие дождётся повтора упавшего предшественника
+            event.next_attempt_at = None
+
+        with transaction.atomic():
+            PublishedEvent.objects.bulk_create(
+                [
+                    PublishedEvent(outbox_event=event, topic=self.publisher.topic_for(event))
+                    for event in published
+                ],
+                batch_size=1000,
+                ignore_conflicts=True,
+            )
+            published.extend(event for event in events if event.id in already_published)
+            for event in published:
+                event.status = "PROCESSED"
+                event.processed_at = now
+            OutboxEvent.objects.bulk_update(
+                published + [event for event, _ in failed] + deferred,
+                self.STATE_FIELDS,
+                batch_size=500,
+            )
+
+        self.stats.record_batch(
+            published=len(published),
+            failed=len(failed),
+            dead_lettered=dead_lettered,
+            deferred=len(deferred),
+            lags=[(now - event.created_at).total_seconds() for event in published],
+        )
+        return len(events), len(published)
+
+    # ------------------------------------------------------------------
+    # Цикл демона
+    # ------------------------------------------------------------------
+
+    def _listen(self) -> bool:
+        """Подписаться на NOTIFY (заново после переподключения)."""
+        if not self.use_notify or connection.vendor != "postgresql":
+            return False
+        connection.ensure_connection()
+        raw = connection.connection
+        if self._listening_on is not raw:
+            with connection.cursor() as cursor:
+                cursor.execute(f"LISTEN {NOTIFY_CHANNEL}")
+            self._listening_on = raw
+        return True
+
+    def _wait(self, timeout: float) -> None:
+        """Ждать NOTIFY (PostgreSQL) или просто timeout секунд."""
+        if not self._listen():
+            self._stopped.wait(timeout)
+            return
+        raw = connection.connection
+        if callable(getattr(raw, "notifies", None)):
+            # psycopg 3
+            for _ in raw.notifies(timeout=timeout, stop_after=1):
+                pass
+            return
+        # psycopg2
+        if select.select([raw], [], [], timeout) != ([], [], []):
+            raw.poll()
+            raw.notifies.clear()
+
+    def publish_stats(self) -> dict:
+        snapshot = self.stats.snapshot()
+        oldest = (
+            OutboxEvent.objects.filter(status="PENDING", dead_letter=False)
+            .order_by("created_at")
+            .values_list("created_at", flat=True)
+            .first()
+        )
+        snapshot["pending_lag_seconds"] = (
+            round((timezone.now() - oldest).total_seconds(), 3) if oldest else 0.0
+        )
+        cache.set(DispatcherStats.CACHE_KEY, snapshot, None)
+        logger.info("outbox_dispatcher_stats", **snapshot)
+        return snapshot
+
+    def run(self, stats_interval: float = 60.0) -> None:
+        """Крутиться до stop(): пачки подряд, пока есть работа, затем ожидание."""
+        interval = self.min_interval
+        last_stats_at = time.monotonic()
+        try:
+            while not self._stopped.is_set():
+                claimed, _ = self.dispatch_batch()
+                if time.monotonic() - last_stats_at >= stats_interval:
+                    self.publish_stats()
+                    last_stats_at = time.monotonic()
+                if claimed >= self.batch_size:
+                    # Очередь не разобрана - следующая пачка без ожидания
+                    interval = self.min_interval
+                    continue
+                interval = (
+                    self.min_interval if claimed else min(interval * 2, self.max_interval)
+                )
+                self._wait(interval)
+        finally:
+            self.close()
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
@@ -0,0 +1,223 @@
+"""
+Бэкенды публикации outbox-событий.
+
+Публикатор отправляет пачку событий одного топика во внешний приёмник.
+Идемпотентность обеспечивает диспетчер: после отправки он вставляет
+PublishedEvent пачкой с игнорированием конфликтов и не отправляет
+повторно события, для которых PublishedEvent уже есть. Приёмники,
+кроме БД, получают события по семантике at-least-once: сбой между
+отправкой и записью PublishedEvent приведёт к повторной отправке.
+
+Бэкенд выбирается настройками OUTBOX_PUBLISHER и OUTBOX_PUBLISHER_OPTIONS.
+"""
+
+import json
+import os
+import threading
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+from api.models import OutboxEvent
+
+
+class OutboxPublisher:
+    """
+    Базовый публикатор.
+
+    publish_many сохраняет порядок внутри агрегата: после ошибки
+    события того же агрегата не отправляются и возвращаются отложенными.
+    Подклассы реализуют send - отправку пачки целиком или исключение.
+    """
+
+    TOPICS = {"checkout": "checkout-events", "gift": "gift-events", "order": "order-events"}
+    DEFAULT_TOPIC = "events"
+
+    def topic_for(self, event: OutboxEvent) -> str:
+        return self.TOPICS.get(event.aggregate_type, self.DEFAULT_TOPIC)
+
+    def validate(self, event: OutboxEvent) -> None:
+        """Отклонить событие, которое нельзя опубликовать."""
+        payload = event.payload or {}
+        if isinstance(payload, dict) and payload.get("force_error"):
+            raise RuntimeError("Publish error")
+
+    def send(self, topic: str, events: List[OutboxEvent]) -> None:
+        raise NotImplementedError
+
+    def publish_many(self, topic: str, events: List[OutboxEvent]) -> Tuple[list, list, list]:
+        """
+        Опубликовать события топика в порядке списка.
+
+        Возвращает (опубликованные, [(событие, ошибка)], отложенные).
+        """
+        ready, failed, deferred = [], [], []
+        failed_aggregates = set()
+        for event in events:
+            aggregate = (event.aggregate_type, event.aggregate_id)
+            if aggregate in failed_aggregates:
+                deferred.append(event)
+                continue
+            try:
+                self.validate(event)
+            except Exception as exc:
+                failed.append((event, exc))
+                failed_aggregates.add(aggregate)
+                continue
+            ready.append(event)
+
+        if ready:
+            try:
+                self.send(topic, ready)
+            except Exception as exc:
+                # Пачка не отправлена: первое событие агрегата - ошибка, остальные ждут
+                sent_aggregates = set()
+                for event in ready:
+                    aggregate = (event.aggregate_type, event.aggregate_id)
+                    if aggregate in sent_aggregates:
+                        deferred.append(event)
+                    else:
+                        failed.append((event, exc))
+                        sent_aggregates.add(aggregate)
+                return [], failed, deferred
+        return ready, failed, deferred
+
+    @staticmethod
+    def serialize(event: OutboxEvent, topic: str) -> Dict[str, str]:
+        return {
+            "id": str(event.id),
+            "topic": topic,
+            "aggregate_type": event.aggregate_type,
+            "aggregate_id": str(event.aggregate_id),
+            "event_type": event.event_type,
+            "payload": json.dumps(event.payload, ensure_ascii=False, default=str),
+            "created_at": event.created_at.isoformat() if event.created_at else "",
+        }
+
+
+class DatabasePublisher(OutboxPublisher):
+    """Приёмник - таблица PublishedEvent, которую заполняет диспетчер."""
+
+    def send(self, topic: str, events: List[OutboxEvent]) -> None:
+        return None
+
+
+class JsonlFilePublisher(OutboxPublisher):
+    """Дописывает события в JSONL-файл, по строке на событие."""
+
+    def __init__(self, path: str = None):
+        self.path = path or os.path.join(settings.BASE_DIR, "outbox_events.jsonl")
+        self._lock = threading.Lock()
+
+    def send(self, topic: str, events: List[OutboxEvent]) -> None:
+        lines = "".join(
+            json.dumps(self.serialize(event, topic), ensure_ascii=False) + "\n"
+            for event in events
+        )
+        with self._lock, open(self.path, "a", encoding="utf-8") as handle:
+            handle.write(lines)
+            handle.flush()
+            os.fsync(handle.fileno())
+
+
+class InMemoryStreamClient:
+    """
+    Локальная замена Redis для RedisStreamPublisher в тестах (передаётся
+    через client): поддерживает xadd, xrange, xlen и pipeline в объёме,
+    нужном публикатору.
+    """
+
+    def __init__(self):
+        self.streams: Dict[str, list] = defaultdict(list)
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def xadd(self, name, fields, maxlen=None, approximate=True):
+        with self._lock:
+            self._sequence += 1
+            entry_id = f"{self._sequence}-0"
+            stream = self.streams[name]
+            stream.append((entry_id, dict(fields)))
+            if maxlen is not None and len(stream) > maxlen:
+                del stream[: len(stream) - maxlen]
+            return entry_id
+
+    def xrange(self, name, min="-", max="+", count=None):
+        entries = list(self.streams.get(name, []))
+        return entries[:count] if count else entries
+
+    def xlen(self, name):
+        return len(self.streams.get(name, []))
+
+    def pipeline(self, transaction=True):
+        return _InMemoryPipeline(self)
+
+
+class _InMemoryPipeline:
+    def __init__(self, client: InMemoryStreamClient):
+        self.client = client
+        self.commands = []
+
+    def xadd(self, *args, **kwargs):
+        self.commands.append((args, kwargs))
+        return self
+
+    def execute(self):
+        results = [self.client.xadd(*args, **kwargs) for args, kwargs in self.commands]
+        self.commands = []
+        return results
+
+
+class RedisStreamPublisher(OutboxPublisher):
+    """
+    Публикует события в Redis Streams: XADD в поток "<prefix><topic>"
+    одним pipeline на пачку.
+
+    Без url и client используется REDIS_URL; без Redis публикатор не
+    создаётся: события в памяти процесса были бы потеряны.
+    """
+
+    def __init__(self, url: str = None, client=None, stream_prefix: str = "outbox:", maxlen: int = None):
+        self.stream_prefix = stream_prefix
+        self.maxlen = maxlen
+        self.client = client or self._connect(url or os.getenv("REDIS_URL"))
+
+    @staticmethod
+    def _connect(url):
+        if not url:
+            raise ImproperlyConfigured(
+                "RedisStreamPublisher requires REDIS_URL or an explicit url/client"
+            )
+        try:
+            import redis
+        except ImportError:
+            raise ImproperlyConfigured(
+                "RedisStreamPublisher requires the 'redis' package"
+            ) from None
+        return redis.Redis.from_url(url)
+
+    def stream_name(self, topic: str) -> str:
+        return f"{self.stream_prefix}{topic}"
+
+    def send(self, topic: str, events: List[OutboxEvent]) -> None:
+        pipeline = self.client.pipeline(transaction=False)
+        for event in events:
+            pipeline.xadd(
+                self.stream_name(topic),
+                self.serialize(event, topic),
+                maxlen=self.maxlen,
+                approximate=True,
+            )
+        pipeline.execute()
+
+
+def get_publisher() -> OutboxPublisher:
+    """Публикатор из настроек OUTBOX_PUBLISHER и OUTBOX_PUBLISHER_OPTIONS."""
+    path = getattr(
+        settings, "OUTBOX_PUBLISHER", "api.services.outbox_publishers.DatabasePublisher"
+    )
+    options = getattr(settings, "OUTBOX_PUBLISHER_OPTIONS", {}) or {}
+    return import_string(path)(**options)
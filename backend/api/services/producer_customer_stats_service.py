@@ -0,0 +1,130 @@
+"""
+Сводка покупателей магазина (ProducerCustomerStats) для аналитики повторных покупок.
+
+Строка на пару (магазин, покупатель): число завершённых заказов, сумма
+и время последнего заказа. Списки повторных покупателей, бонус к
+комиссии и статистика магазина читаются из сводки по индексу
+(producer, order_count) вместо группировки заказов.
+"""
+
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, Max, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from api.models import Order, ProducerCustomerStats
+
+from .producer_stats_service import ProducerStatsService
+
+
+class ProducerCustomerStatsService:
+    """
+    Поддерживает сводку покупателей магазина.
+
+    Сводка обновляется инкрементально при переходе заказа в COMPLETED и
+    из него; полный пересчёт из Order выполняет ``rebuild``.
+    """
+
+    SUMMARY_FIELDS = ("order_count", "total_spent", "last_order_at")
+
+    _delta = staticmethod(ProducerStatsService._delta)
+
+    def on_status_change(self, order: Order, previous_status):
+        """Учесть смену статуса заказа в сводке его покупателя."""
+        delta = self._delta(previous_status, order.status, "COMPLETED")
+        if not delta or not order.user_id:
+            return
+        producer_id = order.producer_id or order.dish.producer_id
+        if not producer_id:
+            return
+
+        with transaction.atomic():
+            stats, _ = ProducerCustomerStats.objects.select_for_update().get_or_create(
+                producer_id=producer_id,
+                user_id=order.user_id,
+            )
+            stats.order_count = max(0, stats.order_count + delta)
+            stats.total_spent = max(
+                Decimal("0"), stats.total_spent + Decimal(order.total_price) * delta
+            )
+            if delta > 0:
+                if stats.last_order_at is None or order.created_at > stats.last_order_at:
+                    stats.last_order_at = order.created_at
+            else:
+                # Заказ вышел из COMPLETED: последний заказ берётся из оставшихся
+                stats.last_order_at = (
+                    self._completed_orders()
+                    .filter(order_producer_id=producer_id, user_id=order.user_id)
+                    .aggregate(last=Max("created_at"))["last"]
+                )
+            stats.save()
+
+    @staticmethod
+    def _completed_orders():
+        return Order.objects.filter(status="COMPLETED", user__isnull=False).annotate(
+            order_producer_id=Coalesce("producer_id", "dish__producer_id")
+        )
+
+    @transaction.atomic
+    def rebuild(self, producer=None) -> int:
+        """
+        Пересчитать сводку из Order одним групповым запросом
+        (backfill и исправление расхождений).
+
+        Существующие строки блокируются до чтения заказов и исправляются на
+        месте, как в ``ProducerStatsService.rebuild``: отличающиеся
+        обновляются, недостающие создаются, лишние удаляются.
+
+        Returns:
+            Количество записанных строк сводки
+        """
+        orders = self._completed_orders()
+        existing = ProducerCustomerStats.objects.all()
+        if producer is not None:
+            orders = orders.filter(order_producer_id=producer.pk)
+            existing = existing.filter(producer=producer)
+
+        current = {
+            (stats.producer_id, stats.user_id): stats
+            for stats in existing.select_for_update().iterator()
+        }
+
+        rows = {
+            (row["order_producer_id"], row["user_id"]): ProducerCustomerStats(
+                producer_id=row["order_producer_id"],
+                user_id=row["user_id"],
+                order_count=row["order_count"],
+                total_spent=row["total_spent"] or Decimal("0"),
+                last_order_at=row["last_order_at"],
+            )
+            for row in orders.values("order_producer_id", "user_id")
+            .annotate(
+                order_count=Count("id"),
+                total_spent=Sum("total_price"),
+                last_order_at=Max("created_at"),
+            )
+            .order_by()
+            if row["order_producer_id"] is not None
+        }
+
+        written = 0
+        stale = []
+        for key, stats in current.items():
+            fresh = rows.get(key)
+            if fresh is None:
+                stale.append(stats.pk)
+                continue
+            values = {field: getattr(fresh, field) for field in self.SUMMARY_FIELDS}
+            if any(getattr(stats, field) != value for field, value in values.items()):
+                written += ProducerCustomerStats.objects.filter(pk=stats.pk).update(
+                    **values, updated_at=timezone.now()
+                )
+        if stale:
+            ProducerCustomerStats.objects.filter(pk__in=stale).delete()
+
+        # Строку, созданную параллельно, уже учёл её on_status_change
+        missing = [stats for key, stats in rows.items() if key not in current]
+        ProducerCustomerStats.objects.bulk_create(missing, batch_size=1000, ignore_conflicts=True)
+        return written + len(missing)
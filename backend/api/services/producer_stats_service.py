@@ -0,0 +1,202 @@
+"""
+Сервис дневных сводок продавца (ProducerDailyStats) для статистики заказов.
+"""
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from api.models import Order, ProducerDailyStats
+
+
+class ProducerStatsService:
+    """
+    Поддерживает сводки по дням создания заказа.
+
+    Сводка обновляется инкрементально при переходе заказа в COMPLETED/CANCELLED
+    и из них; полный пересчёт из Order выполняет ``rebuild``.
+    """
+
+    TOP_LIMIT = 5
+    ROLLUP_FIELDS = ("completed_count", "cancelled_count", "revenue", "dishes", "toppings")
+
+    def on_status_change(self, order: Order, previous_status):
+        """Учесть смену статуса заказа в сводке его дня."""
+        completed_delta = self._delta(previous_status, order.status, "COMPLETED")
+        cancelled_delta = self._delta(previous_status, order.status, "CANCELLED")
+        if not completed_delta and not cancelled_delta:
+            return
+        producer_id = order.producer_id or order.dish.producer_id
+        if not producer_id:
+            return
+
+        with transaction.atomic():
+            stats, _ = ProducerDailyStats.objects.select_for_update().get_or_create(
+                producer_id=producer_id,
+                date=timezone.localdate(order.created_at),
+            )
+            stats.cancelled_count = max(0, stats.cancelled_count + cancelled_delta)
+            if completed_delta:
+                stats.completed_count = max(0, stats.completed_count + completed_delta)
+                stats.revenue = stats.revenue + Decimal(order.total_price) * completed_delta
+                self._add_order_items(
+                    stats.dishes,
+                    stats.toppings,
+                    order.dish.name,
+                    order.total_price,
+                    order.selected_toppings,
+                    completed_delta,
+                )
+            stats.save()
+
+    @staticmethod
+    def _delta(previous_status, status, tracked_status) -> int:
+        if previous_status == status:
+            return 0
+        if status == tracked_status:
+            return 1
+        if previous_status == tracked_status:
+            return -1
+        return 0
+
+    @staticmethod
+    def _add_order_items(dishes, toppings, dish_name, total_price, selected_toppings, delta):
+        dish = dishes.setdefault(dish_name, {"count": 0, "revenue": 0.0})
+        dish["count"] += delta
+        dish["revenue"] = round(dish["revenue"] + float(total_price) * delta, 2)
+        if dish["count"] <= 0:
+            dishes.pop(dish_name)
+        for topping in selected_toppings or []:
+            name = topping.get("name") if isinstance(topping, dict) else None
+            if not name:
+                continue
+            toppings[name] = toppings.get(name, 0) + delta
+            if toppings[name] <= 0:
+                toppings.pop(name)
+
+    @transaction.atomic
+    def rebuild(self, producer=None) -> int:
+        """
+        Пересчитать сводки из Order (backfill и исправление расхождений).
+
+        Существующие строки блокируются до чтения заказов и исправляются на
+        месте: отличающиеся обновляются, недостающие создаются, лишние
+        удаляются. Параллельный ``on_status_change`` ждёт окончания пересчёта
+        и не теряет своё изменение.
+
+        Returns:
+            Количество записанных дневных сводок
+        """
+        orders = Order.objects.filter(status__in=["COMPLETED", "CANCELLED"])
+        existing = ProducerDailyStats.objects.all()
+        if producer is not None:
+            orders = orders.filter(dish__producer=producer)
+            existing = existing.filter(producer=producer)
+
+        current = {
+            (stats.producer_id, stats.date): stats
+            for stats in existing.select_for_update().iterator()
+        }
+
+        rows = {}
+        for producer_id, created_at, status, total_price, dish_name, selected_toppings in (
+            orders.values_list(
+                "dish__producer_id",
+                "created_at",
+                "status",
+                "total_price",
+                "dish__name",
+                "selected_toppings",
+            ).iterator()
+        ):
+            key = (producer_id, timezone.localdate(created_at))
+            stats = rows.get(key)
+            if stats is None:
+                stats = rows[key] = ProducerDailyStats(
+                    producer_id=producer_id,
+                    date=key[1],
+                    revenue=Decimal("0"),
+                    dishes={},
+                    toppings={},
+                )
+            if status == "CANCELLED":
+                stats.cancelled_count += 1
+                continue
+            stats.completed_count += 1
+            stats.revenue += total_price
+            self._add_order_items(
+                stats.dishes, stats.toppings, dish_name, total_price, selected_toppings, 1
+            )
+
+        written = 0
+        stale = []
+        for key, stats in current.items():
+            fresh = rows.get(key)
+            if fresh is None:
+                stale.append(stats.pk)
+                continue
+            values = {field: getattr(fresh, field) for field in self.ROLLUP_FIELDS}
+            if any(getattr(stats, field) != value for field, value in values.items()):
+                written += ProducerDailyStats.objects.filter(pk=stats.pk).update(
+                    **values, updated_at=timezone.now()
+                )
+        if stale:
+            ProducerDailyStats.objects.filter(pk__in=stale).delete()
+
+        # Сводку, созданную параллельно, уже учёл её on_status_change
+        missing = [stats for key, stats in rows.items() if key not in current]
+        ProducerDailyStats.objects.bulk_create(missing, batch_size=1000, ignore_conflicts=True)
+        return written + len(missing)
+
+    def get_summary(self, producer, start_date=None) -> dict:
+        """
+        Собрать статистику продавца из дневных сводок одним запросом.
+
+        Args:
+            start_date: первая учитываемая дата (включительно) или None для всего периода
+        """
+        rows = ProducerDailyStats.objects.filter(producer=producer).order_by("date")
+        if start_date is not None:
+            rows = rows.filter(date__gte=start_date)
+
+        total_revenue = Decimal("0")
+        orders_count = 0
+        cancelled_orders_count = 0
+        dishes = defaultdict(lambda: {"count": 0, "revenue": 0.0})
+        toppings = defaultdict(int)
+        chart_data = []
+        for stats in rows:
+            total_revenue += stats.revenue
+            orders_count += stats.completed_count
+            cancelled_orders_count += stats.cancelled_count
+            for name, item in stats.dishes.items():
+                dishes[name]["count"] += item["count"]
+                dishes[name]["revenue"] += item["revenue"]
+            for name, count in stats.toppings.items():
+                toppings[name] += count
+            if stats.completed_count:
+                chart_data.append(
+                    {
+                        "date": stats.date.isoformat(),
+                        "revenue": float(stats.revenue),
+                        "count": stats.completed_count,
+                    }
+                )
+
+        top_dishes = sorted(dishes.items(), key=lambda x: x[1]["count"], reverse=True)
+        top_toppings = sorted(toppings.items(), key=lambda x: x[1], reverse=True)
+        return {
+            "total_revenue": float(total_revenue),
+            "orders_count": orders_count,
+            "cancelled_orders_count": cancelled_orders_count,
+            "top_dishes": [
+                {"name": name, "count": item["count"], "revenue": round(item["revenue"], 2)}
+                for name, item in top_dishes[: self.TOP_LIMIT]
+            ],
+            "top_toppings": [
+                {"name": name, "count": count} for name, count in top_toppings[: self.TOP_LIMIT]
+            ],
+            "chart_data": chart_data,
+        }
@@ -0,0 +1,260 @@
+"""
+Push-доставка событий подключённым клиентам (Server-Sent Events).
+
+Сервисы вызывают push_to_users: событие уходит в брокер после коммита
+транзакции, брокер раздаёт его подпискам пользователя - открытым
+соединениям GET /api/events/ (EventStreamView). Клиентам больше не нужно
+опрашивать чат и заказы.
+
+Брокер выбирается настройками PUSH_BROKER и PUSH_BROKER_OPTIONS:
+InProcessBroker - для одного процесса, RedisPubSubBroker - для
+нескольких процессов и узлов (по умолчанию, если задан REDIS_URL).
+Поток событий работает только под ASGI-сервером (backend.asgi).
+Доставка best-effort: события, отправленные при
+отсутствии соединения, не хранятся - при переподключении клиент
+перечитывает состояние через API.
+"""
+
+import asyncio
+import fnmatch
+import json
+import os
+import threading
+import uuid
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from core.logging import get_logger
+
+logger = get_logger(__name__)
+
+
+class Subscription:
+    """
+    Подписка одного соединения на события пользователя.
+
+    Создаётся в цикле событий соединения; deliver можно вызывать из
+    любого потока.
+    """
+
+    def __init__(self, user_id, maxsize: int = 100):
+        self.user_id = str(user_id)
+        self.loop = asyncio.get_running_loop()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+
+    def deliver(self, event: dict) -> None:
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            # Цикл соединения уже закрыт
+            pass
+
+    def _put(self, event: dict) -> None:
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            logger.warning("push_subscription_overflow", user_id=self.user_id)
+
+    async def get(self, timeout: float) -> Optional[dict]:
+        """Следующее событие или None, если за timeout секунд событий не было."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class PushBroker:
+    """Базовый брокер: подписки соединений этого процесса и раздача им событий."""
+
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        self._subscriptions: Dict[str, Set[Subscription]] = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id) -> Subscription:
+        subscription = Subscription(user_id, self.queue_size)
+        with self._lock:
+            self._subscriptions[subscription.user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id)
+            if subscriptions is None:
+                return
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self._subscriptions[subscription.user_id]
+
+    def deliver_local(self, user_ids: Iterable[str], event: dict) -> int:
+        """Раздать событие подпискам этого процесса; возвращает число подписок."""
+        with self._lock:
+            targets = [
+                subscription
+                for user_id in user_ids
+                for subscription in self._subscriptions.get(str(user_id), ())
+            ]
+        for subscription in targets:
+            subscription.deliver(event)
+        return len(targets)
+
+    def publish(self, user_ids: List[str], event: dict) -> None:
+        raise NotImplementedError
+
+
+class InProcessBroker(PushBroker):
+    """Брокер одного процесса: публикация сразу раздаётся локальным подпискам."""
+
+    def publish(self, user_ids: List[str], event: dict) -> None:
+        self.deliver_local(user_ids, event)
+
+
+class InMemoryPubSubClient:
+    """
+    Локальная замена Redis для RedisPubSubBroker: поддерживает publish
+    и pubsub().psubscribe/run_in_thread в объёме, нужном брокеру.
+    Обработчики вызываются синхронно в потоке публикации.
+    """
+
+    def __init__(self):
+        self.handlers = []
+        self._lock = threading.Lock()
+
+    def publish(self, channel, data):
+        with self._lock:
+            handlers = list(self.handlers)
+        delivered = 0
+        for pattern, handler in handlers:
+            if fnmatch.fnmatchcase(channel, pattern):
+                handler({"type": "pmessage", "pattern": pattern, "channel": channel, "data": data})
+                delivered += 1
+        return delivered
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        return _InMemoryPubSub(self)
+
+
+class _InMemoryPubSub:
+    def __init__(self, client: InMemoryPubSubClient):
+        self.client = client
+
+    def psubscribe(self, **handlers):
+        with self.client._lock:
+            self.client.handlers.extend(handlers.items())
+
+    def run_in_thread(self, sleep_time=0, daemon=False):
+        return self
+
+    def stop(self):
+        with self.client._lock:
+            self.client.handlers = []
+
+
+class RedisPubSubBroker(PushBroker):
+    """
+    Брокер для нескольких узлов: PUBLISH в канал "<prefix><user_id>",
+    каждый узел слушает "<prefix>*" в фоновом потоке и раздаёт события
+    своим подпискам.
+
+    Без url и client используется REDIS_URL; без Redis брокер не
+    создаётся. InMemoryPubSubClient передаётся через client в тестах.
+    """
+
+    def __init__(self, url: str = None, client=None, channel_prefix: str = "push:", queue_size: int = 100):
+        super().__init__(queue_size)
+        self.channel_prefix = channel_prefix
+        self.client = client or self._connect(url or os.getenv("REDIS_URL"))
+        self._listener = None
+
+    @staticmethod
+    def _connect(url):
+        if not url:
+            raise ImproperlyConfigured(
+                "RedisPubSubBroker requires REDIS_URL or an explicit url/client"
+            )
+        try:
+            import redis
+        except ImportError:
+            raise ImproperlyConfigured(
+                "RedisPubSubBroker requires the 'redis' package"
+            ) from None
+        return redis.Redis.from_url(url)
+
+    def _ensure_listener(self) -> None:
+        with self._lock:
+            if self._listener is not None:
+                return
+            pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+            pubsub.psubscribe(**{f"{self.channel_prefix}*": self._on_message})
+            self._listener = pubsub.run_in_thread(sleep_time=0.1, daemon=True)
+
+    def _on_message(self, message) -> None:
+        channel = message["channel"]
+        data = message["data"]
+        if isinstance(channel, bytes):
+            channel = channel.decode()
+        try:
+            event = json.loads(data)
+        except (TypeError, ValueError):
+            logger.warning("push_message_invalid", channel=channel)
+            return
+        self.deliver_local([channel[len(self.channel_prefix):]], event)
+
+    def subscribe(self, user_id) -> Subscription:
+        self._ensure_listener()
+        return super().subscribe(user_id)
+
+    def publish(self, user_ids: List[str], event: dict) -> None:
+        data = json.dumps(event, ensure_ascii=False, default=str)
+        for user_id in user_ids:
+            self.client.publish(f"{self.channel_prefix}{user_id}", data)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker() -> PushBroker:
+    """Брокер процесса из настроек PUSH_BROKER и PUSH_BROKER_OPTIONS."""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                path = getattr(
+                    settings, "PUSH_BROKER", "api.services.push_service.InProcessBroker"
+                )
+                options = getattr(settings, "PUSH_BROKER_OPTIONS", {}) or {}
+                _broker = import_string(path)(**options)
+    return _broker
+
+
+def _publish(user_ids: List[str], event: dict) -> None:
+    try:
+        get_broker().publish(user_ids, event)
+    except Exception as exc:
+        # Push не должен ломать операцию, которая его вызвала
+        logger.warning("push_publish_failed", event_type=event["type"], error=str(exc))
+
+
+def push_to_users(user_ids: Iterable, event_type: str, payload: dict) -> None:
+    """
+    Отправить событие пользователям после коммита текущей транзакции.
+
+    Пустые id (заказ без покупателя, магазин без владельца) пропускаются.
+    """
+    targets = sorted({str(user_id) for user_id in user_ids if user_id})
+    if not targets:
+        return
+    event = {
+        "id": uuid.uuid4().hex,
+        "type": event_type,
+        "payload": payload,
+        "sent_at": timezone.now().isoformat(),
+    }
+    transaction.on_commit(lambda: _publish(targets, event))
@@ -0,0 +1,155 @@
+"""
+Отложенный пересчёт рейтингов.
+
+Отзывы и завершение заказов не пересчитывают рейтинги в транзакции
+запроса, а только помечают магазин и блюдо как требующие пересчёта.
+Пометки хранятся в Django cache и схлопываются: повторная пометка того
+же объекта до очередного прохода ничего не добавляет. Команда
+refresh_ratings (в цикле run_background_jobs) забирает пометки и
+пересчитывает каждый объект один раз через BulkRatingService.
+
+Как и в CounterService, пометки живут в поколениях: проход переключает
+поколение и читает ключи прежнего. Пометки, потерянные вместе с кэшем,
+догоняет ночной update_producer_ratings. С кэшем в памяти процесса
+(LocMemCache) фоновая команда пометок не увидит, поэтому объект
+пересчитывается сразу после коммита.
+"""
+
+from typing import List, Optional, Tuple
+
+from django.core.cache import cache
+from django.db import transaction
+
+from api.services.bulk_rating_service import BulkRatingService
+from core.cache import is_shared_cache
+from core.logging import get_logger
+
+logger = get_logger(__name__)
+
+
+class RatingRefreshQueue:
+    """Множество магазинов и блюд, ожидающих пересчёта рейтинга."""
+
+    PRODUCER = "producer"
+    DISH = "dish"
+
+    GENERATION_KEY = "ratings:dirty:generation"
+    SEQUENCE_KEY = "ratings:dirty:{generation}:seq"
+    ENTRY_KEY = "ratings:dirty:{generation}:entry:{index}"
+    MARK_KEY = "ratings:dirty:{generation}:{kind}:{pk}"
+    TIMEOUT = 24 * 3600
+    # Статусы заказа, которые входят в SLA-составляющую рейтинга
+    RATED_STATUSES = {"COMPLETED", "CANCELLED"}
+
+    def __init__(self, buffered: Optional[bool] = None):
+        # None - копить пометки, если кэш общий для процессов
+        self.buffered = buffered
+
+    def is_buffered(self) -> bool:
+        return is_shared_cache() if self.buffered is None else self.buffered
+
+    def _generation(self) -> int:
+        generation = cache.get(self.GENERATION_KEY)
+        if generation is None:
+            cache.add(self.GENERATION_KEY, 1, None)
+            generation = cache.get(self.GENERATION_KEY, 1)
+        return generation
+
+    def _mark_now(self, kind: str, pk) -> None:
+        generation = self._generation()
+        mark_key = self.MARK_KEY.format(generation=generation, kind=kind, pk=pk)
+        if not cache.add(mark_key, 1, self.TIMEOUT):
+            # Уже помечен в этом поколении
+            return
+        sequence_key = self.SEQUENCE_KEY.format(generation=generation)
+        try:
+            index = cache.incr(sequence_key)
+        except ValueError:
+            cache.add(sequence_key, 0, self.TIMEOUT)
+            index = cache.incr(sequence_key)
+        cache.set(
+            self.ENTRY_KEY.format(generation=generation, index=index),
+            (kind, str(pk)),
+            self.TIMEOUT,
+        )
+
+    def _refresh_now(self, kind: str, pk) -> None:
+        service = BulkRatingService()
+        if kind == self.PRODUCER:
+            service.recalc_producers([pk])
+        else:
+            service.recalc_dishes([pk])
+
+    def mark(self, kind: str, pk) -> None:
+        """
+        Пометить объект после коммита: проход, запущенный до коммита,
+        не должен забрать пометку и посчитать рейтинг по старым данным.
+        """
+        if pk is None:
+            return
+        if not self.is_buffered():
+            transaction.on_commit(lambda: self._refresh_now(kind, pk))
+            return
+        transaction.on_commit(lambda: self._mark_now(kind, pk))
+
+    def mark_producer(self, producer_id) -> None:
+        self.mark(self.PRODUCER, producer_id)
+
+    def mark_dish(self, dish_id) -> None:
+        self.mark(self.DISH, dish_id)
+
+    def mark_order(self, order) -> None:
+        """Пометить магазин и блюдо заказа."""
+        producer_id = order.producer_id or getattr(order.dish, "producer_id", None)
+        self.mark_producer(producer_id)
+        self.mark_dish(order.dish_id)
+
+    def on_status_change(self, order, previous_status) -> None:
+        """Завершённые и отменённые заказы меняют SLA-составляющую рейтинга магазина."""
+        if order.status != previous_status and order.status in self.RATED_STATUSES:
+            self.mark_producer(order.producer_id or getattr(order.dish, "producer_id", None))
+
+    def _take(self) -> Tuple[List[str], List[str]]:
+        """Забрать пометки текущего поколения: (магазины, блюда)."""
+        previous = self._generation()
+        try:
+            cache.incr(self.GENERATION_KEY)
+        except ValueError:
+            cache.set(self.GENERATION_KEY, previous + 1, None)
+
+        sequence_key = self.SEQUENCE_KEY.format(generation=previous)
+        count = cache.get(sequence_key) or 0
+        entry_keys = [
+            self.ENTRY_KEY.format(generation=previous, index=index)
+            for index in range(1, count + 1)
+        ]
+        entries = list(cache.get_many(entry_keys).values())
+        mark_keys = [
+            self.MARK_KEY.format(generation=previous, kind=kind, pk=pk) for kind, pk in entries
+        ]
+        cache.delete_many([sequence_key, *entry_keys, *mark_keys])
+
+        producers = sorted({pk for kind, pk in entries if kind == self.PRODUCER})
+        dishes = sorted({pk for kind, pk in entries if kind == self.DISH})
+        return producers, dishes
+
+    def refresh(self) -> Tuple[int, int]:
+        """
+        Пересчитать помеченные объекты, каждый один раз.
+
+        Магазины считаются раньше блюд: sort_score блюда зависит от
+        рейтинга магазина. Возвращает (магазинов, блюд) пересчитано.
+        """
+        producers, dishes = self._take()
+        if not producers and not dishes:
+            return 0, 0
+        service = BulkRatingService()
+        if producers:
+            service.recalc_producers(producers)
+        if dishes:
+            service.recalc_dishes(dishes)
+        logger.info("ratings_refreshed", producers=len(producers), dishes=len(dishes))
+        return len(producers), len(dishes)
+
+
+rating_refresh_queue = RatingRefreshQueue()
@@ -63,13 +63,16 @@ class RatingService:
             + self.config.dish_weight_appearance * review.rating_appearance
         ) / total_weight
 
+    # (максимальный возраст отзыва в днях, вес); более старые отзывы - OLD_REVIEW_WEIGHT
+    REVIEW_AGE_WEIGHTS = ((30, 1.0), (90, 0.7))
+    OLD_REVIEW_WEIGHT = 0.4
+
     def _review_weight(self, review: Review) -> float:
         age_days = (self._now() - review.created_at).days
-        if age_days <= 30:
-            return 1.0
-        if age_days <= 90:
-            return 0.7
-        return 0.4
+        for max_age_days, weight in self.REVIEW_AGE_WEIGHTS:
+            if age_days <= max_age_days:
+                return weight
+        return self.OLD_REVIEW_WEIGHT
 
     def _aggregate_reviews(self, qs):
         count = qs.count()
@@ -124,6 +127,11 @@ class RatingService:
         if total == 0:
             return 1.0
         sla_cancelled = orders.filter(status="CANCELLED", cancelled_by="SYSTEM").count()
+        return self._sla_score_from_counts(total, sla_cancelled)
+
+    def _sla_score_from_counts(self, total: int, sla_cancelled: int) -> float:
+        if total == 0:
+            return 1.0
         violation_rate = sla_cancelled / total
         threshold = self.config.sla_late_threshold
         violation_rate = min(violation_rate, threshold)
@@ -150,6 +158,11 @@ class RatingService:
         if total == 0:
             return 1.0
         lost = disputes.filter(status="RESOLVED_BUYER_WON").count()
+        return self._dispute_score_from_counts(orders_total, total, lost)
+
+    def _dispute_score_from_counts(self, orders_total: int, total: int, lost: int) -> float:
+        if orders_total == 0 or total == 0:
+            return 1.0
         dispute_rate = total / orders_total
         lost_rate = lost / total if total > 0 else 0.0
         dispute_rate = min(dispute_rate, self.config.dispute_rate_threshold)
@@ -3,13 +3,23 @@
 """
 
 import logging
+from datetime import datetime, timedelta
 from decimal import Decimal
-from typing import List
+from typing import Dict, List, Optional, Tuple
 
 from django.db import transaction
-from django.db.models import Count, F
+from django.db.models import Count, Exists, F, OuterRef, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 
-from api.models import Order, Producer, Profile
+from api.models import (
+    Dish,
+    JobCheckpoint,
+    Order,
+    Producer,
+    ProducerCustomerStats,
+    Profile,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -17,6 +27,12 @@ logger = logging.getLogger(__name__)
 class RepeatPurchaseService:
     """Сервис для управления повторными покупками."""
 
+    # JobCheckpoint с моментом начала последнего пересчёта (update_stats)
+    CHECKPOINT_NAME = "repeat_purchase_stats"
+    # Завершение, закоммиченное после начала прохода, отмечено временем до него
+    INCREMENTAL_LOOKBACK = timedelta(hours=1)
+    UPDATE_BATCH_SIZE = 500
+
     @transaction.atomic
     def track_order_completion(self, order: Order):
         """
@@ -75,31 +91,26 @@ class RepeatPurchaseService:
             f"User repeated orders: {profile.repeated_orders}"
         )
 
+    # Бонус к комиссии: минус 1% за каждого повторного покупателя, не более 10%
+    BONUS_PER_REPEAT_CUSTOMER = Decimal("0.01")
+    MAX_BONUS_CUSTOMERS = 10
+
+    @staticmethod
+    def _repeat_customers(producer: Producer):
+        """Строки ProducerCustomerStats покупателей магазина с >1 завершённым заказом."""
+        return ProducerCustomerStats.objects.filter(producer=producer, order_count__gt=1)
+
+    def _bonus_for(self, repeat_customers_count: int) -> Decimal:
+        return min(repeat_customers_count, self.MAX_BONUS_CUSTOMERS) * self.BONUS_PER_REPEAT_CUSTOMER
+
     def calculate_commission_bonus(self, producer: Producer) -> Decimal:
         """
         Рассчитать количество уникальных повторных покупателей.
         Вернуть бонус: минус 1% за каждого повторного покупателя.
         Максимальный бонус: -10% (чтобы комиссия не стала отрицательной).
         """
-        # Получаем список уникальных покупателей
-        customers = Order.objects.filter(
-            producer=producer,
-            status="COMPLETED"
-        ).values_list("user_id", flat=True).distinct()
-
-        # Считаем количество повторных покупателей (те, кто сделал >1 заказа)
-        repeat_customers_count = 0
-        for customer_id in customers:
-            order_count = Order.objects.filter(
-                producer=producer,
-                user_id=customer_id,
-                status="COMPLETED"
-            ).count()
-            if order_count > 1:
-                repeat_customers_count += 1
-
-        # Рассчитываем бонус: минус 1% за каждого повторного покупателя
-        bonus_percentage = min(repeat_customers_count, 10) * Decimal("0.01")
+        repeat_customers_count = self._repeat_customers(producer).count()
+        bonus_percentage = self._bonus_for(repeat_customers_count)
 
         logger.info(
             f"Producer {producer.id} has {repeat_customers_count} repeat customers. "
@@ -112,65 +123,212 @@ class RepeatPurchaseService:
         """
         Получить список покупателей, которые сделали >1 заказа.
         """
-        # Получаем всех покупателей с количеством заказов
-        customers_data = Order.objects.filter(
-            producer=producer,
-            status="COMPLETED"
-        ).values(
-            "user_id",
-            "user__first_name",
-            "user__last_name",
-            "user__email"
-        ).annotate(
-            order_count=Count("id"),
-            total_spent=F("total_price") * F("quantity")
-        ).filter(
-            order_count__gt=1
-        ).order_by("-order_count")
-
-        # Форматируем результат
-        result = []
-        for customer in customers_data:
-            result.append({
-                "user_id": str(customer["user_id"]),
-                "name": f"{customer['user__first_name'] or ''} {customer['user__last_name'] or ''}".strip(),
-                "email": customer["user__email"] or "",
-                "order_count": customer["order_count"],
-                "total_spent": float(customer["total_spent"]),
-            })
+        customers = (
+            self._repeat_customers(producer)
+            .select_related("user")
+            .only(
+                "order_count",
+                "total_spent",
+                "last_order_at",
+                "user__first_name",
+                "user__last_name",
+                "user__email",
+            )
+            .order_by("-order_count", "-last_order_at")
+        )
 
-        return result
+        return [
+            {
+                "user_id": str(customer.user_id),
+                "name": f"{customer.user.first_name or ''} {customer.user.last_name or ''}".strip(),
+                "email": customer.user.email or "",
+                "order_count": customer.order_count,
+                "total_spent": float(customer.total_spent),
+                "last_order_at": customer.last_order_at,
+            }
+            for customer in customers
+        ]
 
     def get_producer_repeat_stats(self, producer: Producer) -> dict:
         """
-        Получить статистику повторных покупок для магазина.
-        """
-        total_customers = Order.objects.filter(
-            producer=producer,
-            status="COMPLETED"
-        ).values_list("user_id", flat=True).distinct().count()
+        Получить статистику повторных покупок для магазина одним запросом.
 
-        repeat_customers = len(self.get_repeat_customers(producer))
-
-        total_orders = Order.objects.filter(
-            producer=producer,
-            status="COMPLETED"
-        ).count()
-
-        repeat_orders = Order.objects.filter(
-            producer=producer,
-            status="COMPLETED"
-        ).annotate(
-            customer_order_count=Count("user_id")
-        ).filter(customer_order_count__gt=1).count()
-
-        commission_bonus = self.calculate_commission_bonus(producer)
+        repeat_orders - заказы, сделанные покупателем не впервые
+        (order_count - 1 по каждому покупателю).
+        """
+        repeat = Q(order_count__gt=1)
+        stats = ProducerCustomerStats.objects.filter(producer=producer).aggregate(
+            total_customers=Count("id"),
+            repeat_customers=Count("id", filter=repeat),
+            total_orders=Coalesce(Sum("order_count"), 0),
+            repeat_orders=Coalesce(Sum(F("order_count") - 1, filter=repeat), 0),
+        )
+        total_customers = stats["total_customers"]
+        repeat_customers = stats["repeat_customers"]
+        commission_bonus = self._bonus_for(repeat_customers)
 
         return {
             "total_customers": total_customers,
             "repeat_customers": repeat_customers,
-            "total_orders": total_orders,
-            "repeat_orders": repeat_orders,
+            "total_orders": stats["total_orders"],
+            "repeat_orders": stats["repeat_orders"],
             "repeat_rate": (repeat_customers / total_customers * 100) if total_customers > 0 else 0,
             "commission_bonus_percentage": float(commission_bonus * 100),
         }
+
+    # ------------------------------------------------------------------
+    # Пересчёт статистики множествами
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _completed_orders():
+        """
+        Завершённые заказы с признаком is_repeat: у покупателя есть более
+        ранний завершённый заказ в том же магазине.
+        """
+        earlier = Order.objects.filter(
+            status="COMPLETED",
+            user_id=OuterRef("user_id"),
+            producer_id=OuterRef("producer_id"),
+            created_at__lt=OuterRef("created_at"),
+        )
+        return Order.objects.filter(
+            status="COMPLETED", user__isnull=False, producer__isnull=False
+        ).annotate(is_repeat=Exists(earlier))
+
+    @staticmethod
+    def _repeat_rate(repeated: int, total: int) -> Decimal:
+        if total <= 0:
+            return Decimal("0.00")
+        return (Decimal(repeated) / Decimal(total) * Decimal("100")).quantize(Decimal("0.01"))
+
+    def _recompute_profiles(self, user_ids=None) -> int:
+        orders = self._completed_orders()
+        if user_ids is not None:
+            orders = orders.filter(user_id__in=user_ids)
+        stats: Dict[int, Tuple[int, int]] = {
+            row["user_id"]: (row["total"], row["repeated"])
+            for row in orders.values("user_id")
+            .annotate(total=Count("id"), repeated=Count("id", filter=Q(is_repeat=True)))
+            .order_by()
+        }
+
+        profiles = Profile.objects.only(
+            "id", "user_id", "total_orders", "repeated_orders", "repeat_purchase_rate"
+        )
+        if user_ids is not None:
+            profiles = profiles.filter(user_id__in=user_ids)
+
+        changed = []
+        seen = set()
+        for profile in profiles.iterator(chunk_size=self.UPDATE_BATCH_SIZE):
+            seen.add(profile.user_id)
+            total, repeated = stats.get(profile.user_id, (0, 0))
+            rate = self._repeat_rate(repeated, total)
+            if (profile.total_orders, profile.repeated_orders, profile.repeat_purchase_rate) != (
+                total,
+                repeated,
+                rate,
+            ):
+                profile.total_orders = total
+                profile.repeated_orders = repeated
+                profile.repeat_purchase_rate = rate
+                changed.append(profile)
+        Profile.objects.bulk_update(
+            changed,
+            ["total_orders", "repeated_orders", "repeat_purchase_rate"],
+            batch_size=self.UPDATE_BATCH_SIZE,
+        )
+
+        missing = [
+            Profile(
+                user_id=user_id,
+                total_orders=total,
+                repeated_orders=repeated,
+                repeat_purchase_rate=self._repeat_rate(repeated, total),
+            )
+            for user_id, (total, repeated) in stats.items()
+            if user_id not in seen
+        ]
+        Profile.objects.bulk_create(missing, batch_size=self.UPDATE_BATCH_SIZE)
+        return len(changed) + len(missing)
+
+    def _recompute_dishes(self, dish_ids=None) -> int:
+        orders = self._completed_orders().filter(is_repeat=True)
+        if dish_ids is not None:
+            orders = orders.filter(dish_id__in=dish_ids)
+        counts = {
+            row["dish_id"]: row["repeats"]
+            for row in orders.values("dish_id").annotate(repeats=Count("id")).order_by()
+        }
+
+        dishes = Dish.objects.only("id", "repeat_purchase_count")
+        if dish_ids is not None:
+            dishes = dishes.filter(id__in=dish_ids)
+        changed = []
+        for dish in dishes.iterator(chunk_size=self.UPDATE_BATCH_SIZE):
+            count = counts.get(dish.id, 0)
+            if dish.repeat_purchase_count != count:
+                dish.repeat_purchase_count = count
+                changed.append(dish)
+        Dish.objects.bulk_update(
+            changed, ["repeat_purchase_count"], batch_size=self.UPDATE_BATCH_SIZE
+        )
+        return len(changed)
+
+    @transaction.atomic
+    def recompute_stats(self, since: Optional[datetime] = None) -> Tuple[int, int]:
+        """
+        Пересчитать Profile.total_orders/repeated_orders/repeat_purchase_rate
+        и Dish.repeat_purchase_count групповыми запросами.
+
+        С since пересчитываются только покупатели заказов, которые вошли в
+        COMPLETED или вышли из него (completion_changed_at) не раньше since,
+        и блюда всех завершённых заказов этих покупателей у тех же магазинов:
+        is_repeat зависит от более ранних заказов пары (покупатель, магазин).
+        Пересчёт идемпотентен. Возвращает (профилей, блюд) обновлено.
+        """
+        user_ids = dish_ids = None
+        if since is not None:
+            recent = Order.objects.filter(completion_changed_at__gte=since)
+            user_ids = set(recent.exclude(user__isnull=True).values_list("user_id", flat=True))
+            # Пары сужаются до покупателей и магазинов по отдельности: лишние
+            # блюда лишь пересчитываются впустую
+            pairs = recent.filter(user__isnull=False, producer__isnull=False)
+            dish_ids = set(
+                Order.objects.filter(
+                    Q(completion_changed_at__gte=since)
+                    | Q(
+                        status="COMPLETED",
+                        user_id__in=pairs.values("user_id"),
+                        producer_id__in=pairs.values("producer_id"),
+                    )
+                ).values_list("dish_id", flat=True)
+            )
+            if not user_ids and not dish_ids:
+                return 0, 0
+        return self._recompute_profiles(user_ids), self._recompute_dishes(dish_ids)
+
+    def update_stats(self, full: bool = False) -> Tuple[int, int]:
+        """
+        Ночной пересчёт: инкрементально от прошлой контрольной точки
+        (с запасом INCREMENTAL_LOOKBACK), полностью - при full или если
+        контрольной точки нет.
+        """
+        started_at = timezone.now()
+        checkpoint = (
+            None
+            if full
+            else JobCheckpoint.objects.filter(name=self.CHECKPOINT_NAME)
+            .values_list("value", flat=True)
+            .first()
+        )
+        since = checkpoint - self.INCREMENTAL_LOOKBACK if checkpoint else None
+        result = self.recompute_stats(since)
+        if not JobCheckpoint.objects.filter(name=self.CHECKPOINT_NAME).update(value=started_at):
+            JobCheckpoint.objects.create(name=self.CHECKPOINT_NAME, value=started_at)
+        logger.info(
+            f"Repeat purchase stats updated ({'incremental' if since else 'full'}): "
+            f"{result[0]} profiles, {result[1]} dishes"
+        )
+        return result
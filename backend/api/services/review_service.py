@@ -380,10 +380,9 @@ class ReviewService:
         # Возвращаем деньги покупателю
         ReviewService._refund_buyer_for_correction(review)
 
-        # Пересчитываем рейтинг магазина
-        from .rating_service import RatingService
-        rating_service = RatingService()
-        rating_service.recalc_for_producer(review.producer)
+        # Помечаем рейтинг магазина к пересчёту
+        from .rating_refresh_service import rating_refresh_queue
+        rating_refresh_queue.mark_producer(review.producer_id)
 
         logger.info(f"Review correction accepted for review {review.id} by buyer {buyer.id}")
         return review
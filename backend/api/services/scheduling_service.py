@@ -1,7 +1,8 @@
 """Scheduling service for calculating available delivery time slots."""
 
+from bisect import bisect_right
 from datetime import date, datetime, time, timedelta
-from typing import List, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 
 from django.utils import timezone
 
@@ -13,6 +14,15 @@ class SchedulingService:
     MAX_ADVANCE_DAYS = 7
     PREP_BUFFER_MINUTES = 30
     ACCEPTANCE_BUFFER_HOURS = 2
+    # Order statuses (Order.STATUS_CHOICES) that occupy a delivery slot
+    ACTIVE_SLOT_STATUSES = [
+        'WAITING_FOR_PAYMENT',
+        'WAITING_FOR_ACCEPTANCE',
+        'COOKING',
+        'READY_FOR_REVIEW',
+        'READY_FOR_DELIVERY',
+        'DELIVERING',
+    ]
 
     def get_available_time_slots(
         self,
@@ -25,6 +35,9 @@ class SchedulingService:
         """
         Calculate available time slots for a specific date.
 
+        Slot occupancy for the whole day is loaded with a single grouped
+        query (see ``_load_slot_occupancy``) instead of one COUNT per slot.
+
         Args:
             producer: The seller/producer
             dish: The dish being ordered
@@ -42,17 +55,49 @@ class SchedulingService:
                 "remaining_capacity": 3  # if limit is set
             }
         """
-        from api.models import Order
+        calendar = self.get_available_time_slots_for_range(
+            producer,
+            dish,
+            quantity,
+            start_date=target_date,
+            days=1,
+            delivery_time_minutes=delivery_time_minutes,
+        )
+        return calendar[0]["slots"]
 
-        slots = []
+    def get_available_time_slots_for_range(
+        self,
+        producer,
+        dish,
+        quantity: int,
+        start_date: Optional[date] = None,
+        days: Optional[int] = None,
+        delivery_time_minutes: int = None
+    ) -> List[dict]:
+        """
+        Calculate available time slots for several consecutive days.
 
-        # Get working hours for this date
-        working_hours = self._get_working_hours_for_date(producer, target_date)
-        if not working_hours:
-            # Closed on this day
-            return []
+        All scheduled orders of the producer inside the window are fetched
+        in one round trip and bucketed in memory, so a full
+        ``MAX_ADVANCE_DAYS`` calendar costs at most one query.
 
-        start_time, end_time = working_hours
+        Args:
+            producer: The seller/producer
+            dish: The dish being ordered
+            quantity: Number of items
+            start_date: First date of the window (defaults to today)
+            days: Number of days (defaults to MAX_ADVANCE_DAYS)
+            delivery_time_minutes: Delivery time override
+
+        Returns:
+            List of {"date": "YYYY-MM-DD", "slots": [...]} dictionaries,
+            one per day, slots in the same format as get_available_time_slots.
+        """
+        now = timezone.now()
+        if start_date is None:
+            start_date = timezone.localdate(now)
+        if days is None:
+            days = self.MAX_ADVANCE_DAYS
 
         # Calculate earliest possible delivery time
         delivery_mins = delivery_time_minutes or producer.delivery_time_minutes
@@ -60,68 +105,136 @@ class SchedulingService:
             dish, quantity, delivery_mins
         )
 
-        # Generate slots for the day
-        current_slot = datetime.combine(target_date, start_time)
-        end_datetime = datetime.combine(target_date, end_time)
+        # Generate slot starts for every open day of the window
+        day_slots = []
+        for offset in range(days):
+            target_date = start_date + timedelta(days=offset)
+            day_slots.append((target_date, self._generate_slot_starts(producer, target_date)))
+
+        occupancy = {}
+        all_starts = [slot for _, starts in day_slots for slot in starts]
+        if producer.max_orders_per_slot > 0 and all_starts:
+            occupancy = self._load_slot_occupancy(producer, all_starts)
+
+        calendar = []
+        for target_date, starts in day_slots:
+            slots = [
+                self._build_slot(producer, slot_start, now, earliest_possible, occupancy)
+                for slot_start in starts
+            ]
+            calendar.append({"date": target_date.isoformat(), "slots": slots})
+        return calendar
+
+    def _generate_slot_starts(self, producer, target_date: date) -> List[datetime]:
+        """Return timezone-aware slot starts for a date (empty if closed)."""
+        # Get working hours for this date
+        working_hours = self._get_working_hours_for_date(producer, target_date)
+        if not working_hours:
+            # Closed on this day
+            return []
+
+        start_time, end_time = working_hours
 
         # Make timezone-aware
-        current_slot = timezone.make_aware(current_slot)
-        end_datetime = timezone.make_aware(end_datetime)
+        current_slot = timezone.make_aware(datetime.combine(target_date, start_time))
+        end_datetime = timezone.make_aware(datetime.combine(target_date, end_time))
 
+        starts = []
         while current_slot <= end_datetime:
-            is_available = True
-            reason = None
-            remaining_capacity = None
+            starts.append(current_slot)
+            current_slot += timedelta(minutes=self.SLOT_INTERVAL_MINUTES)
+        return starts
 
-            # Check if slot is in the past
-            if current_slot < timezone.now():
-                is_available = False
-                reason = "Время прошло"
+    def _load_slot_occupancy(self, producer, slot_starts: List[datetime]) -> Dict[datetime, int]:
+        """
+        Read slot counters for the window covered by slot_starts with one query.
 
-            # Check if there's enough preparation time
-            elif current_slot < earliest_possible:
-                is_available = False
-                reason = f"Недостаточно времени на подготовку (минимум {earliest_possible.strftime('%H:%M')})"
+        Counters are keyed by ``get_slot_start`` and assigned to the generated
+        slot ``[start, start + SLOT_INTERVAL)`` that contains them.
 
-            # Check acceptance buffer (seller needs time to accept)
-            elif current_slot < timezone.now() + timedelta(hours=self.ACCEPTANCE_BUFFER_HOURS):
-                is_available = False
-                reason = "Слишком скоро (нужно минимум 2 часа)"
-
-            # Check slot capacity
-            if is_available and producer.max_orders_per_slot > 0:
-                slot_start = current_slot
-                slot_end = current_slot + timedelta(minutes=self.SLOT_INTERVAL_MINUTES)
-
-                # Count orders in this slot
-                orders_in_slot = Order.objects.filter(
-                    producer=producer,
-                    scheduled_delivery_time__gte=slot_start,
-                    scheduled_delivery_time__lt=slot_end,
-                    status__in=['WAITING_FOR_PAYMENT', 'PENDING', 'ACCEPTED', 'READY', 'IN_DELIVERY']
-                ).count()
-
-                remaining_capacity = producer.max_orders_per_slot - orders_in_slot
-
-                if orders_in_slot >= producer.max_orders_per_slot:
-                    is_available = False
-                    reason = f"Слот заполнен ({orders_in_slot}/{producer.max_orders_per_slot})"
-
-            slot_data = {
-                "time": current_slot.isoformat(),
-                "display": current_slot.strftime("%H:%M"),
-                "available": is_available,
-                "reason": reason
-            }
+        Returns:
+            {slot_start: orders_count} for slots that have orders
+        """
+        from api.models import SlotOccupancy
+
+        interval = timedelta(minutes=self.SLOT_INTERVAL_MINUTES)
+        window_start = self.get_slot_start(slot_starts[0])
+        window_end = slot_starts[-1] + interval
+
+        rows = SlotOccupancy.objects.filter(
+            producer=producer,
+            slot_start__gte=window_start,
+            slot_start__lt=window_end,
+            orders_count__gt=0,
+        ).values_list("slot_start", "orders_count")
+
+        occupancy = {}
+        for counter_start, orders_count in rows:
+            index = bisect_right(slot_starts, counter_start) - 1
+            if index < 0:
+                continue
+            slot_start = slot_starts[index]
+            # Slots of different days are not contiguous
+            if counter_start >= slot_start + interval:
+                continue
+            occupancy[slot_start] = occupancy.get(slot_start, 0) + orders_count
+        return occupancy
+
+    @classmethod
+    def get_slot_start(cls, scheduled_time: datetime) -> datetime:
+        """Return the start of the slot grid cell (local time) containing scheduled_time."""
+        local_time = timezone.localtime(scheduled_time)
+        minute = (local_time.minute // cls.SLOT_INTERVAL_MINUTES) * cls.SLOT_INTERVAL_MINUTES
+        return local_time.replace(minute=minute, second=0, microsecond=0)
+
+    def _build_slot(
+        self,
+        producer,
+        slot_start: datetime,
+        now: datetime,
+        earliest_possible: datetime,
+        occupancy: Dict[datetime, int],
+    ) -> dict:
+        """Build a single slot payload from precomputed occupancy."""
+        is_available = True
+        reason = None
+        remaining_capacity = None
+
+        # Check if slot is in the past
+        if slot_start < now:
+            is_available = False
+            reason = "Время прошло"
+
+        # Check if there's enough preparation time
+        elif slot_start < earliest_possible:
+            is_available = False
+            reason = f"Недостаточно времени на подготовку (минимум {earliest_possible.strftime('%H:%M')})"
+
+        # Check acceptance buffer (seller needs time to accept)
+        elif slot_start < now + timedelta(hours=self.ACCEPTANCE_BUFFER_HOURS):
+            is_available = False
+            reason = "Слишком скоро (нужно минимум 2 часа)"
+
+        # Check slot capacity
+        if is_available and producer.max_orders_per_slot > 0:
+            orders_in_slot = occupancy.get(slot_start, 0)
+            remaining_capacity = producer.max_orders_per_slot - orders_in_slot
 
-            if remaining_capacity is not None:
-                slot_data["remaining_capacity"] = remaining_capacity
+            if orders_in_slot >= producer.max_orders_per_slot:
+                is_available = False
+                reason = f"Слот заполнен ({orders_in_slot}/{producer.max_orders_per_slot})"
 
-            slots.append(slot_data)
+        slot_data = {
+            "time": slot_start.isoformat(),
+            "display": slot_start.strftime("%H:%M"),
+            "available": is_available,
+            "reason": reason
+        }
 
-            current_slot += timedelta(minutes=self.SLOT_INTERVAL_MINUTES)
+        if remaining_capacity is not None:
+            slot_data["remaining_capacity"] = remaining_capacity
 
-        return slots
+        return slot_data
 
     def validate_scheduled_time(
         self,
@@ -137,8 +250,6 @@ class SchedulingService:
         Returns:
             (is_valid, error_message)
         """
-        from api.models import Order
-
         now = timezone.now()
 
         # Check 1: Not in the past
@@ -166,15 +277,9 @@ class SchedulingService:
 
         # Check 6: Slot capacity
         if producer.max_orders_per_slot > 0:
-            slot_start = scheduled_time.replace(minute=(scheduled_time.minute // self.SLOT_INTERVAL_MINUTES) * self.SLOT_INTERVAL_MINUTES, second=0, microsecond=0)
-            slot_end = slot_start + timedelta(minutes=self.SLOT_INTERVAL_MINUTES)
-
-            orders_in_slot = Order.objects.filter(
-                producer=producer,
-                scheduled_delivery_time__gte=slot_start,
-                scheduled_delivery_time__lt=slot_end,
-                status__in=['WAITING_FOR_PAYMENT', 'PENDING', 'ACCEPTED', 'READY', 'IN_DELIVERY']
-            ).count()
+            from .slot_occupancy_service import SlotOccupancyService
+
+            orders_in_slot = SlotOccupancyService().get_count(producer, scheduled_time)
 
             if orders_in_slot >= producer.max_orders_per_slot:
                 return False, "Выбранное время уже заполнено. Пожалуйста, выберите другое время"
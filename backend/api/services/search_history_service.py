@@ -0,0 +1,195 @@
+"""
+Буферизованная запись истории поиска.
+
+Запросы автодополнения не пишут SearchHistory синхронно: записи
+накапливаются в памяти процесса и сохраняются пачками через bulk_create
+фоновым потоком - по достижении размера пачки или по таймеру. При
+переполнении буфера записи отбрасываются, запрос не замедляется.
+
+Тот же буфер ведёт скользящий агрегат популярных запросов за последние
+сутки, которым автодополнение отвечает на пустой запрос.
+"""
+
+import atexit
+import re
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count
+from django.utils import timezone
+
+from api.models import SearchHistory
+from core.logging import get_logger
+
+logger = get_logger(__name__)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+QUERY_MAX_LENGTH = SearchHistory._meta.get_field("query").max_length
+
+
+class SearchHistoryBuffer:
+    """Очередь записей SearchHistory и счётчики популярных запросов."""
+
+    # Ширина корзины и окно агрегата популярных запросов (секунды)
+    POPULAR_BUCKET_SECONDS = 3600
+    POPULAR_WINDOW_SECONDS = 24 * 3600
+    # Сколько запросов загружать из БД при первом обращении к агрегату
+    POPULAR_WARMUP_LIMIT = 100
+
+    def __init__(
+        self,
+        max_pending: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        flush_interval: Optional[float] = None,
+    ):
+        self.max_pending = max_pending or getattr(settings, "SEARCH_HISTORY_BUFFER_SIZE", 1000)
+        self.batch_size = batch_size or getattr(settings, "SEARCH_HISTORY_FLUSH_BATCH", 100)
+        self.flush_interval = flush_interval or getattr(
+            settings, "SEARCH_HISTORY_FLUSH_INTERVAL", 5.0
+        )
+        self.dropped = 0
+        self._pending: List[SearchHistory] = []
+        self._popular: Dict[int, Counter] = {}
+        self._popular_warmed = False
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        return _WHITESPACE_RE.sub(" ", (query or "").strip().lower())[:QUERY_MAX_LENGTH]
+
+    def _bucket(self, now: float) -> int:
+        return int(now // self.POPULAR_BUCKET_SECONDS)
+
+    def _prune_popular(self, current_bucket: int) -> None:
+        oldest = current_bucket - self.POPULAR_WINDOW_SECONDS // self.POPULAR_BUCKET_SECONDS + 1
+        for bucket in [bucket for bucket in self._popular if bucket < oldest]:
+            del self._popular[bucket]
+
+    def record(self, user, query: str, results_count: int) -> bool:
+        """
+        Поставить запрос в очередь на запись и учесть его в популярных.
+
+        Анонимные запросы только учитываются в агрегате. Возвращает False,
+        если запись истории отброшена из-за переполнения буфера.
+        """
+        normalized = self.normalize_query(query)
+        if not normalized:
+            return False
+        if not self._popular_warmed:
+            self._warm_popular()
+
+        accepted = True
+        with self._lock:
+            if results_count > 0:
+                bucket = self._bucket(time.time())
+                self._popular.setdefault(bucket, Counter())[normalized] += 1
+                self._prune_popular(bucket)
+
+            if user is not None and getattr(user, "is_authenticated", False):
+                if len(self._pending) >= self.max_pending:
+                    self.dropped += 1
+                    accepted = False
+                else:
+                    self._pending.append(
+                        SearchHistory(
+                            user_id=user.pk,
+                            query=query.strip()[:QUERY_MAX_LENGTH],
+                            results_count=results_count,
+                        )
+                    )
+                    if len(self._pending) >= self.batch_size:
+                        self._wakeup.set()
+
+        if not accepted and (self.dropped == 1 or self.dropped % 100 == 0):
+            logger.warning("search_history_dropped", dropped=self.dropped)
+        if getattr(settings, "SEARCH_HISTORY_ASYNC", True):
+            self._ensure_thread()
+        elif self._wakeup.is_set():
+            # Без фонового потока пачка пишется в текущем запросе
+            self.flush()
+        return accepted
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self) -> int:
+        """Сохранить накопленные записи; возвращает число записанных строк."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+                self._wakeup.clear()
+            if not batch:
+                return 0
+            try:
+                SearchHistory.objects.bulk_create(batch, batch_size=self.batch_size)
+            except Exception as exc:
+                # История поиска не критична: теряем пачку, но не роняем поток
+                logger.error("search_history_flush_failed", error=str(exc), count=len(batch))
+                return 0
+            return len(batch)
+
+    def _warm_popular(self) -> None:
+        """
+        Заполнить агрегат из SearchHistory при первом обращении к буферу,
+        до того как он запишет свои пачки, чтобы не учесть их дважды.
+        """
+        since = timezone.now() - timedelta(seconds=self.POPULAR_WINDOW_SECONDS)
+        rows = (
+            SearchHistory.objects.filter(created_at__gte=since, results_count__gt=0)
+            .values("query")
+            .annotate(total=Count("id"))
+            .order_by("-total")[: self.POPULAR_WARMUP_LIMIT]
+        )
+        seed = Counter()
+        for row in rows:
+            normalized = self.normalize_query(row["query"])
+            if normalized:
+                seed[normalized] += row["total"]
+        with self._lock:
+            if not self._popular_warmed:
+                self._popular.setdefault(self._bucket(time.time()), Counter()).update(seed)
+                self._popular_warmed = True
+
+    def popular_queries(self, limit: int = 10) -> List[dict]:
+        """Популярные запросы за окно агрегата: [{"query", "count"}]."""
+        if not self._popular_warmed:
+            self._warm_popular()
+        with self._lock:
+            self._prune_popular(self._bucket(time.time()))
+            totals = Counter()
+            for counter in self._popular.values():
+                totals.update(counter)
+        return [{"query": query, "count": count} for query, count in totals.most_common(limit)]
+
+    def _ensure_thread(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(
+                target=self._run, name="search-history-flusher", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            try:
+                self.flush()
+            finally:
+                # Поток держит собственное соединение с БД
+                connection.close()
+
+
+search_history_buffer = SearchHistoryBuffer()
+atexit.register(search_history_buffer.flush)
@@ -0,0 +1,251 @@
+"""
+Полнотекстовый поиск блюд.
+
+Индекс хранится в DishSearchDocument: стеммированный текст названия (title)
+и описания, состава, категории и магазина (body). Поверх таблицы миграция
+создаёт индекс конкретной СУБД: tsvector + GIN в PostgreSQL и FTS5 с
+префиксными индексами в SQLite. Для прочих СУБД используется LIKE.
+"""
+
+import re
+import uuid
+from typing import Dict, List
+
+from django.db import connection
+from django.db.models import Q
+
+from api.models import Dish, DishSearchDocument
+
+# ---------------------------------------------------------------------------
+# Стемминг (Snowball, русский язык)
+# ---------------------------------------------------------------------------
+
+_VOWELS = "аеиоуыэюя"
+_PERFECTIVE_GERUND = re.compile(r"(?:(?<=[ая])(?:в|вши|вшись)|ив|ивши|ившись|ыв|ывши|ывшись)$")
+_REFLEXIVE = re.compile(r"(?:ся|сь)$")
+_ADJECTIVE = r"(?:ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых|ую|юю|ая|яя|ою|ею)"
+_PARTICIPLE = r"(?:(?<=[ая])(?:ем|нн|вш|ющ|щ)|ивш|ывш|ующ)"
+_ADJECTIVAL = re.compile(rf"{_PARTICIPLE}?{_ADJECTIVE}$")
+_VERB = re.compile(
+    r"(?:(?<=[ая])(?:ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)"
+    r"|ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|ено|ят|ует|уют"
+    r"|ит|ыт|ены|ить|ыть|ишь|ую|ю)$"
+)
+_NOUN = re.compile(
+    r"(?:а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|ем|ам|ом|о|у"
+    r"|ах|иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$"
+)
+_DERIVATIONAL = re.compile(r"(?:ост|ость)$")
+_SUPERLATIVE = re.compile(r"(?:ейше|ейш)$")
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _regions(word: str):
+    rv = r1 = r2 = len(word)
+    for i, ch in enumerate(word):
+        if ch in _VOWELS:
+            rv = i + 1
+            break
+    for i in range(1, len(word)):
+        if word[i - 1] in _VOWELS and word[i] not in _VOWELS:
+            r1 = i + 1
+            break
+    for i in range(r1 + 1, len(word)):
+        if word[i - 1] in _VOWELS and word[i] not in _VOWELS:
+            r2 = i + 1
+            break
+    return rv, r2
+
+
+def _cut(pattern, text: str):
+    match = pattern.search(text)
+    if match is None:
+        return text, False
+    return text[: match.start()], True
+
+
+def stem(word: str) -> str:
+    """Основа русского слова по алгоритму Snowball; прочие слова не меняются."""
+    word = word.lower().replace("ё", "е")
+    rv, r2 = _regions(word)
+    head, tail = word[:rv], word[rv:]
+
+    tail, found = _cut(_PERFECTIVE_GERUND, tail)
+    if not found:
+        tail, _ = _cut(_REFLEXIVE, tail)
+        for pattern in (_ADJECTIVAL, _VERB, _NOUN):
+            tail, found = _cut(pattern, tail)
+            if found:
+                break
+
+    if tail.endswith("и"):
+        tail = tail[:-1]
+
+    match = _DERIVATIONAL.search(tail)
+    if match and rv + match.start() >= r2:
+        tail = tail[: match.start()]
+
+    tail, found = _cut(_SUPERLATIVE, tail)
+    if tail.endswith("нн"):
+        tail = tail[:-1]
+    elif not found and tail.endswith("ь"):
+        tail = tail[:-1]
+    return head + tail
+
+
+def tokenize(text: str) -> List[str]:
+    return [token.lower() for token in _TOKEN_RE.findall(text or "")]
+
+
+def normalize(text: str) -> str:
+    """Стеммированный текст для индексации."""
+    return " ".join(stem(token) for token in tokenize(text))
+
+
+# ---------------------------------------------------------------------------
+# Сервис поиска
+# ---------------------------------------------------------------------------
+
+
+class DishSearchService:
+    """Индексация и ранжированный поиск блюд."""
+
+    # Поля Dish, изменение которых требует переиндексации
+    INDEXED_FIELDS = {"name", "description", "composition", "category", "producer"}
+    # Сколько кандидатов берём из индекса для смешанного ранжирования
+    CANDIDATES_LIMIT = 200
+    # Вес релевантности и sort_score в итоговой оценке
+    RELEVANCE_WEIGHT = 0.7
+    SORT_SCORE_WEIGHT = 0.3
+    MIN_PREFIX_LENGTH = 2
+
+    def build_document(self, dish: Dish) -> Dict[str, str]:
+        body_parts = [
+            dish.description,
+            dish.composition,
+            dish.category.name if dish.category_id else "",
+            dish.producer.name if dish.producer_id else "",
+        ]
+        return {
+            "title": normalize(dish.name),
+            "body": normalize(" ".join(part for part in body_parts if part)),
+        }
+
+    def index_dish(self, dish: Dish) -> None:
+        DishSearchDocument.objects.update_or_create(
+            dish=dish, defaults=self.build_document(dish)
+        )
+
+    def index_dishes(self, dishes) -> int:
+        count = 0
+        for dish in dishes:
+            self.index_dish(dish)
+            count += 1
+        return count
+
+    def rebuild(self) -> int:
+        """Полная переиндексация всех блюд."""
+        DishSearchDocument.objects.all().delete()
+        return self.index_dishes(
+            Dish.objects.select_related("category", "producer").iterator()
+        )
+
+    def _query_terms(self, query: str, prefix: bool) -> List[tuple]:
+        """[(term, is_prefix)] для запроса; при prefix последний токен ищется как префикс."""
+        tokens = tokenize(query)
+        terms = []
+        for index, token in enumerate(tokens):
+            is_last = index == len(tokens) - 1
+            if prefix and is_last:
+                term = stem(token)
+                if len(term) < self.MIN_PREFIX_LENGTH:
+                    term = token
+                terms.append((term, True))
+            else:
+                terms.append((stem(token), False))
+        return terms
+
+    def _match(self, terms: List[tuple]) -> Dict[uuid.UUID, tuple]:
+        """{dish_id: (relevance, sort_score)} для кандидатов из индекса."""
+        vendor = connection.vendor
+        if vendor == "postgresql":
+            sql, params = self._postgres_query(terms)
+        elif vendor == "sqlite":
+            sql, params = self._sqlite_query(terms)
+        else:
+            return self._like_match(terms)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+        return {
+            uuid.UUID(str(dish_id)): (float(relevance or 0), float(sort_score or 0))
+            for dish_id, relevance, sort_score in rows
+        }
+
+    def _postgres_query(self, terms):
+        tsquery = " & ".join(f"{term}:*" if is_prefix else term for term, is_prefix in terms)
+        sql = (
+            "SELECT d.dish_id, ts_rank(d.search_vector, q) AS relevance, dish.sort_score "
+            "FROM api_dishsearchdocument d "
+            "JOIN api_dish dish ON dish.id = d.dish_id, "
+            "to_tsquery('simple', %s) q "
+            "WHERE d.search_vector @@ q "
+            "ORDER BY relevance DESC LIMIT %s"
+        )
+        return sql, [tsquery, self.CANDIDATES_LIMIT]
+
+    def _sqlite_query(self, terms):
+        match = " ".join(f'"{term}"*' if is_prefix else f'"{term}"' for term, is_prefix in terms)
+        sql = (
+            "SELECT d.dish_id, -bm25(api_dishsearch_fts, 10.0, 1.0) AS relevance, dish.sort_score "
+            "FROM api_dishsearch_fts "
+            "JOIN api_dishsearchdocument d ON d.id = api_dishsearch_fts.rowid "
+            "JOIN api_dish dish ON dish.id = d.dish_id "
+            "WHERE api_dishsearch_fts MATCH %s "
+            "ORDER BY bm25(api_dishsearch_fts, 10.0, 1.0) LIMIT %s"
+        )
+        return sql, [match, self.CANDIDATES_LIMIT]
+
+    def _like_match(self, terms):
+        documents = DishSearchDocument.objects.all()
+        for term, _ in terms:
+            documents = documents.filter(Q(title__contains=term) | Q(body__contains=term))
+        rows = documents.values_list("dish_id", "title", "dish__sort_score")[
+            : self.CANDIDATES_LIMIT
+        ]
+        return {
+            dish_id: (sum(title.count(term) for term, _ in terms) + 1.0, sort_score)
+            for dish_id, title, sort_score in rows
+        }
+
+    def rank(self, query: str, prefix: bool = False) -> List[uuid.UUID]:
+        """
+        Id блюд по убыванию смешанной оценки: релевантность и sort_score,
+        каждая нормированная на максимум среди кандидатов.
+        """
+        terms = self._query_terms(query, prefix)
+        if not terms:
+            return []
+        matches = self._match(terms)
+        if not matches:
+            return []
+        max_relevance = max(relevance for relevance, _ in matches.values()) or 1.0
+        max_sort_score = max(sort_score for _, sort_score in matches.values()) or 1.0
+
+        def score(item):
+            relevance, sort_score = item[1]
+            return (
+                self.RELEVANCE_WEIGHT * relevance / max_relevance
+                + self.SORT_SCORE_WEIGHT * max(sort_score, 0) / max_sort_score
+            )
+
+        return [dish_id for dish_id, _ in sorted(matches.items(), key=score, reverse=True)]
+
+    def search(self, queryset, query: str, limit: int = None, prefix: bool = False) -> List[Dish]:
+        """Блюда из queryset, найденные по запросу, в порядке ранжирования."""
+        ranked_ids = self.rank(query, prefix=prefix)
+        if not ranked_ids:
+            return []
+        positions = {dish_id: index for index, dish_id in enumerate(ranked_ids)}
+        dishes = sorted(queryset.filter(id__in=ranked_ids), key=lambda d: positions[d.id])
+        return dishes[:limit] if limit else dishes
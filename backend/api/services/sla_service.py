@@ -11,6 +11,7 @@ from api.models import Order, Payment
 from .notifications import NotificationService
 from .order_finance_service import OrderFinanceService
 from .order_status import OrderStatusService
+from .order_summary_service import OrderSummaryService
 from .payment_service import PaymentService
 from .penalties import PenaltyService
 from .rating_service import RatingService
@@ -52,6 +53,7 @@ class SLAService:
         self.penalties = penalties or PenaltyService()
         self.payments = payments or PaymentService()
         self.rating = rating or RatingService()
+        self.summaries = OrderSummaryService()
 
     def _now(self):
         return timezone.now()
@@ -164,11 +166,13 @@ class SLAService:
         try:
             now = self._now()
             producer = getattr(order.dish, "producer", None)
+            previous_status = order.status
             order.status = "CANCELLED"
             order.cancelled_at = now
             order.cancelled_by = "SYSTEM"
             order.cancelled_reason = reason
             order.save(update_fields=["status", "cancelled_at", "cancelled_by", "cancelled_reason"])
+            self.summaries.on_status_change(order, previous_status)
             if producer:
                 self.penalties.add_penalty(producer, 1)
                 self.rating.recalc_for_producer(producer)
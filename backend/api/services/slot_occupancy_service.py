@@ -0,0 +1,144 @@
+"""Persistent per-slot counters of active scheduled orders."""
+
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from api.models import Order, SlotOccupancy
+
+from .scheduling_service import SchedulingService
+
+
+class SlotOccupancyService:
+    """
+    Maintains SlotOccupancy rows keyed by (producer, slot_start).
+
+    Counters are changed with single UPDATE statements so that capacity
+    checks cost one indexed lookup instead of a scan over Order. Every
+    status change goes through OrderSummaryService.on_status_change;
+    ``reconcile`` only repairs drift (e.g. orders removed by cleanup jobs)
+    and prunes slots that are already over.
+    """
+
+    @staticmethod
+    def is_active_status(status) -> bool:
+        return status in SchedulingService.ACTIVE_SLOT_STATUSES
+
+    @staticmethod
+    def _producer_id(producer):
+        """Accept either a Producer instance or its primary key."""
+        return getattr(producer, "pk", producer)
+
+    def get_count(self, producer, scheduled_time) -> int:
+        """Return the number of active orders in the slot containing scheduled_time."""
+        count = (
+            SlotOccupancy.objects.filter(
+                producer_id=self._producer_id(producer),
+                slot_start=SchedulingService.get_slot_start(scheduled_time),
+            )
+            .values_list("orders_count", flat=True)
+            .first()
+        )
+        return count or 0
+
+    def reserve(self, producer, scheduled_time, capacity: int = 0, count: int = 1) -> bool:
+        """
+        Take count places in the slot containing scheduled_time.
+
+        With capacity > 0 the counter is only incremented while all count
+        places fit into capacity, so concurrent reservations cannot overfill
+        a slot.
+
+        Returns:
+            False if the slot has fewer than count free places, True otherwise
+        """
+        producer_id = self._producer_id(producer)
+        slot_start = SchedulingService.get_slot_start(scheduled_time)
+        slot = SlotOccupancy.objects.filter(producer_id=producer_id, slot_start=slot_start)
+        available = slot.filter(orders_count__lte=capacity - count) if capacity > 0 else slot
+        if available.update(orders_count=F("orders_count") + count):
+            return True
+        if capacity > 0 and (count > capacity or slot.exists()):
+            return False
+        try:
+            with transaction.atomic():
+                SlotOccupancy.objects.create(
+                    producer_id=producer_id, slot_start=slot_start, orders_count=count
+                )
+        except IntegrityError:
+            # A concurrent reservation created the row first
+            return self.reserve(producer, scheduled_time, capacity, count)
+        return True
+
+    def release(self, producer, scheduled_time):
+        """Free a place in the slot containing scheduled_time."""
+        SlotOccupancy.objects.filter(
+            producer_id=self._producer_id(producer),
+            slot_start=SchedulingService.get_slot_start(scheduled_time),
+            orders_count__gt=0,
+        ).update(orders_count=F("orders_count") - 1)
+
+    def on_status_change(self, order, previous_status):
+        """Update counters when an order enters or leaves the active status set."""
+        if not order.scheduled_delivery_time or not order.producer_id:
+            return
+        was_active = self.is_active_status(previous_status)
+        is_active = self.is_active_status(order.status)
+        if was_active and not is_active:
+            self.release(order.producer_id, order.scheduled_delivery_time)
+        elif is_active and not was_active:
+            self.reserve(order.producer_id, order.scheduled_delivery_time)
+
+    @transaction.atomic
+    def reconcile(self, producer=None) -> int:
+        """
+        Correct counters that drifted from Order.
+
+        Existing rows are locked before orders are counted and fixed with
+        per-row UPDATEs, so reservations running concurrently wait for the
+        reconcile instead of losing their increments. Rows of slots that
+        started before the current one are deleted: nothing reserves them.
+
+        Returns:
+            Number of slot rows written
+        """
+        current_slot = SchedulingService.get_slot_start(timezone.now())
+        orders = Order.objects.filter(
+            scheduled_delivery_time__gte=current_slot,
+            status__in=SchedulingService.ACTIVE_SLOT_STATUSES,
+        )
+        counters = SlotOccupancy.objects.all()
+        if producer is not None:
+            orders = orders.filter(producer=producer)
+            counters = counters.filter(producer=producer)
+        counters.filter(slot_start__lt=current_slot).delete()
+
+        existing = {
+            (producer_id, slot_start): (pk, orders_count)
+            for pk, producer_id, slot_start, orders_count in counters.select_for_update()
+            .values_list("pk", "producer_id", "slot_start", "orders_count")
+            .iterator()
+        }
+
+        counts = defaultdict(int)
+        for producer_id, scheduled_time in orders.values_list(
+            "producer_id", "scheduled_delivery_time"
+        ).iterator():
+            counts[(producer_id, SchedulingService.get_slot_start(scheduled_time))] += 1
+
+        written = 0
+        for key, (pk, orders_count) in existing.items():
+            count = counts.get(key, 0)
+            if orders_count != count:
+                written += SlotOccupancy.objects.filter(pk=pk).update(orders_count=count)
+
+        # A reservation that created the row meanwhile already counted its order
+        missing = [
+            SlotOccupancy(producer_id=producer_id, slot_start=slot_start, orders_count=count)
+            for (producer_id, slot_start), count in counts.items()
+            if (producer_id, slot_start) not in existing
+        ]
+        SlotOccupancy.objects.bulk_create(missing, batch_size=1000, ignore_conflicts=True)
+        return written + len(missing)
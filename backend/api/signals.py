@@ -0,0 +1,140 @@
+"""
+Сигналы приложения api.
+"""
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from core.cache import CommonCacheKeys, model_cache_service
+
+from .models import (
+    Category,
+    Dish,
+    DishImage,
+    DishTopping,
+    FavoriteDish,
+    HelpArticle,
+    Order,
+    Producer,
+)
+from .services.delivery_quote_service import DeliveryQuoteEngine
+from .services.search_service import DishSearchService
+
+
+@receiver(post_save, sender=Category)
+def reindex_category_dishes(sender, instance, created, **kwargs):
+    """Название категории входит в поисковый документ блюд."""
+    if created:
+        return
+    DishSearchService().index_dishes(
+        instance.dishes.select_related("category", "producer")
+    )
+
+
+@receiver(pre_save, sender=Producer)
+def remember_producer_name(sender, instance, update_fields=None, **kwargs):
+    """Запомнить прежнее название магазина, чтобы сравнить его после сохранения."""
+    if instance._state.adding or (update_fields is not None and "name" not in update_fields):
+        instance._indexed_name = instance.name
+        return
+    instance._indexed_name = (
+        Producer.objects.filter(pk=instance.pk).values_list("name", flat=True).first()
+    )
+
+
+@receiver(post_save, sender=Producer)
+def reindex_producer_dishes(sender, instance, created, **kwargs):
+    """Название магазина входит в поисковый документ блюд."""
+    if created or getattr(instance, "_indexed_name", instance.name) == instance.name:
+        return
+    DishSearchService().index_dishes(
+        instance.dishes.select_related("category", "producer")
+    )
+
+
+@receiver(post_save, sender=Dish)
+def index_dish_for_search(sender, instance, update_fields=None, **kwargs):
+    """Обновить поисковый документ, если изменились индексируемые поля."""
+    if update_fields is not None and not DishSearchService.INDEXED_FIELDS.intersection(update_fields):
+        return
+    DishSearchService().index_dish(instance)
+
+
+@receiver(post_save, sender=Producer)
+@receiver(post_delete, sender=Producer)
+def invalidate_delivery_pricing(sender, instance, update_fields=None, **kwargs):
+    """Сбросить скомпилированные настройки доставки магазина."""
+    if update_fields is not None and not DeliveryQuoteEngine.PRICING_FIELDS.intersection(update_fields):
+        return
+    DeliveryQuoteEngine.invalidate_on_commit(instance.pk)
+
+
+# Экземпляры для cached_get на горячих путях заказа и корзины. Проекция
+# не включает длинные тексты, счётчики и рейтинги: пакетный пересчёт рейтингов
+# (BulkRatingService) сбрасывает только тег модели, а сброс счётчиков
+# (counter_service) - ничего, поэтому ETag списков блюд от просмотров не
+# меняется и счётчики в ответе 304 могут отставать. Изменение
+# категории сбрасывает тег "category" и с ним дерево категорий.
+model_cache_service.register(Category, fields=("id", "name", "parent"))
+model_cache_service.register(
+    Producer,
+    defer=(
+        "description",
+        "schedule_description",
+        "requisites",
+        "employees",
+        "documents",
+        "ban_reason",
+        "balance",
+        "rating",
+        "rating_count",
+    ),
+)
+model_cache_service.register(
+    Dish,
+    defer=(
+        "description",
+        "composition",
+        "storage_conditions",
+        "fillings",
+        "views_count",
+        "in_cart_count",
+        "sales_count",
+        "repeat_purchase_count",
+        "rating",
+        "rating_count",
+        "sort_score",
+    ),
+    related=("producer",),
+    counters=("views_count", "in_cart_count", "sales_count", "repeat_purchase_count"),
+)
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+@receiver(post_save, sender=HelpArticle)
+@receiver(post_delete, sender=HelpArticle)
+@receiver(post_save, sender=DishImage)
+@receiver(post_delete, sender=DishImage)
+@receiver(post_save, sender=DishTopping)
+@receiver(post_delete, sender=DishTopping)
+@receiver(post_save, sender=FavoriteDish)
+@receiver(post_delete, sender=FavoriteDish)
+def invalidate_cache_tags(sender, instance, **kwargs):
+    """
+    Сбросить записи core.cache, помеченные тегами изменённого объекта.
+    Модели из реестра model_cache_service сбрасывают свои теги сами.
+    """
+    if sender is Order:
+        # Тег "order:<pk>" никто не читает: только списки заказов
+        tags = [model_cache_service.model_tag(Order), *CommonCacheKeys.order_tags(instance)]
+    elif sender in (DishImage, DishTopping, FavoriteDish):
+        # Фото, добавки и избранное входят в ответ блюда (ETag DishViewSet)
+        tags = [model_cache_service.model_tag(Dish), CommonCacheKeys.dish_tag(instance.dish_id)]
+    else:
+        tags = [model_cache_service.model_tag(sender), model_cache_service.model_tag(sender, instance.pk)]
+    model_cache_service.invalidate_tags(*tags)
+    # Повторно после коммита: запись, собранная другим процессом до коммита,
+    # не должна остаться закэшированной под новым поколением тега
+    transaction.on_commit(lambda: model_cache_service.invalidate_tags(*tags))
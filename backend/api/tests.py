@@ -1,25 +1,31 @@
 import uuid
 from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import TestCase
+from django.core.management import call_command
+from django.test import TestCase, override_settings
 from django.utils import timezone
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from api.management.commands.process_outbox_events import (
+from api.services.chat_service import ChatService
+from api.services.outbox_dispatcher import (
     MAX_ATTEMPTS,
+    OutboxDispatcher,
     _calculate_next_attempt,
 )
-from api.management.commands.process_outbox_events import (
-    Command as ProcessOutboxCommand,
-)
 
 from .models import (
+    Cart,
     Category,
     ChatMessage,
     Dish,
+    DishImage,
+    HelpArticle,
     Order,
     OutboxEvent,
     Producer,
@@ -27,6 +33,7 @@ from .models import (
     PromoCode,
     PublishedEvent,
     Review,
+    SearchHistory,
 )
 
 User = get_user_model()
@@ -244,10 +251,12 @@ class NewFeaturesTestCase(TestCase):
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         
+        call_command('flush_counters')
         self.dish.refresh_from_db()
         self.assertEqual(self.dish.views_count, 1)
         
         self.client.get(url)
+        call_command('flush_counters')
         self.dish.refresh_from_db()
         self.assertEqual(self.dish.views_count, 2)
 
@@ -386,11 +395,13 @@ class NewFeaturesTestCase(TestCase):
         
         # Add
         self.client.post(add_url, {'dish': self.dish.id, 'quantity': 1})
+        call_command('flush_counters')
         self.dish.refresh_from_db()
         self.assertEqual(self.dish.in_cart_count, 1)
         
         # Remove
         self.client.post(remove_url, {'dish': self.dish.id})
+        call_command('flush_counters')
         self.dish.refresh_from_db()
         self.assertEqual(self.dish.in_cart_count, 0)
 
@@ -509,8 +520,7 @@ class OutboxProcessingTestCase(TestCase):
             event_type="TestEvent",
             payload={"foo": "bar"},
         )
-        cmd = ProcessOutboxCommand()
-        processed = cmd._process_batch(limit=10)
+        _, processed = OutboxDispatcher(workers=1).dispatch_batch(limit=10)
         self.assertEqual(processed, 1)
         event.refresh_from_db()
         self.assertEqual(event.status, "PROCESSED")
@@ -525,9 +535,9 @@ class OutboxProcessingTestCase(TestCase):
             event_type="TestEvent",
             payload={"force_error": True},
         )
-        cmd = ProcessOutboxCommand()
+        dispatcher = OutboxDispatcher(workers=1)
         while True:
-            processed = cmd._process_batch(limit=10)
+            _, processed = dispatcher.dispatch_batch(limit=10)
             self.assertIn(processed, (0, 1))
             event.refresh_from_db()
             if event.status == "DEAD":
@@ -539,6 +549,184 @@ class OutboxProcessingTestCase(TestCase):
         self.assertGreaterEqual(event.attempt_count, MAX_ATTEMPTS)
         self.assertTrue(bool(event.error_message))
 
+class OutboxDispatcherTestCase(TestCase):
+    def _event(self, aggregate_id, seconds_ago, **payload):
+        event = OutboxEvent.objects.create(
+            aggregate_type="order",
+            aggregate_id=aggregate_id,
+            event_type="TestEvent",
+            payload=payload,
+        )
+        OutboxEvent.objects.filter(id=event.id).update(
+            created_at=timezone.now() - timedelta(seconds=seconds_ago)
+        )
+        return event
+
+    def test_failure_defers_later_events_of_the_same_aggregate(self):
+        from api.services.outbox_dispatcher import OutboxDispatcher
+        from api.services.outbox_publishers import (
+            InMemoryStreamClient,
+            RedisStreamPublisher,
+        )
+
+        aggregate, other = uuid.uuid4(), uuid.uuid4()
+        failing = self._event(aggregate, 30, force_error=True)
+        blocked = self._event(aggregate, 20)
+        independent = self._event(other, 10)
+        dispatcher = OutboxDispatcher(workers=1)
+
+        self.assertEqual(dispatcher.dispatch_batch(), (3, 1))
+
+        failing.refresh_from_db()
+        blocked.refresh_from_db()
+        independent.refresh_from_db()
+        self.assertEqual((failing.status, failing.attempt_count), ("PENDING", 1))
+        self.assertEqual(blocked.status, "PENDING")
+        self.assertIsNone(blocked.next_attempt_at)
+        self.assertEqual(independent.status, "PROCESSED")
+        # Пока упавшее событие ждёт повтора, следующее событие агрегата не забирается
+        self.assertEqual(dispatcher.dispatch_batch(), (0, 0))
+        self.assertFalse(PublishedEvent.objects.filter(outbox_event=blocked).exists())
+
+        OutboxEvent.objects.filter(id=failing.id).update(
+            payload={}, next_attempt_at=timezone.now() - timedelta(seconds=1)
+        )
+        stream = InMemoryStreamClient()
+        dispatcher.publisher = RedisStreamPublisher(client=stream)
+        self.assertEqual(dispatcher.dispatch_batch(), (2, 2))
+        self.assertEqual(
+            [fields["id"] for _, fields in stream.xrange("outbox:order-events")],
+            [str(failing.id), str(blocked.id)],
+        )
+
+    def test_claimed_events_are_leased(self):
+        from api.services.outbox_dispatcher import OutboxDispatcher
+
+        event = self._event(uuid.uuid4(), 5)
+        dispatcher = OutboxDispatcher(workers=1)
+
+        self.assertEqual([e.id for e in dispatcher.claim_batch()], [event.id])
+        self.assertEqual(dispatcher.claim_batch(), [])
+        event.refresh_from_db()
+        self.assertGreater(event.next_attempt_at, timezone.now())
+
+    def test_stats_track_throughput_and_lag(self):
+        from api.services.outbox_dispatcher import DispatcherStats, OutboxDispatcher
+
+        for seconds_ago in (40, 30):
+            self._event(uuid.uuid4(), seconds_ago)
+        self._event(uuid.uuid4(), 90, force_error=True)
+        dispatcher = OutboxDispatcher(workers=1)
+        dispatcher.dispatch_batch()
+
+        snapshot = dispatcher.publish_stats()
+
+        self.assertEqual((snapshot["published"], snapshot["failed"]), (2, 1))
+        self.assertGreaterEqual(snapshot["max_lag_seconds"], 40)
+        self.assertGreaterEqual(snapshot["pending_lag_seconds"], 90)
+        self.assertEqual(cache.get(DispatcherStats.CACHE_KEY), snapshot)
+
+    def test_process_outbox_events_command_drains_outbox(self):
+        for seconds_ago in range(3):
+            self._event(uuid.uuid4(), seconds_ago)
+
+        call_command("process_outbox_events")
+
+        self.assertEqual(OutboxEvent.objects.filter(status="PROCESSED").count(), 3)
+        self.assertEqual(PublishedEvent.objects.count(), 3)
+
+
+class OutboxPublisherTestCase(TestCase):
+    def setUp(self):
+        self.events = []
+        for index in range(50):
+            event = OutboxEvent.objects.create(
+                aggregate_type="order" if index % 2 else "gift",
+                aggregate_id=uuid.uuid4(),
+                event_type="TestEvent",
+                payload={"index": index},
+            )
+            self.events.append(event)
+
+    def test_database_publisher_uses_a_handful_of_queries(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        from api.services.outbox_dispatcher import OutboxDispatcher
+        from api.services.outbox_publishers import DatabasePublisher
+
+        dispatcher = OutboxDispatcher(workers=1, publisher=DatabasePublisher())
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(dispatcher.dispatch_batch(), (50, 50))
+
+        statements = [
+            q["sql"] for q in queries.captured_queries if "SAVEPOINT" not in q["sql"]
+        ]
+        self.assertLessEqual(len(statements), 6)
+        self.assertEqual(PublishedEvent.objects.count(), 50)
+        self.assertEqual(
+            PublishedEvent.objects.filter(topic="gift-events").count(), 25
+        )
+
+    def test_already_published_events_are_not_sent_again(self):
+        from api.services.outbox_dispatcher import OutboxDispatcher
+        from api.services.outbox_publishers import (
+            InMemoryStreamClient,
+            RedisStreamPublisher,
+        )
+
+        PublishedEvent.objects.create(outbox_event=self.events[0], topic="gift-events")
+        stream = InMemoryStreamClient()
+        dispatcher = OutboxDispatcher(workers=1, publisher=RedisStreamPublisher(client=stream))
+
+        dispatcher.dispatch_batch()
+
+        self.assertEqual(stream.xlen("outbox:gift-events") + stream.xlen("outbox:order-events"), 49)
+        self.assertEqual(OutboxEvent.objects.filter(status="PROCESSED").count(), 50)
+        self.assertEqual(PublishedEvent.objects.count(), 50)
+
+    def test_redis_publisher_requires_redis(self):
+        from django.core.exceptions import ImproperlyConfigured
+
+        from api.services.outbox_publishers import RedisStreamPublisher
+
+        with mock.patch.dict("os.environ", {"REDIS_URL": ""}), self.assertRaises(ImproperlyConfigured):
+            RedisStreamPublisher()
+
+    def test_jsonl_publisher_appends_one_line_per_event(self):
+        import json
+        import tempfile
+
+        from api.services.outbox_dispatcher import OutboxDispatcher
+        from api.services.outbox_publishers import JsonlFilePublisher
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = f"{directory}/outbox.jsonl"
+            OutboxDispatcher(workers=1, publisher=JsonlFilePublisher(path=path)).dispatch_batch()
+            with open(path, encoding="utf-8") as handle:
+                lines = [json.loads(line) for line in handle]
+
+        self.assertEqual(len(lines), 50)
+        self.assertEqual(
+            {line["id"] for line in lines}, {str(event.id) for event in self.events}
+        )
+        self.assertEqual({line["topic"] for line in lines}, {"gift-events", "order-events"})
+
+    def test_failed_send_keeps_events_pending(self):
+        from api.services.outbox_dispatcher import OutboxDispatcher
+        from api.services.outbox_publishers import OutboxPublisher
+
+        class BrokenPublisher(OutboxPublisher):
+            def send(self, topic, events):
+                raise ConnectionError("broker unavailable")
+
+        claimed, published = OutboxDispatcher(workers=1, publisher=BrokenPublisher()).dispatch_batch()
+
+        self.assertEqual((claimed, published), (50, 0))
+        self.assertFalse(PublishedEvent.objects.exists())
+        self.assertEqual(OutboxEvent.objects.filter(attempt_count=1).count(), 50)
+
+
 class ProfileUpdateTestCase(TestCase):
     def setUp(self):
         self.client = APIClient()
@@ -681,3 +869,1844 @@ class ProfileUpdateTestCase(TestCase):
         self.assertNotIn('t.me', out.lower())
         self.assertNotIn('telegram', out.lower())
         self.assertNotIn('+7', out)
+
+
+class SchedulingSlotsTestCase(TestCase):
+    def setUp(self):
+        self.producer = Producer.objects.create(
+            name="Slots Producer",
+            city="Baku",
+            max_orders_per_slot=1,
+        )
+        self.producer.refresh_from_db()
+        self.category = Category.objects.create(name="Slots Category")
+        self.dish = Dish.objects.create(
+            name="Slots Dish",
+            price=100,
+            category=self.category,
+            producer=self.producer,
+            cooking_time_minutes=30,
+        )
+        self.target_date = timezone.localdate() + timedelta(days=2)
+
+    def _slot_time(self, hour, minute=0):
+        from datetime import datetime, time
+
+        return timezone.make_aware(
+            datetime.combine(self.target_date, time(hour, minute))
+        )
+
+    def _create_scheduled_order(self, scheduled_time, status_value="WAITING_FOR_PAYMENT"):
+        from api.services.slot_occupancy_service import SlotOccupancyService
+
+        order = Order.objects.create(
+            user_name="Buyer",
+            phone="123",
+            dish=self.dish,
+            producer=self.producer,
+            quantity=1,
+            total_price=100,
+            status=status_value,
+            scheduled_delivery_time=scheduled_time,
+        )
+        SlotOccupancyService().on_status_change(order, None)
+        return order
+
+    def test_day_slots_use_single_occupancy_query(self):
+        from api.services.scheduling_service import SchedulingService
+
+        self._create_scheduled_order(self._slot_time(12, 10))
+        self._create_scheduled_order(self._slot_time(13), status_value="CANCELLED")
+
+        with self.assertNumQueries(1):
+            slots = SchedulingService().get_available_time_slots(
+                self.producer, self.dish, 1, self.target_date
+            )
+
+        by_display = {slot["display"]: slot for slot in slots}
+        self.assertEqual(len(slots), 25)
+        self.assertFalse(by_display["12:00"]["available"])
+        self.assertEqual(by_display["12:00"]["remaining_capacity"], 0)
+        self.assertTrue(by_display["12:30"]["available"])
+        self.assertTrue(by_display["13:00"]["available"])
+        self.assertEqual(by_display["13:00"]["remaining_capacity"], 1)
+
+    def test_calendar_fills_all_days_in_one_query(self):
+        from api.services.scheduling_service import SchedulingService
+
+        self._create_scheduled_order(self._slot_time(15, 30))
+
+        with self.assertNumQueries(1):
+            calendar = SchedulingService().get_available_time_slots_for_range(
+                self.producer, self.dish, 1
+            )
+
+        self.assertEqual(len(calendar), SchedulingService.MAX_ADVANCE_DAYS)
+        target_day = next(
+            day for day in calendar if day["date"] == self.target_date.isoformat()
+        )
+        slot = next(s for s in target_day["slots"] if s["display"] == "15:30")
+        self.assertFalse(slot["available"])
+
+    def test_reserve_respects_slot_capacity(self):
+        from api.services.slot_occupancy_service import SlotOccupancyService
+
+        service = SlotOccupancyService()
+        slot_time = self._slot_time(12, 10)
+
+        self.assertTrue(service.reserve(self.producer, slot_time, capacity=1))
+        self.assertFalse(service.reserve(self.producer, self._slot_time(12, 20), capacity=1))
+        self.assertEqual(service.get_count(self.producer, self._slot_time(12)), 1)
+
+    def test_full_slot_does_not_spend_promo_code(self):
+        self._create_scheduled_order(self._slot_time(12))
+        promo = PromoCode.objects.create(
+            producer=self.producer, code="SLOT10", reward_type="DISCOUNT", reward_value="10.0", recipient_phone="123"
+        )
+        client = APIClient()
+        client.force_authenticate(
+            User.objects.create_user(username="slots@test.com", email="slots@test.com", password="password123")
+        )
+
+        response = client.post(
+            "/api/orders/",
+            {
+                "dish": self.dish.id,
+                "quantity": 1,
+                "user_name": "Buyer",
+                "phone": "123",
+                "promo_code_text": "SLOT10",
+                "scheduled_delivery_time": self._slot_time(12).isoformat(),
+            },
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        promo.refresh_from_db()
+        self.assertFalse(promo.is_used)
+
+    def test_leaving_active_status_releases_slot(self):
+        from api.services.order_service import OrderService
+        from api.services.slot_occupancy_service import SlotOccupancyService
+
+        order = self._create_scheduled_order(self._slot_time(14), status_value="WAITING_FOR_ACCEPTANCE")
+        self.assertEqual(SlotOccupancyService().get_count(self.producer, self._slot_time(14)), 1)
+
+        OrderService().reject_order(order, self.producer, "Нет продуктов", apply_penalty=False)
+
+        self.assertEqual(SlotOccupancyService().get_count(self.producer, self._slot_time(14)), 0)
+
+    def test_reconcile_rebuilds_counters_from_orders(self):
+        from api.models import SlotOccupancy
+        from api.services.slot_occupancy_service import SlotOccupancyService
+
+        Order.objects.create(
+            user_name="Buyer",
+            phone="123",
+            dish=self.dish,
+            producer=self.producer,
+            quantity=1,
+            total_price=100,
+            status="WAITING_FOR_PAYMENT",
+            scheduled_delivery_time=self._slot_time(16, 15),
+        )
+        stale = SlotOccupancy.objects.create(
+            producer=self.producer, slot_start=self._slot_time(17), orders_count=3
+        )
+        past = SlotOccupancy.objects.create(
+            producer=self.producer,
+            slot_start=self._slot_time(12) - timedelta(days=5),
+            orders_count=2,
+        )
+
+        call_command("reconcile_slot_occupancy", stdout=mock.MagicMock())
+
+        service = SlotOccupancyService()
+        self.assertEqual(service.get_count(self.producer, self._slot_time(16)), 1)
+        self.assertEqual(service.get_count(self.producer, self._slot_time(17)), 0)
+        # Строки исправляются на месте, а не пересоздаются
+        self.assertTrue(SlotOccupancy.objects.filter(pk=stale.pk).exists())
+        self.assertFalse(SlotOccupancy.objects.filter(pk=past.pk).exists())
+        self.assertEqual(service.reconcile(), 0)
+
+
+class ProducerStatisticsTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.seller = User.objects.create_user(
+            username="stats-seller@example.com", email="stats-seller@example.com", password="password123"
+        )
+        self.producer = Producer.objects.create(name="Stats Producer", city="Baku", user=self.seller)
+        self.category = Category.objects.create(name="Stats Category")
+        self.dish = Dish.objects.create(
+            name="Stats Dish", price=100, category=self.category, producer=self.producer
+        )
+        self.client.force_authenticate(user=self.seller)
+
+    def _create_order(self, status_value, total_price=100, toppings=None):
+        return Order.objects.create(
+            user_name="Buyer",
+            phone="123",
+            dish=self.dish,
+            producer=self.producer,
+            quantity=1,
+            total_price=total_price,
+            status=status_value,
+            selected_toppings=toppings or [],
+        )
+
+    def test_statistics_read_from_backfilled_rollups(self):
+        self._create_order("COMPLETED", 150, [{"name": "Cheese", "price": 10}])
+        self._create_order("COMPLETED", 50, [{"name": "Cheese", "price": 10}])
+        self._create_order("CANCELLED")
+        self._create_order("COOKING")
+
+        call_command("backfill_producer_daily_stats")
+
+        with self.assertNumQueries(3):
+            response = self.client.get("/api/orders/statistics/", {"time_range": "all"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["total_revenue"], 200.0)
+        self.assertEqual(response.data["orders_count"], 2)
+        self.assertEqual(response.data["cancelled_orders_count"], 1)
+        self.assertEqual(response.data["active_orders_count"], 1)
+        self.assertEqual(response.data["avg_order_value"], 100.0)
+        self.assertEqual(
+            response.data["top_dishes"], [{"name": "Stats Dish", "count": 2, "revenue": 200.0}]
+        )
+        self.assertEqual(response.data["top_toppings"], [{"name": "Cheese", "count": 2}])
+        self.assertEqual(len(response.data["chart_data"]), 1)
+
+    def test_completion_updates_rollup_incrementally(self):
+        from api.models import ProducerDailyStats
+        from api.services.order_status import OrderActor, OrderStatusService
+
+        order = self._create_order("ARRIVED", 120, [{"name": "Sauce", "price": 5}])
+        OrderStatusService().complete_by_buyer(order.id, OrderActor(user=self.seller, role="SELLER"))
+
+        stats = ProducerDailyStats.objects.get(producer=self.producer)
+        self.assertEqual(stats.completed_count, 1)
+        self.assertEqual(float(stats.revenue), 120.0)
+        self.assertEqual(stats.dishes, {"Stats Dish": {"count": 1, "revenue": 120.0}})
+        self.assertEqual(stats.toppings, {"Sauce": 1})
+
+    def test_rebuild_fixes_rollups_in_place(self):
+        from api.models import ProducerDailyStats
+        from api.services.producer_stats_service import ProducerStatsService
+
+        self._create_order("COMPLETED", 80)
+        today = ProducerDailyStats.objects.create(
+            producer=self.producer, date=timezone.localdate(), completed_count=5, revenue=1
+        )
+        stale = ProducerDailyStats.objects.create(
+            producer=self.producer, date=timezone.localdate() - timedelta(days=3), cancelled_count=2
+        )
+
+        self.assertEqual(ProducerStatsService().rebuild(), 1)
+
+        # Строки исправляются на месте, а не пересоздаются
+        today.refresh_from_db()
+        self.assertEqual(today.completed_count, 1)
+        self.assertEqual(float(today.revenue), 80.0)
+        self.assertEqual(today.dishes, {"Stats Dish": {"count": 1, "revenue": 80.0}})
+        self.assertFalse(ProducerDailyStats.objects.filter(pk=stale.pk).exists())
+        self.assertEqual(ProducerStatsService().rebuild(), 0)
+
+
+class RecordingMetricsSink:
+    records = []
+
+    def record(self, metrics):
+        self.records.append(metrics)
+
+
+class QueryInstrumentationTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.category = Category.objects.create(name="Metrics Category")
+        RecordingMetricsSink.records.clear()
+
+    @override_settings(
+        QUERY_INSTRUMENTATION_ENABLED=True,
+        QUERY_INSTRUMENTATION_SAMPLE_RATE=1.0,
+        QUERY_INSTRUMENTATION_SINK="api.tests.RecordingMetricsSink",
+    )
+    def test_sampled_request_records_metrics(self):
+        response = self.client.get("/api/categories/")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(RecordingMetricsSink.records), 1)
+        metrics = RecordingMetricsSink.records[0]
+        self.assertEqual(metrics["view"], "CategoryViewSet")
+        self.assertEqual(metrics["action"], "list")
+        self.assertGreater(metrics["queries"], 0)
+        self.assertGreaterEqual(metrics["serializer_time_ms"], 0)
+
+    @override_settings(
+        QUERY_INSTRUMENTATION_ENABLED=False,
+        QUERY_INSTRUMENTATION_SINK="api.tests.RecordingMetricsSink",
+    )
+    def test_disabled_instrumentation_records_nothing(self):
+        response = self.client.get("/api/categories/")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(RecordingMetricsSink.records, [])
+
+    def test_category_list_has_no_extra_count_query(self):
+        # Единственный запрос - сборка дерева категорий после изменения версии
+        with self.assertNumQueries(1):
+            self.client.get("/api/categories/")
+
+
+class CategoryTreeTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.root = Category.objects.create(name="Root")
+        self.child = Category.objects.create(name="Child", parent=self.root)
+        self.grandchild = Category.objects.create(name="Grandchild", parent=self.child)
+
+    def test_tree_endpoint_is_served_from_cache(self):
+        self.client.get("/api/categories/", {"only_roots": "true"})
+
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/categories/", {"only_roots": "true"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data["data"]
+        self.assertEqual([node["name"] for node in results], ["Root"])
+        child = results[0]["subcategories"][0]
+        self.assertEqual(child["name"], "Child")
+        self.assertEqual(child["subcategories"][0]["name"], "Grandchild")
+
+    def test_category_change_invalidates_tree(self):
+        self.client.get("/api/categories/")
+
+        Category.objects.create(name="Second Root")
+        response = self.client.get("/api/categories/", {"only_roots": "true"})
+
+        self.assertEqual(
+            sorted(node["name"] for node in response.data["data"]), ["Root", "Second Root"]
+        )
+
+    def test_dish_filter_includes_descendants_at_any_depth(self):
+        producer = Producer.objects.create(name="Tree Producer", city="Baku")
+        dish = Dish.objects.create(
+            name="Deep Dish", price=100, category=self.grandchild, producer=producer
+        )
+
+        response = self.client.get("/api/dishes/", {"category": str(self.root.id)})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(str(dish.id), [item["id"] for item in response.data["data"]])
+
+
+@override_settings(SEARCH_HISTORY_ASYNC=False)
+class DishSearchTestCase(TestCase):
+    def setUp(self):
+        from api.services.search_history_service import SearchHistoryBuffer
+
+        patcher = mock.patch(
+            "api.services.search_history_service.search_history_buffer", SearchHistoryBuffer()
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="searcher@test.com", email="searcher@test.com", password="password123")
+        self.client.force_authenticate(user=self.user)
+        self.category = Category.objects.create(name="Домашняя кухня")
+        self.producer = Producer.objects.create(name="Бабушкины рецепты", city="Baku")
+        self.dumplings = Dish.objects.create(
+            name="Пельмени домашние",
+            description="Сочные пельмени ручной лепки",
+            price=300,
+            category=self.category,
+            producer=self.producer,
+            sort_score=1,
+        )
+        self.borscht = Dish.objects.create(
+            name="Борщ",
+            composition="свекла, капуста, говядина",
+            price=250,
+            category=self.category,
+            producer=self.producer,
+            sort_score=5,
+        )
+
+    def test_stemmer_reduces_russian_word_forms(self):
+        from api.services.search_service import stem
+
+        self.assertEqual(stem("пельмени"), stem("пельменями"))
+        self.assertEqual(stem("домашние"), stem("домашний"))
+
+    def test_autocomplete_matches_prefix(self):
+        response = self.client.get("/api/dishes/autocomplete/", {"q": "пельм"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item["name"] for item in response.data], ["Пельмени домашние"])
+
+    def test_search_matches_word_forms_in_composition(self):
+        response = self.client.get("/api/dishes/", {"search": "свеклой"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item["name"] for item in response.data["data"]], ["Борщ"])
+
+    def test_search_ranks_by_relevance_and_sort_score(self):
+        # Оба блюда совпадают по категории, но у пельменей слово ещё и в названии,
+        # что перевешивает более высокий sort_score борща
+        response = self.client.get("/api/dishes/", {"search": "домашняя"})
+
+        names = [item["name"] for item in response.data["data"]]
+        self.assertEqual(names[0], "Пельмени домашние")
+        self.assertEqual(set(names), {"Пельмени домашние", "Борщ"})
+
+    def test_index_is_updated_on_dish_save(self):
+        self.borscht.name = "Солянка"
+        self.borscht.save()
+
+        response = self.client.get("/api/dishes/autocomplete/", {"q": "солян"})
+
+        self.assertEqual([item["name"] for item in response.data], ["Солянка"])
+
+    def test_index_is_updated_on_producer_rename(self):
+        self.producer.name = "Татарская кухня"
+        self.producer.save()
+
+        response = self.client.get("/api/dishes/", {"search": "татарской"})
+        self.assertEqual({item["name"] for item in response.data["data"]}, {"Пельмени домашние", "Борщ"})
+
+        # Сохранение без смены названия не переиндексирует блюда
+        with mock.patch("api.signals.DishSearchService.index_dishes") as index_dishes:
+            self.producer.city = "Ganja"
+            self.producer.save()
+        index_dishes.assert_not_called()
+
+    def test_migration_indexes_existing_dishes(self):
+        import importlib
+
+        from django.apps import apps
+        from django.db import connection
+
+        from api.models import DishSearchDocument
+
+        DishSearchDocument.objects.all().delete()
+        migration = importlib.import_module("api.migrations.0064_dish_search_index")
+        migration.populate_search_documents(apps, connection.schema_editor())
+
+        self.assertEqual(DishSearchDocument.objects.count(), 2)
+        response = self.client.get("/api/dishes/autocomplete/", {"q": "пельм"})
+        self.assertEqual([item["name"] for item in response.data], ["Пельмени домашние"])
+
+
+@override_settings(SEARCH_HISTORY_ASYNC=False)
+class SearchHistoryBufferTestCase(TestCase):
+    def setUp(self):
+        from api.services.search_history_service import SearchHistoryBuffer
+
+        self.buffer = SearchHistoryBuffer(max_pending=3, batch_size=2)
+        patcher = mock.patch(
+            "api.services.search_history_service.search_history_buffer", self.buffer
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user(username="history@test.com", email="history@test.com", password="password123")
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        category = Category.objects.create(name="Горячее")
+        producer = Producer.objects.create(name="Кухня", city="Baku")
+        Dish.objects.create(name="Плов", price=200, category=category, producer=producer)
+
+    def test_autocomplete_buffers_history_until_batch_is_full(self):
+        self.client.get("/api/dishes/autocomplete/", {"q": "плов"})
+
+        self.assertEqual(SearchHistory.objects.count(), 0)
+        self.assertEqual(self.buffer.pending_count(), 1)
+
+        self.client.get("/api/dishes/autocomplete/", {"q": "пло"})
+
+        self.assertEqual(
+            sorted(SearchHistory.objects.values_list("query", "results_count")),
+            [("пло", 1), ("плов", 1)],
+        )
+        self.assertEqual(self.buffer.pending_count(), 0)
+
+    def test_overflow_drops_records_instead_of_blocking(self):
+        self.buffer.batch_size = 100
+        results = [self.buffer.record(self.user, f"запрос {i}", 1) for i in range(5)]
+
+        self.assertEqual(results, [True, True, True, False, False])
+        self.assertEqual(self.buffer.dropped, 2)
+        self.assertEqual(self.buffer.flush(), 3)
+
+    def test_empty_autocomplete_serves_popular_queries(self):
+        for query in ["Плов", "плов ", "борщ", "плов"]:
+            self.buffer.record(self.user, query, 1)
+        self.buffer.record(self.user, "ничего", 0)
+
+        response = self.client.get("/api/dishes/autocomplete/", {"q": ""})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data, [{"query": "плов", "count": 3}, {"query": "борщ", "count": 1}]
+        )
+
+    def test_popular_queries_are_warmed_from_history(self):
+        SearchHistory.objects.create(user=self.user, query="Шашлык", results_count=4)
+        SearchHistory.objects.create(user=self.user, query="шашлык", results_count=2)
+
+        self.assertEqual(self.buffer.popular_queries(), [{"query": "шашлык", "count": 2}])
+
+
+class CounterServiceTestCase(TestCase):
+    def setUp(self):
+        from api.services.counter_service import CounterService, counter_service
+
+        # Буфер включается явно: в тестах кэш - LocMemCache
+        self.counters = CounterService(buffered=True)
+        patcher = mock.patch.object(counter_service, "buffered", True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.counters.flush()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="viewer@test.com", email="viewer@test.com", password="password123")
+        self.client.force_authenticate(user=self.user)
+        category = Category.objects.create(name="Выпечка")
+        producer = Producer.objects.create(name="Пекарня", city="Baku")
+        self.dish = Dish.objects.create(name="Хачапури", price=150, category=category, producer=producer)
+        self.other = Dish.objects.create(name="Кутабы", price=120, category=category, producer=producer)
+
+    def test_retrieve_does_not_write_to_dish(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f"/api/dishes/{self.dish.id}/")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(
+            [q["sql"] for q in queries.captured_queries if q["sql"].startswith("UPDATE")]
+        )
+        self.dish.refresh_from_db()
+        self.assertEqual(self.dish.views_count, 0)
+
+    def test_flush_applies_all_increments_in_one_update(self):
+        for _ in range(3):
+            self.counters.increment(Dish, self.dish.pk, "views_count")
+        self.counters.increment(Dish, self.other.pk, "views_count", 2)
+        self.counters.increment(Dish, self.dish.pk, "in_cart_count")
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.counters.flush(), 2)
+
+        self.dish.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual((self.dish.views_count, self.dish.in_cart_count), (3, 1))
+        self.assertEqual(self.other.views_count, 2)
+        # Повторный сброс ничего не применяет
+        self.assertEqual(self.counters.flush(), 0)
+
+    def test_flush_does_not_go_below_zero(self):
+        self.counters.increment(Dish, self.dish.pk, "in_cart_count", -1)
+
+        self.counters.flush()
+
+        self.dish.refresh_from_db()
+        self.assertEqual(self.dish.in_cart_count, 0)
+
+    def test_process_local_cache_writes_through(self):
+        from api.services.counter_service import CounterService
+
+        counters = CounterService()
+        self.assertFalse(counters.is_buffered())
+
+        counters.increment(Dish, self.dish.pk, "views_count", 2)
+        counters.increment(Dish, self.dish.pk, "in_cart_count", -1)
+
+        self.dish.refresh_from_db()
+        self.assertEqual((self.dish.views_count, self.dish.in_cart_count), (2, 0))
+        self.assertEqual(counters.flush(), 0)
+
+
+class DeliveryQuoteEngineTestCase(TestCase):
+    def setUp(self):
+        from api.services.delivery_quote_service import DeliveryQuoteEngine
+
+        self.engine = DeliveryQuoteEngine()
+        self.producer = Producer.objects.create(
+            name="Доставка",
+            latitude=40.4093,
+            longitude=49.8671,
+            delivery_price_to_building=100.0,
+            delivery_price_to_door=150.0,
+            delivery_zones=[
+                {"radius_km": 10, "price_to_building": 8, "price_to_door": 9, "time_minutes": 40},
+                {"radius_km": 3, "price_to_building": 3, "price_to_door": 4, "time_minutes": 15},
+            ],
+            delivery_pricing_rules=[{"start": "18:00", "end": "22:00", "surcharge": 50.0}],
+        )
+        category = Category.objects.create(name="Супы")
+        self.dish = Dish.objects.create(
+            name="Довга", price=200, category=category, producer=self.producer, cooking_time_minutes=20
+        )
+        self.noon = timezone.now().replace(hour=12, minute=0)
+
+    def test_zone_selected_by_distance(self):
+        near = self.engine.quote(self.dish, 1, 40.4093, 49.8871, self.noon)
+        far = self.engine.quote(self.dish, 1, 40.4093, 49.9371, self.noon, "DOOR")
+        outside = self.engine.quote(self.dish, 1, 40.6093, 49.8671, self.noon)
+
+        self.assertEqual((near.delivery_price, near.cooking_time_minutes), (3.0, 35))
+        self.assertEqual((far.delivery_price, far.cooking_time_minutes), (9.0, 60))
+        self.assertEqual((outside.delivery_price, outside.zone_time_minutes), (100.0, None))
+
+    def test_time_surcharge_and_quantity(self):
+        evening = self.noon.replace(hour=22, minute=0)
+
+        quote = self.engine.quote(self.dish, 3, when=evening)
+
+        self.assertEqual(quote.delivery_price, 150.0)
+        self.assertEqual(quote.total_price, 750.0)
+        self.assertEqual(quote.cooking_time_minutes, 40)
+
+    def test_producer_save_invalidates_compiled_pricing(self):
+        self.assertEqual(self.engine.quote(self.dish, when=self.noon).delivery_price, 100.0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.producer.delivery_price_to_building = 120.0
+            self.producer.save()
+
+        self.dish.refresh_from_db()
+        self.assertEqual(self.engine.quote(self.dish, when=self.noon).delivery_price, 120.0)
+
+    def test_evicted_version_does_not_match_stale_snapshot(self):
+        self.assertEqual(self.engine.quote(self.dish, when=self.noon).delivery_price, 100.0)
+
+        # Изменение без сигнала, затем вытеснение ключа версии
+        Producer.objects.filter(pk=self.producer.pk).update(delivery_price_to_building=130.0)
+        cache.delete(self.engine.VERSION_KEY.format(producer_id=self.producer.pk))
+
+        self.dish.refresh_from_db()
+        self.assertEqual(self.engine.quote(self.dish, when=self.noon).delivery_price, 130.0)
+
+    def test_quote_many_compiles_each_producer_once(self):
+        from api.services.delivery_quote_service import (
+            CompiledDeliveryPricing,
+            QuoteRequest,
+        )
+
+        self.engine.invalidate(self.producer.pk)
+        requests = [QuoteRequest(self.dish, quantity, when=self.noon) for quantity in (1, 2, 3)]
+
+        with mock.patch.object(
+            CompiledDeliveryPricing, "from_producer", wraps=CompiledDeliveryPricing.from_producer
+        ) as compile_mock:
+            quotes = self.engine.quote_many(requests)
+            self.engine.quote_many(requests)
+
+        self.assertEqual(compile_mock.call_count, 1)
+        self.assertEqual([quote.items_price for quote in quotes], [200.0, 400.0, 600.0])
+
+    def test_estimate_uses_engine(self):
+        client = APIClient()
+        user = User.objects.create_user(username="quote@test.com", email="quote@test.com", password="password123")
+        client.force_authenticate(user=user)
+        PromoCode.objects.create(
+            producer=self.producer, code="FREE", reward_type="FREE_DELIVERY", recipient_phone="123"
+        )
+
+        response = client.post(
+            "/api/orders/estimate/",
+            {
+                "dish": self.dish.id,
+                "quantity": 2,
+                "delivery_latitude": 40.4093,
+                "delivery_longitude": 49.8871,
+                "promo_code_text": "FREE",
+            },
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        expected = self.engine.quote(self.dish, 2, 40.4093, 49.8871)
+        self.assertEqual(response.data["delivery_price"], expected.delivery_price)
+        self.assertEqual(response.data["discount_amount"], expected.delivery_price)
+        self.assertEqual(response.data["total_price"], 400.0)
+        self.assertEqual(response.data["estimated_cooking_time"], 45)
+
+
+class CartQuoteTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="cart@test.com", email="cart@test.com", password="password123")
+        self.client.force_authenticate(user=self.user)
+        category = Category.objects.create(name="Обеды")
+        self.first = Producer.objects.create(
+            name="Первый", delivery_price_to_building=100.0, delivery_price_to_door=150.0
+        )
+        self.second = Producer.objects.create(
+            name="Второй", delivery_price_to_building=60.0, delivery_price_to_door=80.0
+        )
+        self.soup = Dish.objects.create(
+            name="Суп", price=200, category=category, producer=self.first, cooking_time_minutes=20
+        )
+        self.pilaf = Dish.objects.create(
+            name="Плов", price=300, category=category, producer=self.first, cooking_time_minutes=40
+        )
+        self.salad = Dish.objects.create(
+            name="Салат", price=120, category=category, producer=self.second, cooking_time_minutes=10
+        )
+        cart = Cart.objects.create(user=self.user)
+        cart.add_item(self.soup, quantity=2)
+        cart.add_item(self.pilaf)
+        cart.add_item(self.salad)
+        PromoCode.objects.create(
+            producer=self.second, code="SALAD", reward_type="FREE_DELIVERY", recipient_phone="123"
+        )
+
+    def test_quote_groups_cart_by_producer(self):
+        with mock.patch(
+            "api.services.delivery_quote_service.CompiledDeliveryPricing.surcharge_at",
+            return_value=0.0,
+        ):
+            # Корзина, позиции с блюдами и магазинами, промокод
+            with self.assertNumQueries(3):
+                response = self.client.post(
+                    "/api/cart/quote/", {"promo_code_text": "SALAD"}, format="json"
+                )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        producers = {group["producer"]: group for group in response.data["producers"]}
+        first = producers[str(self.first.id)]
+        second = producers[str(self.second.id)]
+
+        self.assertEqual(len(first["items"]), 2)
+        self.assertEqual(first["items_price"], 700.0)
+        self.assertEqual(first["delivery_price"], 100.0)
+        self.assertEqual(first["total_price"], 800.0)
+        self.assertEqual(first["estimated_cooking_time"], 40)
+        self.assertIsNone(first["promo_code"])
+        # Доставка магазина - на первой позиции, как в заказах при оформлении
+        self.assertEqual([item["delivery_price"] for item in first["items"]], [100.0, 0.0])
+        self.assertEqual(
+            [item["total_price"] for item in first["items"]],
+            [item["items_price"] + item["delivery_price"] for item in first["items"]],
+        )
+
+        self.assertEqual(second["promo_code"], "SALAD")
+        self.assertEqual(second["discount_amount"], 60.0)
+        self.assertEqual(second["total_price"], 120.0)
+        self.assertEqual(
+            [(item["delivery_price"], item["total_price"]) for item in second["items"]],
+            [(60.0, 120.0)],
+        )
+
+        self.assertEqual(response.data["total_price"], 920.0)
+        self.assertEqual(response.data["estimated_cooking_time"], 40)
+
+    def test_empty_cart(self):
+        self.user.cart.clear()
+
+        response = self.client.post("/api/cart/quote/", {}, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["producers"], [])
+        self.assertEqual(response.data["total_price"], 0)
+
+
+@mock.patch(
+    "api.services.scheduling_service.SchedulingService.is_store_open_now",
+    return_value=(True, None),
+)
+class CartCheckoutTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="checkout@test.com", email="checkout@test.com", password="password123")
+        self.client.force_authenticate(user=self.user)
+        category = Category.objects.create(name="Ужины")
+        self.first = Producer.objects.create(
+            name="Кухня", delivery_price_to_building=100.0, delivery_price_to_door=150.0
+        )
+        self.second = Producer.objects.create(
+            name="Пекарня", delivery_price_to_building=60.0, delivery_price_to_door=80.0
+        )
+        self.soup = Dish.objects.create(name="Суп", price=200, category=category, producer=self.first)
+        self.pilaf = Dish.objects.create(name="Плов", price=300, category=category, producer=self.first)
+        self.bread = Dish.objects.create(name="Хлеб", price=50, category=category, producer=self.second)
+        self.cart = Cart.objects.create(user=self.user)
+        self.cart.add_item(self.soup, quantity=2)
+        self.cart.add_item(self.pilaf)
+        self.cart.add_item(self.bread)
+        self.data = {"phone": "+994500000000", "delivery_address_text": "Баку, ул. Низами 1"}
+
+    def checkout(self, **extra):
+        with mock.patch(
+            "api.services.delivery_quote_service.CompiledDeliveryPricing.surcharge_at",
+            return_value=0.0,
+        ):
+            return self.client.post("/api/cart/checkout/", {**self.data, **extra}, format="json")
+
+    def test_checkout_creates_orders_and_one_event(self, _open):
+        PromoCode.objects.create(
+            producer=self.first, code="MINUS", reward_type="DISCOUNT", reward_value="450", recipient_phone="1"
+        )
+
+        response = self.checkout(promo_code_text="MINUS")
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        orders = {order.dish_id: order for order in Order.objects.filter(user=self.user)}
+        self.assertEqual(len(orders), 3)
+        # Доставка начисляется один раз на магазин, скидка - по порядку заказов
+        first_orders = [orders[self.soup.id], orders[self.pilaf.id]]
+        self.assertEqual(sum(float(order.delivery_price) for order in first_orders), 100.0)
+        self.assertEqual(sum(float(order.discount_amount) for order in first_orders), 450.0)
+        self.assertEqual(sum(float(order.total_price) for order in first_orders), 350.0)
+        self.assertEqual(float(orders[self.bread.id].total_price), 110.0)
+        self.assertEqual(response.data["total_price"], 460.0)
+        self.assertTrue(all(order.status == "WAITING_FOR_PAYMENT" for order in orders.values()))
+        self.assertEqual(orders[self.bread.id].delivery_address_text, "Баку, ул. Низами 1")
+
+        self.assertTrue(PromoCode.objects.get(code="MINUS").is_used)
+        self.assertFalse(self.cart.items.exists())
+        event = OutboxEvent.objects.get(aggregate_type="checkout")
+        self.assertEqual(str(event.aggregate_id), response.data["checkout_id"])
+        self.assertEqual(len(event.payload["order_ids"]), 3)
+
+    def test_checkout_invalidates_order_list_tags(self, _open):
+        from core.cache import cache_service
+
+        tags = [f"user:{self.user.pk}:orders", f"producer:{self.first.pk}:orders", f"producer:{self.second.pk}:orders"]
+        before = cache_service.tag_versions(tags)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.checkout().status_code, status.HTTP_201_CREATED)
+
+        after = cache_service.tag_versions(tags)
+        self.assertTrue(all(after[tag] != before[tag] for tag in tags))
+
+    def test_repeat_customer_discount_per_producer(self, _open):
+        Order.objects.create(
+            user=self.user, user_name="b", phone="1", dish=self.bread, producer=self.second,
+            quantity=1, total_price=50, status="COMPLETED",
+        )
+
+        self.checkout()
+
+        new_orders = Order.objects.filter(user=self.user, status="WAITING_FOR_PAYMENT")
+        rates = {order.producer_id: float(order.commission_rate_snapshot) for order in new_orders}
+        self.assertAlmostEqual(rates[self.second.id], self.second.total_commission_rate - 0.01)
+        self.assertAlmostEqual(rates[self.first.id], self.first.total_commission_rate)
+
+    def test_full_slot_rolls_back_checkout(self, _open):
+        from api.models import SlotOccupancy
+        from api.services.scheduling_service import SchedulingService
+
+        Producer.objects.filter(pk=self.first.pk).update(max_orders_per_slot=2)
+        scheduled = timezone.now() + timedelta(days=1)
+        SlotOccupancy.objects.create(
+            producer=self.first, slot_start=SchedulingService.get_slot_start(scheduled), orders_count=1
+        )
+
+        with mock.patch.object(SchedulingService, "validate_scheduled_time", return_value=(True, "")):
+            response = self.checkout(scheduled_delivery_time=scheduled.isoformat())
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("scheduled_delivery_time", response.data)
+        self.assertFalse(Order.objects.filter(user=self.user).exists())
+        self.assertEqual(self.cart.items.count(), 3)
+
+    def test_reserve_takes_all_places_at_once(self, _open):
+        from api.services.slot_occupancy_service import SlotOccupancyService
+
+        slots = SlotOccupancyService()
+        scheduled = timezone.now() + timedelta(days=1)
+
+        self.assertTrue(slots.reserve(self.first, scheduled, capacity=3, count=2))
+        self.assertFalse(slots.reserve(self.first, scheduled, capacity=3, count=2))
+        self.assertTrue(slots.reserve(self.first, scheduled, capacity=3, count=1))
+        self.assertEqual(slots.get_count(self.first, scheduled), 3)
+
+    def test_empty_cart(self, _open):
+        self.cart.clear()
+
+        response = self.checkout()
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class BulkRatingServiceTestCase(TestCase):
+    def setUp(self):
+        self.buyer = User.objects.create_user(username="rater@test.com", email="rater@test.com", password="password123")
+        category = Category.objects.create(name="Десерты")
+        self.producers = [
+            Producer.objects.create(name=f"Магазин {index}", penalty_points=index) for index in range(3)
+        ]
+        self.dishes = [
+            Dish.objects.create(name=f"Торт {index}", price=100, category=category, producer=producer)
+            for index, producer in enumerate(self.producers)
+        ]
+        now = timezone.now()
+        reviews = [
+            # (магазин, вкус, вид, сервис, возраст в днях, возврат принят)
+            (0, 5, 4, 5, 1, False),
+            (0, 3, 3, 2, 45, False),
+            (0, 5, 5, 5, 200, True),
+            (1, 4, 4, 4, 31, False),
+            (1, 2, 5, 3, 91, False),
+        ]
+        for producer_index, taste, appearance, service, age_days, refund in reviews:
+            order = self._order(producer_index, "COMPLETED")
+            review = Review.objects.create(
+                order=order,
+                user=self.buyer,
+                producer=self.producers[producer_index],
+                rating_taste=taste,
+                rating_appearance=appearance,
+                rating_service=service,
+                refund_accepted=refund,
+            )
+            Review.objects.filter(pk=review.pk).update(created_at=now - timedelta(days=age_days))
+        cancelled = self._order(0, "CANCELLED")
+        Order.objects.filter(pk=cancelled.pk).update(cancelled_by="SYSTEM")
+        from api.models import Dispute
+
+        Dispute.objects.create(
+            order=cancelled, reason="QUALITY", description="Холодный", status="RESOLVED_BUYER_WON"
+        )
+
+    def _order(self, producer_index, order_status):
+        return Order.objects.create(
+            user=self.buyer,
+            user_name="Покупатель",
+            phone="1",
+            dish=self.dishes[producer_index],
+            producer=self.producers[producer_index],
+            quantity=1,
+            total_price=100,
+            status=order_status,
+        )
+
+    def test_matches_rating_service(self):
+        from api.services.bulk_rating_service import BulkRatingService
+        from api.services.rating_service import RatingService
+
+        service = RatingService()
+        expected_producers = {}
+        for producer in self.producers:
+            service.recalc_for_producer(producer)
+            expected_producers[producer.pk] = (producer.rating, producer.rating_count)
+        expected_dishes = {}
+        for dish in self.dishes:
+            dish = Dish.objects.select_related("producer").get(pk=dish.pk)
+            service.recalc_for_dish(dish)
+            expected_dishes[dish.pk] = (dish.rating, dish.rating_count, dish.sort_score)
+        Producer.objects.update(rating=0, rating_count=0)
+        Dish.objects.update(rating=0, rating_count=0, sort_score=0)
+
+        # Магазин и блюдо без отзывов остаются с нулевым рейтингом и не пишутся
+        self.assertEqual(BulkRatingService().recalc_all(), (2, 2))
+
+        for producer in Producer.objects.filter(pk__in=expected_producers):
+            rating, count = expected_producers[producer.pk]
+            self.assertAlmostEqual(producer.rating, rating, places=9)
+            self.assertEqual(producer.rating_count, count)
+        for dish in Dish.objects.filter(pk__in=expected_dishes):
+            rating, count, sort_score = expected_dishes[dish.pk]
+            self.assertAlmostEqual(dish.rating, rating, places=9)
+            self.assertEqual(dish.rating_count, count)
+            self.assertAlmostEqual(dish.sort_score, sort_score, places=9)
+
+    def test_query_count_does_not_depend_on_producers(self):
+        from api.services.bulk_rating_service import BulkRatingService
+
+        service = BulkRatingService()
+        service.recalc_producers()
+        # Отзывы, заказы, споры, магазины и savepoint транзакции; без изменений ничего не пишется
+        with self.assertNumQueries(6):
+            self.assertEqual(service.recalc_producers(), 0)
+
+
+class RatingRefreshQueueTestCase(TestCase):
+    def setUp(self):
+        from api.services.rating_refresh_service import (
+            RatingRefreshQueue,
+            rating_refresh_queue,
+        )
+
+        # Пометки копятся только при явном buffered: в тестах кэш - LocMemCache
+        self.queue = RatingRefreshQueue(buffered=True)
+        patcher = mock.patch.object(rating_refresh_queue, "buffered", True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.queue.refresh()
+        self.client = APIClient()
+        self.buyer = User.objects.create_user(username="reviewer@test.com", email="reviewer@test.com", password="password123")
+        self.client.force_authenticate(user=self.buyer)
+        category = Category.objects.create(name="Выпечка")
+        self.producer = Producer.objects.create(name="Булочная")
+        self.dish = Dish.objects.create(name="Самса", price=80, category=category, producer=self.producer)
+        self.orders = [
+            Order.objects.create(
+                user=self.buyer, user_name="Покупатель", phone="1", dish=self.dish,
+                producer=self.producer, quantity=1, total_price=80, status="COMPLETED",
+            )
+            for _ in range(3)
+        ]
+
+    def test_reviews_only_mark_and_refresh_coalesces(self):
+        from api.services.bulk_rating_service import BulkRatingService
+
+        with self.captureOnCommitCallbacks(execute=True):
+            for order in self.orders:
+                response = self.client.post(
+                    "/api/reviews/",
+                    {"order": order.id, "rating_taste": 5, "rating_appearance": 4, "rating_service": 3},
+                )
+                self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        self.producer.refresh_from_db()
+        self.assertEqual(self.producer.rating_count, 0)
+
+        with mock.patch.object(
+            BulkRatingService, "recalc_producers", autospec=True, side_effect=BulkRatingService.recalc_producers
+        ) as recalc:
+            self.assertEqual(self.queue.refresh(), (1, 1))
+        recalc.assert_called_once()
+
+        self.producer.refresh_from_db()
+        self.dish.refresh_from_db()
+        self.assertEqual(self.producer.rating_count, 3)
+        self.assertEqual(self.dish.rating_count, 3)
+        self.assertGreater(self.dish.sort_score, 0)
+        # Пометки забраны
+        self.assertEqual(self.queue.refresh(), (0, 0))
+
+    def test_mark_waits_for_commit(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            self.queue.mark_producer(self.producer.pk)
+
+        self.assertEqual(self.queue.refresh(), (0, 0))
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.queue.refresh(), (1, 0))
+
+    def test_order_completion_marks_producer(self):
+        order = self.orders[0]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.queue.on_status_change(order, "ARRIVED")
+            self.queue.on_status_change(order, "COMPLETED")
+
+        self.assertEqual(self.queue.refresh(), (1, 0))
+
+    def test_process_local_cache_refreshes_after_commit(self):
+        from api.models import Review
+        from api.services.rating_refresh_service import RatingRefreshQueue
+
+        queue = RatingRefreshQueue()
+        self.assertFalse(queue.is_buffered())
+        Review.objects.create(
+            order=self.orders[0], user=self.buyer, producer=self.producer,
+            rating_taste=5, rating_appearance=5, rating_service=5,
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            queue.mark_order(self.orders[0])
+
+        self.producer.refresh_from_db()
+        self.dish.refresh_from_db()
+        self.assertEqual((self.producer.rating_count, self.dish.rating_count), (1, 1))
+        self.assertEqual(queue.refresh(), (0, 0))
+
+
+class RepeatPurchaseStatsTestCase(TestCase):
+    def setUp(self):
+        from api.services.repeat_purchase_service import RepeatPurchaseService
+
+        self.service = RepeatPurchaseService()
+        category = Category.objects.create(name="Напитки")
+        self.producer = Producer.objects.create(name="Чайная")
+        self.other_producer = Producer.objects.create(name="Кофейня")
+        self.tea = Dish.objects.create(name="Чай", price=10, category=category, producer=self.producer)
+        self.coffee = Dish.objects.create(name="Кофе", price=20, category=category, producer=self.other_producer)
+        self.buyer = User.objects.create_user(username="regular@test.com", email="regular@test.com", password="password123")
+        Profile.objects.get_or_create(user=self.buyer)
+        self.start = timezone.now() - timedelta(days=10)
+        for days, dish in [(0, self.tea), (1, self.tea), (2, self.tea), (3, self.coffee)]:
+            self._completed(dish, self.start + timedelta(days=days))
+
+    def _completed(self, dish, at, user=None):
+        order = Order.objects.create(
+            user=user or self.buyer, user_name="Гость", phone="1", dish=dish,
+            producer=dish.producer, quantity=1, total_price=dish.price, status="COMPLETED",
+        )
+        Order.objects.filter(pk=order.pk).update(created_at=at, delivered_at=at, completion_changed_at=at)
+        return order
+
+    def test_full_recompute_is_idempotent(self):
+        for _ in range(2):
+            call_command("update_repeat_purchase_stats", "--full", stdout=mock.MagicMock())
+
+        profile = Profile.objects.get(user=self.buyer)
+        self.assertEqual((profile.total_orders, profile.repeated_orders), (4, 2))
+        self.assertEqual(float(profile.repeat_purchase_rate), 50.0)
+        self.tea.refresh_from_db()
+        self.coffee.refresh_from_db()
+        self.assertEqual((self.tea.repeat_purchase_count, self.coffee.repeat_purchase_count), (2, 0))
+
+    def test_incremental_only_touches_recent_orders(self):
+        self.service.update_stats(full=True)
+        newcomer = User.objects.create_user(username="new@test.com", email="new@test.com", password="password123")
+        self._completed(self.coffee, timezone.now(), user=newcomer)
+        # Изменение вне окна инкрементального прохода не подхватывается
+        Profile.objects.filter(user=self.buyer).update(total_orders=0)
+
+        # Чтение и запись контрольной точки, затронутые покупатели и блюда, по агрегату
+        # и выборке на профили и блюда, вставка недостающего профиля и savepoint транзакции
+        with self.assertNumQueries(11):
+            self.assertEqual(self.service.update_stats(), (1, 0))
+
+        self.assertEqual(Profile.objects.get(user=newcomer).total_orders, 1)
+        self.assertEqual(Profile.objects.get(user=self.buyer).total_orders, 0)
+
+    def test_incremental_recounts_other_dishes_of_the_pair(self):
+        from api.services.order_status import OrderActor, OrderStatusService
+
+        pie = Dish.objects.create(name="Пирог", price=30, category=self.tea.category, producer=self.producer)
+        late = User.objects.create_user(username="late@test.com", email="late@test.com", password="password123")
+        earlier = Order.objects.create(
+            user=late, user_name="Гость", phone="1", dish=pie,
+            producer=self.producer, quantity=1, total_price=30, status="ARRIVED",
+        )
+        Order.objects.filter(pk=earlier.pk).update(created_at=self.start + timedelta(days=4))
+        self._completed(self.tea, self.start + timedelta(days=5), user=late)
+        self.service.update_stats(full=True)
+        self.tea.refresh_from_db()
+        self.assertEqual(self.tea.repeat_purchase_count, 2)
+
+        # Более ранний заказ завершается позже: чай покупателя становится повторным
+        OrderStatusService().complete_by_buyer(earlier.id, OrderActor(user=late, role="BUYER"))
+        self.service.update_stats()
+
+        self.tea.refresh_from_db()
+        pie.refresh_from_db()
+        self.assertEqual((self.tea.repeat_purchase_count, pie.repeat_purchase_count), (3, 0))
+
+    def test_incremental_picks_up_dispute_transitions(self):
+        from api.services.dispute_service import DisputeService
+
+        self.service.update_stats(full=True)
+        # Контрольная точка в БД переживает очистку кэша
+        cache.clear()
+        order = Order.objects.filter(user=self.buyer, dish=self.coffee).get()
+        DisputeService().open_for_order(order, "BUYER", self.buyer, "OTHER", "Остыл")
+
+        self.assertEqual(self.service.update_stats(), (1, 0))
+        self.assertEqual(Profile.objects.get(user=self.buyer).total_orders, 3)
+
+
+class ProducerCustomerStatsTestCase(TestCase):
+    def setUp(self):
+        from api.services.repeat_purchase_service import RepeatPurchaseService
+
+        self.service = RepeatPurchaseService()
+        category = Category.objects.create(name="Выпечка")
+        self.producer = Producer.objects.create(name="Пекарня")
+        self.dish = Dish.objects.create(name="Хлеб", price=10, category=category, producer=self.producer)
+        self.regular = User.objects.create_user(
+            username="loyal@test.com", email="loyal@test.com", password="password123", first_name="Лейла"
+        )
+        self.newcomer = User.objects.create_user(username="once@test.com", email="once@test.com", password="password123")
+        for user, total_price in [(self.regular, 10), (self.regular, 25), (self.regular, 5), (self.newcomer, 40)]:
+            self._order(user, "COMPLETED", total_price)
+        self._order(self.newcomer, "CANCELLED", 10)
+
+    def _order(self, user, status_value, total_price=10):
+        return Order.objects.create(
+            user=user, user_name="Гость", phone="1", dish=self.dish, producer=self.producer,
+            quantity=1, total_price=total_price, status=status_value,
+        )
+
+    def test_backfill_and_lookups(self):
+        call_command("backfill_producer_customer_stats", stdout=mock.MagicMock())
+
+        with self.assertNumQueries(1):
+            stats = self.service.get_producer_repeat_stats(self.producer)
+        self.assertEqual(
+            stats,
+            {
+                "total_customers": 2,
+                "repeat_customers": 1,
+                "total_orders": 4,
+                "repeat_orders": 2,
+                "repeat_rate": 50.0,
+                "commission_bonus_percentage": 1.0,
+            },
+        )
+        with self.assertNumQueries(1):
+            customers = self.service.get_repeat_customers(self.producer)
+        self.assertEqual(len(customers), 1)
+        self.assertEqual(customers[0]["user_id"], str(self.regular.pk))
+        self.assertEqual(customers[0]["name"], "Лейла")
+        self.assertEqual((customers[0]["order_count"], customers[0]["total_spent"]), (3, 40.0))
+        self.assertEqual(self.service.calculate_commission_bonus(self.producer), Decimal("0.01"))
+
+    def test_completion_updates_stats_incrementally(self):
+        from api.models import ProducerCustomerStats
+        from api.services.order_status import OrderActor, OrderStatusService
+
+        call_command("backfill_producer_customer_stats", stdout=mock.MagicMock())
+        order = self._order(self.newcomer, "ARRIVED", 15)
+        OrderStatusService().complete_by_buyer(order.id, OrderActor(user=self.newcomer, role="BUYER"))
+
+        stats = ProducerCustomerStats.objects.get(producer=self.producer, user=self.newcomer)
+        self.assertEqual((stats.order_count, float(stats.total_spent)), (2, 55.0))
+        self.assertEqual(stats.last_order_at, order.created_at)
+        self.assertEqual(self.service.get_producer_repeat_stats(self.producer)["repeat_customers"], 2)
+
+    def test_disputes_update_stats(self):
+        from api.models import ProducerCustomerStats
+        from api.services.dispute_service import DisputeService
+
+        call_command("backfill_producer_customer_stats", stdout=mock.MagicMock())
+        order = Order.objects.get(user=self.newcomer, status="COMPLETED")
+        service = DisputeService()
+
+        dispute = service.open_for_order(order, "BUYER", self.newcomer, "OTHER", "Не тот хлеб")
+        stats = ProducerCustomerStats.objects.get(producer=self.producer, user=self.newcomer)
+        self.assertEqual((stats.order_count, stats.last_order_at), (0, None))
+
+        service.resolve_for_order(order, dispute, "seller_won")
+        stats.refresh_from_db()
+        self.assertEqual((stats.order_count, float(stats.total_spent)), (1, 40.0))
+
+    def test_rebuild_fixes_stats_in_place(self):
+        from api.models import ProducerCustomerStats
+        from api.services.producer_customer_stats_service import (
+            ProducerCustomerStatsService,
+        )
+
+        call_command("backfill_producer_customer_stats", stdout=mock.MagicMock())
+        regular = ProducerCustomerStats.objects.get(producer=self.producer, user=self.regular)
+        ProducerCustomerStats.objects.filter(pk=regular.pk).update(order_count=7)
+        Order.objects.filter(user=self.newcomer).delete()
+
+        self.assertEqual(ProducerCustomerStatsService().rebuild(), 1)
+
+        # Строки исправляются на месте, а не пересоздаются
+        regular.refresh_from_db()
+        self.assertEqual(regular.order_count, 3)
+        self.assertFalse(ProducerCustomerStats.objects.filter(user=self.newcomer).exists())
+        self.assertEqual(ProducerCustomerStatsService().rebuild(), 0)
+
+    def test_migration_backfill_matches_rebuild(self):
+        import importlib
+
+        from django.apps import apps
+        from django.db import connection
+
+        from api.models import ProducerCustomerStats
+        from api.services.producer_customer_stats_service import (
+            ProducerCustomerStatsService,
+        )
+
+        migration = importlib.import_module("api.migrations.0066_producer_customer_stats")
+        migration.backfill_customer_stats(apps, connection.schema_editor())
+        backfilled = set(ProducerCustomerStats.objects.values_list("producer_id", "user_id", "order_count", "total_spent"))
+
+        ProducerCustomerStatsService().rebuild()
+        rebuilt = set(ProducerCustomerStats.objects.values_list("producer_id", "user_id", "order_count", "total_spent"))
+        self.assertEqual(backfilled, rebuilt)
+        self.assertEqual(len(rebuilt), 2)
+
+
+class ChatThreadTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.seller = User.objects.create_user(username="inbox-seller@test.com", email="inbox-seller@test.com", password="password123")
+        self.buyers = [
+            User.objects.create_user(username=f"inbox-buyer{i}@test.com", email=f"inbox-buyer{i}@test.com", password="password123")
+            for i in range(3)
+        ]
+
+    def _send(self, sender, recipient, content):
+        self.client.force_authenticate(user=sender)
+        response = self.client.post("/api/messages/", {"recipient": recipient.id, "content": content})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data["id"]
+
+    def test_inbox_is_one_query(self):
+        for buyer in self.buyers:
+            self._send(buyer, self.seller, f"Привет от {buyer.username}")
+            self._send(buyer, self.seller, "Где заказ?")
+        self._send(self.seller, self.buyers[0], "Уже едет")
+
+        with self.assertNumQueries(1):
+            inbox = ChatService.get_conversation_partners(self.seller)
+
+        self.assertEqual(
+            [(entry["partner_id"], entry["unread_count"]) for entry in inbox],
+            [(str(self.buyers[0].id), 2), (str(self.buyers[2].id), 2), (str(self.buyers[1].id), 2)],
+        )
+        self.assertEqual(inbox[0]["last_message_text"], "Уже едет")
+        self.assertEqual(ChatService.get_conversation_partners(self.buyers[0])[0]["unread_count"], 1)
+
+    def test_read_updates_unread_counters(self):
+        first_id = self._send(self.buyers[0], self.seller, "Раз")
+        self._send(self.buyers[0], self.seller, "Два")
+
+        self.client.force_authenticate(user=self.seller)
+        self.client.post(f"/api/messages/{first_id}/mark_read/")
+        self.client.post(f"/api/messages/{first_id}/mark_read/")
+        self.assertEqual(ChatService.get_conversation_partners(self.seller)[0]["unread_count"], 1)
+
+        self.assertEqual(ChatService.mark_messages_as_read(self.seller, str(self.buyers[0].id)), 1)
+        response = self.client.get("/api/messages/conversations/")
+        self.assertEqual(response.data[0]["unread_count"], 0)
+        self.assertEqual(response.data[0]["last_message_text"], "Два")
+
+    def test_messages_are_immutable(self):
+        message_id = self._send(self.buyers[0], self.seller, "Исходный текст")
+
+        response = self.client.patch(f"/api/messages/{message_id}/", {"content": "Другой текст"})
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+        response = self.client.delete(f"/api/messages/{message_id}/")
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+        self.assertEqual(
+            ChatService.get_conversation_partners(self.buyers[0])[0]["last_message_text"], "Исходный текст"
+        )
+
+    def test_rebuild_matches_incremental_threads(self):
+        for buyer in self.buyers:
+            self._send(buyer, self.seller, "Здравствуйте")
+        self._send(self.seller, self.buyers[1], "Добрый день")
+        before = ChatService.get_conversation_partners(self.seller)
+
+        call_command("rebuild_chat_threads", stdout=mock.MagicMock())
+
+        self.assertEqual(ChatService.get_conversation_partners(self.seller), before)
+
+
+class PushServiceTestCase(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user(username="push-seller@test.com", email="push-seller@test.com", password="password123")
+        self.buyer = User.objects.create_user(username="push-buyer@test.com", email="push-buyer@test.com", password="password123")
+        self.producer = Producer.objects.create(name="Push Producer", user=self.seller)
+        category = Category.objects.create(name="Push Category")
+        self.dish = Dish.objects.create(name="Push Dish", price=10, category=category, producer=self.producer)
+
+    def _roundtrip(self, broker):
+        import asyncio
+
+        async def scenario():
+            mine = broker.subscribe(self.buyer.pk)
+            other = broker.subscribe(self.seller.pk)
+            await asyncio.to_thread(broker.publish, [str(self.buyer.pk)], {"id": "1", "type": "ping", "payload": {}})
+            received = await mine.get(timeout=1)
+            missed = await other.get(timeout=0.05)
+            broker.unsubscribe(mine)
+            broker.unsubscribe(other)
+            return received, missed
+
+        return asyncio.run(scenario())
+
+    def test_in_process_broker_delivers_to_user_subscriptions(self):
+        from api.services.push_service import InProcessBroker
+
+        received, missed = self._roundtrip(InProcessBroker())
+        self.assertEqual(received["type"], "ping")
+        self.assertIsNone(missed)
+
+    def test_redis_broker_relays_through_pubsub(self):
+        from api.services.push_service import InMemoryPubSubClient, RedisPubSubBroker
+
+        received, missed = self._roundtrip(RedisPubSubBroker(client=InMemoryPubSubClient()))
+        self.assertEqual(received, {"id": "1", "type": "ping", "payload": {}})
+        self.assertIsNone(missed)
+
+    def test_status_change_and_chat_are_pushed_after_commit(self):
+        from api.services.order_status import OrderActor, OrderStatusService
+
+        broker = mock.MagicMock()
+        order = Order.objects.create(
+            user=self.buyer, user_name="Гость", phone="1", dish=self.dish, producer=self.producer,
+            quantity=1, total_price=10, status="ARRIVED",
+        )
+        with mock.patch("api.services.push_service.get_broker", return_value=broker):
+            with self.captureOnCommitCallbacks() as callbacks:
+                OrderStatusService().complete_by_buyer(order.id, OrderActor(user=self.buyer, role="BUYER"))
+            broker.publish.assert_not_called()
+            for callback in callbacks:
+                callback()
+
+            published = {
+                event["type"]: (user_ids, event)
+                for user_ids, event in (call.args for call in broker.publish.call_args_list)
+            }
+            user_ids, event = published["order_status"]
+            self.assertEqual(user_ids, sorted([str(self.buyer.pk), str(self.seller.pk)]))
+            self.assertEqual(event["payload"]["status"], "COMPLETED")
+            self.assertEqual(published["notification"][0], [str(self.buyer.pk)])
+
+            client = APIClient()
+            client.force_authenticate(user=self.buyer)
+            with self.captureOnCommitCallbacks(execute=True):
+                client.post("/api/messages/", {"recipient": self.seller.id, "content": "Спасибо!"})
+            user_ids, event = broker.publish.call_args.args
+            self.assertEqual(event["type"], "chat_message")
+            self.assertEqual(event["payload"]["content"], "Спасибо!")
+            self.assertEqual(event["payload"]["recipient_unread_count"], 1)
+
+    def test_event_stream_requires_asgi(self):
+        from django.test import Client
+
+        self.assertEqual(Client().get("/api/events/").status_code, status.HTTP_501_NOT_IMPLEMENTED)
+
+    def test_redis_broker_requires_redis(self):
+        from django.core.exceptions import ImproperlyConfigured
+
+        from api.services.push_service import RedisPubSubBroker
+
+        with mock.patch.dict("os.environ", {"REDIS_URL": ""}), self.assertRaises(ImproperlyConfigured):
+            RedisPubSubBroker()
+
+    async def test_event_stream_delivers_events(self):
+        from asgiref.sync import sync_to_async
+        from rest_framework_simplejwt.tokens import AccessToken
+
+        from api.services.push_service import get_broker
+
+        response = await self.async_client.get("/api/events/")
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        token = await sync_to_async(lambda: str(AccessToken.for_user(self.buyer)))()
+        response = await self.async_client.get("/api/events/", {"token": token})
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), b"retry: 3000\n\n")
+
+        get_broker().publish([str(self.buyer.pk)], {"id": "e1", "type": "notification", "payload": {"title": "Привет"}})
+        chunk = await anext(stream)
+        self.assertEqual(
+            chunk.decode(), 'id: e1\nevent: notification\ndata: {"title": "Привет"}\n\n'
+        )
+        await stream.aclose()
+
+
+class KeysetPaginationTestCase(TestCase):
+    def setUp(self):
+        from api.models import Notification
+
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="pages@test.com", email="pages@test.com", password="password123")
+        self.client.force_authenticate(user=self.user)
+        base = timezone.now() - timedelta(hours=1)
+        notifications = [Notification.objects.create(user=self.user, title=f"N{i}", message="-") for i in range(5)]
+        # Две последние с одинаковым created_at: порядок между ними решает id
+        for index, notification in enumerate(notifications):
+            created_at = base + timedelta(minutes=min(index, 3))
+            Notification.objects.filter(pk=notification.pk).update(created_at=created_at)
+        self.expected = [
+            str(pk)
+            for pk in Notification.objects.order_by("-created_at", "-id").values_list("id", flat=True)
+        ]
+
+    def test_walks_pages_forward_and_back(self):
+        seen, url, pages = [], "/api/notifications/?page_size=2", []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertTrue(response.data["success"])
+            pages.append(response.data)
+            seen.extend(item["id"] for item in response.data["data"])
+            url = response.data["pagination"]["next"]
+
+        self.assertEqual(seen, self.expected)
+        self.assertEqual(len(pages), 3)
+        self.assertIsNone(pages[0]["pagination"]["previous"])
+        self.assertEqual(pages[0]["pagination"]["count"], 5)
+
+        response = self.client.get(pages[2]["pagination"]["previous"])
+        self.assertEqual([item["id"] for item in response.data["data"]], self.expected[2:4])
+        response = self.client.get(response.data["pagination"]["previous"])
+        self.assertEqual([item["id"] for item in response.data["data"]], self.expected[:2])
+        self.assertIsNone(response.data["pagination"]["previous"])
+
+    def test_count_modes(self):
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/notifications/", {"count": "none"})
+        self.assertIsNone(response.data["pagination"]["count"])
+        self.assertEqual(len(response.data["data"]), 5)
+
+        response = self.client.get("/api/notifications/", {"count": "estimate"})
+        self.assertEqual(response.data["pagination"]["count_mode"], "estimate")
+        self.assertEqual(response.data["pagination"]["count"], 5)
+
+        self.assertEqual(self.client.get("/api/notifications/", {"cursor": "garbage"}).status_code, status.HTTP_404_NOT_FOUND)
+
+
+class CacheTagsTestCase(TestCase):
+    def setUp(self):
+        from core.cache import CommonCacheKeys, cache_service, model_cache_service
+
+        cache.clear()
+        self.keys = CommonCacheKeys
+        self.cache_service = cache_service
+        self.model_cache = model_cache_service
+        self.producer = Producer.objects.create(name="Tagged Producer")
+        self.dish = Dish.objects.create(
+            name="Tagged Dish", price=10, category=Category.objects.create(name="Tagged"), producer=self.producer
+        )
+
+    def test_invalidating_a_tag_drops_only_dependent_entries(self):
+        self.cache_service.set("menu", "cached menu", tags=["producer:1", "dish:7"])
+        self.cache_service.set("banner", "cached banner", tags=["producer:2"])
+
+        self.cache_service.invalidate_tags("dish:7")
+
+        self.assertIsNone(self.cache_service.get("menu", tags=["producer:1", "dish:7"]))
+        self.assertEqual(self.cache_service.get("banner", tags=["producer:2"]), "cached banner")
+
+    def test_invalidating_an_unread_tag_stores_no_counter(self):
+        self.cache_service.invalidate_tags("order:never-read")
+
+        self.assertIsNone(cache.get(self.cache_service.TAG_KEY.format(tag="order:never-read")))
+        # Время изменения хранится только для тегов моделей
+        self.assertIsNone(cache.get(self.cache_service.TAG_TIME_KEY.format(tag="order:never-read")))
+
+    def test_tag_keys_expire(self):
+        with mock.patch("core.cache.cache.add", wraps=cache.add) as add:
+            self.cache_service.set("menu", "cached menu", tags=["banner"])
+            self.cache_service.tag_stamps(["banner"])
+
+        self.assertGreaterEqual(self.cache_service.TAG_TIMEOUT, 24 * 3600 + self.cache_service.stale_timeout)
+        timeouts = {call.args[0]: call.args[2] for call in add.call_args_list}
+        self.assertEqual(
+            timeouts,
+            {
+                self.cache_service.TAG_KEY.format(tag="banner"): self.cache_service.TAG_TIMEOUT,
+                self.cache_service.TAG_TIME_KEY.format(tag="banner"): self.cache_service.TAG_TIMEOUT,
+            },
+        )
+
+    def test_model_changes_invalidate_tagged_entries(self):
+        self.model_cache.get_model_instance(Producer, self.producer.pk)
+        with self.assertNumQueries(0):
+            self.model_cache.get_model_instance(Producer, self.producer.pk)
+
+        key, timeout, tags = self.keys.producer_detail(self.producer.pk)
+        self.cache_service.set(key, {"name": "Tagged Producer"}, timeout, tags=tags)
+
+        # Изменение блюда сбрасывает всё, что помечено тегом его магазина
+        with self.captureOnCommitCallbacks(execute=True):
+            self.dish.price = 12
+            self.dish.save()
+
+        self.assertIsNone(self.cache_service.get(key, tags=tags))
+        with self.assertNumQueries(1):
+            self.model_cache.get_model_instance(Producer, self.producer.pk)
+
+
+class ReadThroughCacheTestCase(TestCase):
+    def setUp(self):
+        from core.cache import CacheService
+
+        cache.clear()
+        self.service = CacheService()
+        self.service.metrics.snapshot(reset=True)
+
+    def test_single_flight_recomputes_once(self):
+        import threading
+        import time
+
+        calls = []
+
+        def loader():
+            calls.append(1)
+            time.sleep(0.2)
+            return ["top", "dishes"]
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(self.service.fetch("top:dishes", loader, 60)))
+            for _ in range(6)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [["top", "dishes"]] * 6)
+        stats = self.service.metrics.snapshot()["top"]
+        self.assertEqual((stats["recomputes"], stats["misses"], stats["lock_waits"]), (1, 1, 5))
+
+    def test_stale_value_is_served_while_another_worker_recomputes(self):
+        import time
+
+        from core.cache import CacheEntry
+
+        cache.set("producer:hot", CacheEntry("old", time.time() - 1, 0.01), 60)
+        cache.add("producer:hot" + self.service.LOCK_SUFFIX, 1, 30)
+
+        self.assertEqual(self.service.fetch("producer:hot", lambda: "new", 60), "old")
+        self.assertEqual(self.service.metrics.snapshot()["producer"]["stale_hits"], 1)
+
+        cache.delete("producer:hot" + self.service.LOCK_SUFFIX)
+        self.assertEqual(self.service.fetch("producer:hot", lambda: "new", 60), "new")
+        self.assertEqual(self.service.get("producer:hot"), "new")
+
+    def test_early_refresh_for_slow_values(self):
+        import time
+
+        from core.cache import CacheEntry
+
+        entry = CacheEntry("value", time.time() + 5, delta=2.0)
+        with mock.patch("core.cache.random.random", return_value=0.99):
+            # -2 * ln(0.01) ~ 9.2 с запаса - больше, чем осталось до истечения
+            self.assertTrue(entry.should_refresh(time.time()))
+        with mock.patch("core.cache.random.random", return_value=0.0):
+            self.assertFalse(entry.should_refresh(time.time()))
+
+    def test_missing_instances_are_negatively_cached(self):
+        from core.cache import ModelCacheService
+
+        service = ModelCacheService()
+        missing = uuid.uuid4()
+        with self.assertRaises(Producer.DoesNotExist):
+            service.get_model_instance(Producer, missing)
+        with self.assertNumQueries(0), self.assertRaises(Producer.DoesNotExist):
+            service.get_model_instance(Producer, missing)
+
+        producer = Producer.objects.create(id=missing, name="Появился")
+        self.assertEqual(service.get_model_instance(Producer, missing), producer)
+
+
+class LocalCacheTestCase(TestCase):
+    def setUp(self):
+        from core.cache import CacheService, LocalCacheBroadcast, LocalLRUCache
+
+        cache.clear()
+        self.broadcast = LocalCacheBroadcast()
+        # Два "процесса" с общим L2 и общим каналом рассылки
+        self.workers = []
+        for _ in range(2):
+            service = CacheService()
+            service.local_cache = LocalLRUCache(broadcast=self.broadcast)
+            self.workers.append(service)
+
+    def test_lru_is_bounded_by_entries_and_bytes(self):
+        from core.cache import LocalLRUCache
+
+        local_cache = LocalLRUCache(max_entries=2, max_bytes=10_000)
+        local_cache.set("a", 1)
+        local_cache.set("b", 2)
+        local_cache.get("a")
+        local_cache.set("c", 3)
+
+        self.assertEqual(local_cache.get("b"), (False, None))
+        self.assertEqual(local_cache.get("a"), (True, 1))
+        self.assertFalse(local_cache.set("huge", "x" * 20_000))
+
+        stats = local_cache.stats()
+        self.assertEqual((stats["entries"], stats["evictions"]), (2, 1))
+        self.assertGreater(stats["bytes"], 0)
+
+    @override_settings(CACHE_L1_PREFIXES=["help"])
+    def test_l1_hit_skips_shared_cache(self):
+        first, _ = self.workers
+        first.fetch("help:articles", lambda: ["faq"], 60, tags=["helparticle"])
+
+        with mock.patch("core.cache.cache") as shared:
+            self.assertEqual(first.fetch("help:articles", lambda: ["new"], 60, tags=["helparticle"]), ["faq"])
+        shared.get.assert_not_called()
+        shared.get_many.assert_not_called()
+        self.assertEqual(first.metrics.snapshot()["help"]["l1_hits"], 1)
+
+    @override_settings(CACHE_L1_PREFIXES=["help"])
+    def test_invalidation_reaches_other_workers(self):
+        first, second = self.workers
+        for worker in self.workers:
+            worker.fetch("help:articles", lambda: ["faq"], 60, tags=["helparticle"])
+        second.set("help:banner", "old")
+
+        first.invalidate_tags("helparticle")
+        first.set("help:banner", "new")
+
+        self.assertEqual(second.fetch("help:articles", lambda: ["updated"], 60, tags=["helparticle"]), ["updated"])
+        self.assertEqual(second.get("help:banner"), "new")
+
+    @override_settings(
+        QUERY_INSTRUMENTATION_SINK="api.tests.RecordingMetricsSink",
+        CACHE_L1_PREFIXES=["help"],
+    )
+    def test_memory_use_is_reported(self):
+        first, _ = self.workers
+        first.fetch("help:articles", lambda: ["faq"], 60)
+        RecordingMetricsSink.records.clear()
+
+        first.metrics.flush()
+
+        reports = [
+            record for record in RecordingMetricsSink.records
+            if record["kind"] == "cache_l1" and record["name"] == "default" and record["entries"]
+        ]
+        self.assertTrue(any(record["bytes"] > 0 for record in reports))
+
+    def test_redis_broadcast_requires_redis(self):
+        from django.core.exceptions import ImproperlyConfigured
+
+        from core.cache import RedisCacheBroadcast
+
+        with mock.patch.dict("os.environ", {"REDIS_URL": ""}), self.assertRaises(ImproperlyConfigured):
+            RedisCacheBroadcast()
+
+
+class ModelCacheRegistryTestCase(TestCase):
+    def setUp(self):
+        from core.cache import model_cache_service
+
+        cache.clear()
+        self.model_cache = model_cache_service
+        self.producer = Producer.objects.create(name="Registry Producer", city="Baku")
+        self.dish = Dish.objects.create(
+            name="Registry Dish", price=100, category=Category.objects.create(name="Registry"), producer=self.producer
+        )
+
+    def cached_dish(self):
+        return self.model_cache.cached_get(Dish, self.dish.pk)
+
+    def test_cached_get_attaches_cached_related_objects(self):
+        self.cached_dish()
+
+        with self.assertNumQueries(0):
+            dish = self.cached_dish()
+            self.assertEqual((dish.name, dish.producer.name), ("Registry Dish", "Registry Producer"))
+
+        with self.assertRaises(Dish.DoesNotExist):
+            self.model_cache.cached_get(Dish, uuid.uuid4())
+
+    def test_save_invalidates_instance_and_related(self):
+        self.cached_dish()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.producer.name = "Renamed Producer"
+            self.producer.save()
+
+        self.assertEqual(self.cached_dish().producer.name, "Renamed Producer")
+
+    def test_bulk_update_invalidates_only_projected_fields(self):
+        self.cached_dish()
+
+        self.dish.views_count = 10
+        Dish.objects.bulk_update([self.dish], ["views_count"])
+        with self.assertNumQueries(0):
+            self.cached_dish()
+
+        self.dish.price = 120
+        Dish.objects.bulk_update([self.dish], ["price"])
+        self.assertEqual(self.cached_dish().price, 120)
+
+    def test_queryset_update_invalidates_matching_instances(self):
+        self.cached_dish()
+
+        Dish.objects.filter(producer=self.producer).update(is_available=False)
+
+        self.assertFalse(self.cached_dish().is_available)
+
+    def test_cart_add_reads_dish_through_cache(self):
+        client = APIClient()
+        client.force_authenticate(
+            User.objects.create_user(username="registry@test.com", email="registry@test.com", password="password")
+        )
+
+        with mock.patch.object(self.model_cache, "cached_get", wraps=self.model_cache.cached_get) as cached_get:
+            response = client.post("/api/cart/add/", {"dish": str(self.dish.pk)}, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        cached_get.assert_any_call(Dish, str(self.dish.pk))
+
+
+class ConditionalGetTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.category = Category.objects.create(name="Conditional")
+        self.producer = Producer.objects.create(name="Conditional Producer", city="Baku")
+        self.dish = Dish.objects.create(
+            name="Conditional Dish", price=100, category=self.category, producer=self.producer
+        )
+
+    def assertRevalidates(self, path, **params):
+        response = self.client.get(path, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response["ETag"]
+
+        with self.assertNumQueries(0):
+            not_modified = self.client.get(path, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(not_modified["ETag"], etag)
+        return response
+
+    def test_category_list_returns_304_until_a_category_changes(self):
+        response = self.assertRevalidates("/api/categories/")
+        self.assertIn("public", response["Cache-Control"])
+        self.assertIn("max-age=300", response["Cache-Control"])
+
+        Category.objects.create(name="Another")
+
+        changed = self.client.get("/api/categories/", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(changed.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(changed["ETag"], response["ETag"])
+
+    def test_if_modified_since(self):
+        response = self.assertRevalidates("/api/producers/")
+
+        not_modified = self.client.get("/api/producers/", HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_producer_list_changes_when_a_producer_stops_being_new(self):
+        Producer.objects.filter(pk=self.producer.pk).update(
+            created_at=timezone.now() - timedelta(weeks=2) + timedelta(hours=1)
+        )
+        response = self.assertRevalidates("/api/producers/")
+
+        # Порядок списка меняется со временем, без сброса тега "producer"
+        with mock.patch("django.utils.timezone.now", return_value=timezone.now() + timedelta(hours=2)):
+            changed = self.client.get("/api/producers/", HTTP_IF_NONE_MATCH=response["ETag"])
+            modified = self.client.get("/api/producers/", HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+
+        self.assertEqual(changed.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(changed["ETag"], response["ETag"])
+        self.assertEqual(modified.status_code, status.HTTP_200_OK)
+
+    def test_dish_etag_tracks_ratings_images_and_user(self):
+        path = f"/api/dishes/{self.dish.pk}/"
+        etag = self.assertRevalidates(path)["ETag"]
+        self.assertIn("Authorization", self.client.get(path)["Vary"])
+
+        # Сброс счётчиков популярности ETag не меняет
+        Dish.objects.filter(pk=self.dish.pk).update(views_count=5, in_cart_count=2)
+        self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+
+        Dish.objects.filter(pk=self.dish.pk).update(rating=4.5)
+        rating_etag = self.client.get(path, HTTP_IF_NONE_MATCH=etag)["ETag"]
+        self.assertNotEqual(rating_etag, etag)
+
+        DishImage.objects.create(dish=self.dish, image="https://example.com/1.jpg")
+        image_etag = self.client.get(path, HTTP_IF_NONE_MATCH=rating_etag)["ETag"]
+        self.assertNotEqual(image_etag, rating_etag)
+
+        # is_favorite зависит от пользователя
+        self.client.force_authenticate(
+            User.objects.create_user(username="etag@test.com", email="etag@test.com", password="password")
+        )
+        self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=image_etag).status_code, status.HTTP_200_OK)
+        self.assertRevalidates("/api/dishes/")
+
+    def test_help_articles(self):
+        HelpArticle.objects.create(question="How?", answer="Like this")
+        response = self.assertRevalidates("/api/help-articles/")
+
+        HelpArticle.objects.create(question="Why?", answer="Because")
+
+        self.assertEqual(
+            self.client.get("/api/help-articles/", HTTP_IF_NONE_MATCH=response["ETag"]).status_code,
+            status.HTTP_200_OK,
+        )
@@ -9,13 +9,11 @@ from django.utils import timezone
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from api.management.commands.process_outbox_events import (
+from api.services.outbox_dispatcher import (
     MAX_ATTEMPTS,
+    OutboxDispatcher,
     _calculate_next_attempt,
 )
-from api.management.commands.process_outbox_events import (
-    Command as ProcessOutboxCommand,
-)
 
 from .models import (
     Category,
@@ -512,8 +510,7 @@ class OutboxProcessingTestCase(TestCase):
             event_type="TestEvent",
             payload={"foo": "bar"},
         )
-        cmd = ProcessOutboxCommand()
-        processed = cmd._process_batch(limit=10)
+        _, processed = OutboxDispatcher(workers=1).dispatch_batch(limit=10)
         self.assertEqual(processed, 1)
         event.refresh_from_db()
         self.assertEqual(event.status, "PROCESSED")
@@ -528,9 +525,9 @@ class OutboxProcessingTestCase(TestCase):
             event_type="TestEvent",
             payload={"force_error": True},
         )
-        cmd = ProcessOutboxCommand()
+        dispatcher = OutboxDispatcher(workers=1)
         while True:
-            processed = cmd._process_batch(limit=10)
+            _, processed = dispatcher.dispatch_batch(limit=10)
             self.assertIn(processed, (0, 1))
             event.refresh_from_db()
             if event.status == "DEAD":
@@ -5,13 +5,16 @@ from .views import (
     AddressViewSet,
     BecomeSellerView,
     CartAddView,
+    CartCheckoutView,
     CartClearView,
+    CartQuoteView,
     CartRemoveView,
     CartView,
     CategoryViewSet,
     ChatComplaintViewSet,
     ChatMessageViewSet,
     DishViewSet,
+    EventStreamView,
     FavoriteDishViewSet,
     HelpArticleViewSet,
     NotificationViewSet,
@@ -62,6 +65,8 @@ urlpatterns = [
     path('cart/add/', CartAddView.as_view()),
     path('cart/remove/', CartRemoveView.as_view()),
     path('cart/clear/', CartClearView.as_view()),
+    path('cart/quote/', CartQuoteView.as_view()),
+    path('cart/checkout/', CartCheckoutView.as_view()),
     path('become-seller/', BecomeSellerView.as_view()),
     path('profile/change-request/', ProfileChangeView.as_view()),
     path('profile/change-confirm/', ProfileChangeConfirmView.as_view()),
@@ -71,4 +76,5 @@ urlpatterns = [
     path('orders/<uuid:pk>/cancel_late_delivery/', OrderCancelLateDeliveryView.as_view()),
     path('orders/<uuid:pk>/upload_photo/', OrderUploadPhotoView.as_view()),
     path('orders/reorder/', ReorderView.as_view()),
+    path('events/', EventStreamView.as_view()),
 ]
@@ -22,6 +22,7 @@ from api.v1.orders.serializers import (
     OrderListSerializer,
     OrderRejectSerializer,
 )
+from core.pagination import KeysetPagination
 
 logger = logging.getLogger(__name__)
 
@@ -31,6 +32,7 @@ class OrderViewSet(viewsets.ModelViewSet):
 
     queryset = Order.objects.all()
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
     order_service = OrderService()
     status_service_class = OrderStatusService
 
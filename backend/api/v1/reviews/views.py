@@ -1,6 +1,5 @@
 """Reviews API v1 views."""
 from django.core.exceptions import ValidationError
-
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
@@ -8,6 +7,7 @@ from rest_framework.response import Response
 
 from api.models import Review
 from api.services.review_service import ReviewService
+from core.pagination import KeysetPagination
 
 from .serializers import (
     ReviewCorrectionAcceptSerializer,
@@ -22,6 +22,7 @@ class ReviewViewSet(viewsets.ModelViewSet):
     queryset = Review.objects.select_related('user', 'order', 'producer').all()
     serializer_class = ReviewSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         """Фильтрация отзывов по правам доступа."""
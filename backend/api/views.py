@@ -1,5 +1,5 @@
+import json
 import logging
-import math
 import os
 import random
 import re
@@ -7,34 +7,52 @@ import uuid
 from datetime import timedelta
 
 import requests
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
+from django.core.handlers.asgi import ASGIRequest
 from django.core.mail import send_mail
 from django.db import transaction
 from django.db.utils import OperationalError, ProgrammingError
+from django.http import JsonResponse, StreamingHttpResponse
 from django.template.loader import render_to_string
 from django.utils import timezone
 from django.utils.crypto import get_random_string
 from django.utils.html import strip_tags
+from django.views import View
 from django_filters.rest_framework import DjangoFilterBackend
 from google.auth.transport import requests as google_requests
 from google.oauth2 import id_token
-from rest_framework import status, viewsets
+from rest_framework import mixins, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import AuthenticationFailed
 from rest_framework.filters import SearchFilter
 from rest_framework.parsers import FormParser, MultiPartParser
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
 from rest_framework_simplejwt.tokens import RefreshToken
 
+from api.services.cart_quote_service import CartQuoteService
+from api.services.chat_service import ChatService
+from api.services.checkout_service import CartCheckoutService, CheckoutError
+from api.services.counter_service import counter_service
+from api.services.delivery_quote_service import DeliveryQuoteEngine
+from api.services.push_service import get_broker
+from api.services.rating_refresh_service import rating_refresh_queue
+from core.cache import cache_service, model_cache_service
+from core.conditional import ConditionalGetMixin
+from core.instrumentation import QueryInstrumentationMixin
+from core.pagination import KeysetPagination
+
 logger = logging.getLogger(__name__)
 from decimal import Decimal
 
 from django.db import models
-from django.db.models import Avg, Count, Sum
-from django.db.models.functions import TruncDate
+from django.db.models import Avg, Count
 from rest_framework import serializers
 from rest_framework.filters import OrderingFilter
 
@@ -294,11 +312,38 @@ class ProducerDocumentUploadView(APIView):
         return Response(serializer.data)
 
 
-class ProducerViewSet(viewsets.ModelViewSet):
+class ProducerViewSet(ConditionalGetMixin, QueryInstrumentationMixin, viewsets.ModelViewSet):
     queryset = Producer.objects.all()
     serializer_class = ProducerSerializer
     filter_backends = [SearchFilter, OrderingFilter]
     search_fields = ["name", "city"]
+    conditional_tags = ["producer"]
+    cache_control = {"public": True, "max_age": 60}
+    # New producers are listed first for this long after creation
+    NEW_PRODUCER_PERIOD = timedelta(weeks=2)
+
+    def get_conditional_changed_at(self):
+        # The list order changes when a producer stops being new, which happens
+        # with the clock rather than with the "producer" tag
+        if self.action != "list":
+            return None
+        boundaries = cache_service.get_or_set(
+            "producers:new_boundaries", self._new_producer_boundaries, 24 * 3600, tags=["producer"]
+        )
+        now = timezone.now().timestamp()
+        return max((boundary for boundary in boundaries if boundary <= now), default=None)
+
+    def _new_producer_boundaries(self):
+        """Moments producers stop being new: the last one already passed and every upcoming one."""
+        from django.db.models import Max
+
+        cutoff = timezone.now() - self.NEW_PRODUCER_PERIOD
+        producers = Producer.objects.filter(is_hidden=False, is_banned=False)
+        created = list(producers.filter(created_at__gte=cutoff).values_list("created_at", flat=True))
+        last_passed = producers.filter(created_at__lt=cutoff).aggregate(last=Max("created_at"))["last"]
+        if last_passed is not None:
+            created.append(last_passed)
+        return sorted((created_at + self.NEW_PRODUCER_PERIOD).timestamp() for created_at in created)
 
     def get_permissions(self):
         """
@@ -310,15 +355,6 @@ class ProducerViewSet(viewsets.ModelViewSet):
         return [IsAuthenticated()]
 
     def get_queryset(self):
-        import logging
-        import time
-
-        from django.db import connection
-        
-        logger = logging.getLogger(__name__)
-        start_time = time.time()
-        query_count_before = len(connection.queries)
-        
         queryset = super().get_queryset()
         action = getattr(self, "action", None)
         if action == "retrieve":
@@ -340,7 +376,7 @@ class ProducerViewSet(viewsets.ModelViewSet):
         # But user said "New stores top for 2 weeks", then by other metrics.
 
         now = timezone.now()
-        two_weeks_ago = now - timedelta(weeks=2)
+        two_weeks_ago = now - self.NEW_PRODUCER_PERIOD
 
         # We can annotate 'is_new'
         from django.db.models import (
@@ -370,15 +406,6 @@ class ProducerViewSet(viewsets.ModelViewSet):
                 output_field=FloatField(),
             ),
         ).order_by("-is_new", "-total_comm", "-rating")
-        
-        # Log query performance
-        query_count_after = len(connection.queries)
-        elapsed_time = time.time() - start_time
-        logger.warning(
-            f"[ProducerViewSet] get_queryset executed in {elapsed_time:.3f}s, "
-            f"queries: {query_count_after - query_count_before}, "
-            f"result count: {queryset.count()}"
-        )
 
         return queryset
 
@@ -409,45 +436,57 @@ class ProducerViewSet(viewsets.ModelViewSet):
         return Response({"detail": "Payout created, waiting for signature"})
 
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(ConditionalGetMixin, QueryInstrumentationMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [AllowAny]
+    conditional_tags = ["category"]
+    cache_control = {"public": True, "max_age": 300}
 
     def get_queryset(self):
-        import logging
-        import time
-
-        from django.db import connection
-        
-        logger = logging.getLogger(__name__)
-        start_time = time.time()
-        query_count_before = len(connection.queries)
-        
         queryset = super().get_queryset()
         only_roots = self.request.query_params.get("only_roots")
         if only_roots and only_roots.lower() == "true":
             queryset = queryset.filter(parent__isnull=True)
-        
-        # Optimize queries with prefetch_related for subcategories
-        queryset = queryset.prefetch_related('subcategories')
-        
-        # Log query performance
-        query_count_after = len(connection.queries)
-        elapsed_time = time.time() - start_time
-        logger.warning(
-            f"[CategoryViewSet] get_queryset executed in {elapsed_time:.3f}s, "
-            f"queries: {query_count_after - query_count_before}, "
-            f"result count: {queryset.count()}"
-        )
-        
         return queryset
 
+    def list(self, request, *args, **kwargs):
+        # Дерево категорий отдаётся из кэша без обращений к БД
+        from api.services.category_tree_service import CategoryTreeService
+
+        only_roots = request.query_params.get("only_roots")
+        data = CategoryTreeService.get_tree().serialize_list(
+            only_roots=bool(only_roots and only_roots.lower() == "true")
+        )
+        page = self.paginate_queryset(data)
+        if page is not None:
+            return self.get_paginated_response(page)
+        return Response(data)
 
-class ChatMessageViewSet(viewsets.ModelViewSet):
+    def retrieve(self, request, *args, **kwargs):
+        from rest_framework.exceptions import NotFound
+
+        from api.services.category_tree_service import CategoryTreeService
+
+        data = CategoryTreeService.get_tree().serialize(kwargs.get(self.lookup_field))
+        if data is None:
+            raise NotFound()
+        return Response(data)
+
+
+class ChatMessageViewSet(
+    mixins.CreateModelMixin,
+    mixins.RetrieveModelMixin,
+    mixins.ListModelMixin,
+    viewsets.GenericViewSet,
+):
+    # Messages are immutable: ChatThread keeps the last message and unread
+    # counters, which only ChatService.record_message/mark_message_as_read update.
     queryset = ChatMessage.objects.all()
     serializer_class = ChatMessageSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+    keyset_ordering = "created_at"
 
     def get_queryset(self):
         user = self.request.user
@@ -455,8 +494,10 @@ class ChatMessageViewSet(viewsets.ModelViewSet):
             models.Q(sender=user) | models.Q(recipient=user)
         ).order_by("created_at")
 
+    @transaction.atomic
     def perform_create(self, serializer):
-        serializer.save(sender=self.request.user)
+        message = serializer.save(sender=self.request.user)
+        ChatService.record_message(message)
 
     @action(detail=True, methods=["post"], url_path="mark_read")
     def mark_read(self, request, pk=None):
@@ -466,10 +507,75 @@ class ChatMessageViewSet(viewsets.ModelViewSet):
                 {"detail": "Not your message"}, status=status.HTTP_403_FORBIDDEN
             )
 
-        message.is_read = True
-        message.save()
+        ChatService.mark_message_as_read(message)
         return Response({"detail": "Marked as read"})
 
+    @action(detail=False, methods=["get"])
+    def conversations(self, request):
+        return Response(ChatService.get_conversation_partners(request.user))
+
+
+class EventStreamView(View):
+    """
+    Server-Sent Events stream of push events for the authenticated user:
+    chat messages, notifications and order status changes
+    (api.services.push_service). Requires an ASGI server: under WSGI the
+    response would be read to the end and hold a worker, so 501 is returned.
+
+    EventSource cannot send headers, so the JWT access token is accepted
+    in the ?token= query parameter as well as in Authorization.
+    """
+
+    async def get(self, request):
+        if not isinstance(request, ASGIRequest):
+            return JsonResponse(
+                {"detail": "Event stream requires the ASGI server (backend.asgi)."},
+                status=status.HTTP_501_NOT_IMPLEMENTED,
+            )
+        user = await self._authenticate(request)
+        if user is None:
+            return JsonResponse(
+                {"detail": "Authentication credentials were not provided."},
+                status=status.HTTP_401_UNAUTHORIZED,
+            )
+        response = StreamingHttpResponse(
+            self._stream(user.pk), content_type="text/event-stream"
+        )
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+    @staticmethod
+    async def _authenticate(request):
+        authentication = JWTAuthentication()
+        raw_token = request.GET.get("token")
+        if not raw_token:
+            header = authentication.get_header(request)
+            raw_token = authentication.get_raw_token(header) if header else None
+        if not raw_token:
+            return None
+        try:
+            validated_token = authentication.get_validated_token(raw_token)
+            return await sync_to_async(authentication.get_user)(validated_token)
+        except (InvalidToken, TokenError, AuthenticationFailed):
+            return None
+
+    @staticmethod
+    async def _stream(user_id):
+        broker = get_broker()
+        subscription = broker.subscribe(user_id)
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                event = await subscription.get(settings.PUSH_HEARTBEAT_SECONDS)
+                if event is None:
+                    yield ": keepalive\n\n"
+                    continue
+                data = json.dumps(event["payload"], ensure_ascii=False, default=str)
+                yield f"id: {event['id']}\nevent: {event['type']}\ndata: {data}\n\n"
+        finally:
+            broker.unsubscribe(subscription)
+
 
 class ChatComplaintViewSet(viewsets.ModelViewSet):
     queryset = ChatComplaint.objects.all()
@@ -483,7 +589,35 @@ class ChatComplaintViewSet(viewsets.ModelViewSet):
 from rest_framework.filters import OrderingFilter, SearchFilter
 
 
-class DishViewSet(viewsets.ModelViewSet):
+class DishSearchFilter(SearchFilter):
+    """
+    ?search= по полнотекстовому индексу блюд (DishSearchService).
+
+    Без явного ?ordering= результаты упорядочены по смешанной оценке
+    релевантности и sort_score, поэтому фильтр должен стоять после OrderingFilter.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, "").strip()
+        if not query:
+            return queryset
+
+        from api.services.search_service import DishSearchService
+
+        ranked_ids = DishSearchService().rank(query)
+        if not ranked_ids:
+            return queryset.none()
+        queryset = queryset.filter(id__in=ranked_ids)
+        if request.query_params.get(OrderingFilter.ordering_param):
+            return queryset
+        search_rank = models.Case(
+            *[models.When(id=dish_id, then=models.Value(position)) for position, dish_id in enumerate(ranked_ids)],
+            output_field=models.IntegerField(),
+        )
+        return queryset.annotate(search_rank=search_rank).order_by("search_rank")
+
+
+class DishViewSet(ConditionalGetMixin, QueryInstrumentationMixin, viewsets.ModelViewSet):
     queryset = Dish.objects.all()
     serializer_class = DishSerializer
     filterset_fields = [
@@ -498,8 +632,7 @@ class DishViewSet(viewsets.ModelViewSet):
         "fats",
         "carbs",
     ]
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
-    search_fields = ["name", "category__name", "producer__name"]
+    filter_backends = [DjangoFilterBackend, OrderingFilter, DishSearchFilter]
     ordering_fields = [
         "price",
         "sales_count",
@@ -516,6 +649,18 @@ class DishViewSet(viewsets.ModelViewSet):
         "carbs",
     ]
     ordering = ["-sort_score", "-sales_count"]
+    # is_favorite depends on the user
+    conditional_per_user = True
+    cache_control = {"private": True, "max_age": 0}
+
+    def get_conditional_tags(self):
+        tags = ["dish"]
+        # The category filter expands over the category tree
+        if self.request.query_params.get("category"):
+            tags.append("category")
+        if "producer__" in self.request.query_params.get("ordering", ""):
+            tags.append("producer")
+        return tags
 
     def get_permissions(self):
         """
@@ -527,29 +672,19 @@ class DishViewSet(viewsets.ModelViewSet):
         return [IsAuthenticated()]
 
     def get_queryset(self):
-        import logging
-        import time
-
-        from django.db import connection
-        
-        logger = logging.getLogger(__name__)
-        start_time = time.time()
-        query_count_before = len(connection.queries)
-        
         queryset = super().get_queryset()
         if self.request.method in ["PATCH", "PUT", "DELETE", "POST"]:
             return queryset
 
         category_id = self.request.query_params.get("category")
         if category_id:
-            try:
-                root_category = Category.objects.get(id=category_id)
-                child_ids = list(
-                    root_category.subcategories.values_list("id", flat=True)
-                )
-                category_ids = [root_category.id] + child_ids
+            from api.services.category_tree_service import CategoryTreeService
+
+            # Категория и все её подкатегории любой глубины
+            category_ids = CategoryTreeService.get_tree().descendant_ids(category_id)
+            if category_ids:
                 queryset = queryset.filter(category_id__in=category_ids)
-            except Category.DoesNotExist:
+            else:
                 queryset = queryset.none()
 
         is_archived_param = self.request.query_params.get("is_archived")
@@ -564,24 +699,15 @@ class DishViewSet(viewsets.ModelViewSet):
         queryset = queryset.select_related('category', 'producer').prefetch_related(
             'images', 'toppings', 'favorite_dishes'
         )
-        
-        # Log query performance
-        query_count_after = len(connection.queries)
-        elapsed_time = time.time() - start_time
-        logger.warning(
-            f"[DishViewSet] get_queryset executed in {elapsed_time:.3f}s, "
-            f"queries: {query_count_after - query_count_before}, "
-            f"result count: {queryset.count()}"
-        )
-        
+
         return queryset
 
     def retrieve(self, request, *args, **kwargs):
-        # Increment view count
         instance = self.get_object()
-        instance.views_count += 1
-        instance.save(update_fields=["views_count"])
-        return super().retrieve(request, *args, **kwargs)
+        # Buffered view count, flushed to the database by flush_counters
+        counter_service.increment(Dish, instance.pk, "views_count")
+        serializer = self.get_serializer(instance)
+        return Response(serializer.data)
 
     @action(detail=True, methods=["post"], parser_classes=[MultiPartParser, FormParser], url_path="upload_photo")
     def upload_photo(self, request, pk=None):
@@ -667,28 +793,27 @@ class DishViewSet(viewsets.ModelViewSet):
         query = request.query_params.get("q", "").strip()
         limit = int(request.query_params.get("limit", 10))
 
+        from api.services.search_history_service import search_history_buffer
+
         if not query:
-            # Return popular dishes if no query provided
+            # Popular queries from the rolling aggregate, popular dishes on a cold start
+            popular_queries = search_history_buffer.popular_queries(limit=limit)
+            if popular_queries:
+                return Response(popular_queries)
             popular_dishes = self.get_queryset().order_by("-sales_count")[:limit]
             serializer = self.get_serializer(popular_dishes, many=True)
             return Response(serializer.data)
 
-        # Filter dishes by name that contain the query
-        queryset = (
-            self.get_queryset()
-            .filter(name__icontains=query)
-            .order_by("-sales_count")[:limit]
-        )
-        serializer = self.get_serializer(queryset, many=True)
+        # Ranked prefix search over the dish search index
+        from api.services.search_service import DishSearchService
 
-        # Save search history
-        if request.user.is_authenticated:
-            from .models import SearchHistory
+        dishes = DishSearchService().search(
+            self.get_queryset(), query, limit=limit, prefix=True
+        )
+        serializer = self.get_serializer(dishes, many=True)
 
-            results_count = queryset.count()
-            SearchHistory.objects.create(
-                user=request.user, query=query, results_count=results_count
-            )
+        # Buffered search history, written in batches off the request path
+        search_history_buffer.record(request.user, query, len(dishes))
 
         return Response(serializer.data)
 
@@ -843,7 +968,8 @@ class ReviewViewSet(viewsets.ModelViewSet):
             order=order,
             photo=photo_url,
         )
-        self.get_rating_service().recalc_for_order(order)
+        # Рейтинги пересчитываются фоном (refresh_ratings), один раз за проход
+        rating_refresh_queue.mark_order(order)
 
     def perform_update(self, serializer):
         instance = self.get_object()
@@ -865,7 +991,7 @@ class ReviewViewSet(viewsets.ModelViewSet):
             review = serializer.save(is_updated=True, photo=photo_url)
         else:
             review = serializer.save(photo=photo_url)
-        self.get_rating_service().recalc_for_order(instance.order)
+        rating_refresh_queue.mark_order(instance.order)
 
     @action(detail=True, methods=["post"], url_path="offer_refund")
     def offer_refund(self, request, pk=None):
@@ -939,6 +1065,7 @@ class OrderViewSet(viewsets.ModelViewSet):
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
     filterset_fields = ["dish", "created_at", "status", "is_urgent"]
+    pagination_class = KeysetPagination
 
     status_service_class = OrderStatusService
 
@@ -1036,122 +1163,65 @@ class OrderViewSet(viewsets.ModelViewSet):
         time_range = request.query_params.get("time_range", "7d")
         now = timezone.now()
 
+        # Сводки дневные: диапазон округляется до начала первого дня
         if time_range == "24h":
-            start_date = now - timedelta(hours=24)
+            start_date = timezone.localdate(now - timedelta(hours=24))
         elif time_range == "7d":
-            start_date = now - timedelta(days=7)
+            start_date = timezone.localdate(now - timedelta(days=7))
         elif time_range == "30d":
-            start_date = now - timedelta(days=30)
+            start_date = timezone.localdate(now - timedelta(days=30))
         else:  # 'all' or default
             start_date = None
 
-        orders_base = Order.objects.filter(dish__producer=producer)
-        if start_date:
-            orders_base = orders_base.filter(created_at__gte=start_date)
+        from api.services.producer_stats_service import ProducerStatsService
 
-        # Basic metrics
-        completed_orders = orders_base.filter(status="COMPLETED")
-        total_revenue = (
-            completed_orders.aggregate(Sum("total_price"))["total_price__sum"] or 0
-        )
-        orders_count = completed_orders.count()
+        summary = ProducerStatsService().get_summary(producer, start_date)
 
         # Active orders (not completed, cancelled, or dispute)
-        active_orders_count = orders_base.exclude(
+        active_orders = Order.objects.filter(dish__producer=producer).exclude(
             status__in=["COMPLETED", "CANCELLED", "DISPUTE"]
-        ).count()
-
-        # Cancelled orders
-        cancelled_orders_count = orders_base.filter(status="CANCELLED").count()
+        )
+        if start_date:
+            active_orders = active_orders.filter(
+                created_at__date__gte=start_date
+            )
+        active_orders_count = active_orders.count()
 
-        # Average Order Value
+        orders_count = summary["orders_count"]
+        total_revenue = summary["total_revenue"]
         avg_order_value = total_revenue / orders_count if orders_count > 0 else 0
 
-        # Top Dishes
-        top_dishes = (
-            completed_orders.values("dish__name")
-            .annotate(count=Count("id"), revenue=Sum("total_price"))
-            .order_by("-count")[:5]
+        agg = Review.objects.filter(producer=producer).aggregate(
+            reviews_count=Count("id"),
+            avg_taste=Avg("rating_taste"),
+            avg_appearance=Avg("rating_appearance"),
+            avg_service=Avg("rating_service"),
         )
-
-        # Most Popular Toppings
-        # selected_toppings is a JSONField (list of dicts)
-        # We need to parse it and count. Since it's JSON in SQLite/Postgres, we can do some aggregation.
-        # For simplicity, we'll do it in Python for now.
-        topping_counts = {}
-        for order in completed_orders:
-            toppings = order.selected_toppings or []
-            for t in toppings:
-                name = t.get("name")
-                if name:
-                    topping_counts[name] = topping_counts.get(name, 0) + 1
-
-        sorted_toppings = sorted(
-            topping_counts.items(), key=lambda x: x[1], reverse=True
-        )[:5]
-        top_toppings = [
-            {"name": name, "count": count} for name, count in sorted_toppings
-        ]
-
-        # Revenue for chart (grouped by date)
-        chart_data = (
-            completed_orders.annotate(date=TruncDate("created_at"))
-            .values("date")
-            .annotate(revenue=Sum("total_price"), count=Count("id"))
-            .order_by("date")
+        reviews_count = agg["reviews_count"]
+        avg_rating_taste = float(agg["avg_taste"] or 0)
+        avg_rating_appearance = float(agg["avg_appearance"] or 0)
+        avg_rating_service = float(agg["avg_service"] or 0)
+        avg_rating_overall = (
+            (avg_rating_taste + avg_rating_appearance + avg_rating_service) / 3
+            if reviews_count > 0
+            else 0
         )
 
-        reviews_qs = Review.objects.filter(producer=producer)
-        reviews_count = reviews_qs.count()
-        avg_rating_taste = 0
-        avg_rating_appearance = 0
-        avg_rating_service = 0
-        avg_rating_overall = 0
-
-        if reviews_count > 0:
-            agg = reviews_qs.aggregate(
-                avg_taste=Avg("rating_taste"),
-                avg_appearance=Avg("rating_appearance"),
-                avg_service=Avg("rating_service"),
-            )
-            avg_rating_taste = float(agg["avg_taste"] or 0)
-            avg_rating_appearance = float(agg["avg_appearance"] or 0)
-            avg_rating_service = float(agg["avg_service"] or 0)
-            avg_rating_overall = (
-                (avg_rating_taste + avg_rating_appearance + avg_rating_service) / 3
-                if reviews_count > 0
-                else 0
-            )
-
         return Response(
             {
                 "total_revenue": float(total_revenue),
                 "orders_count": orders_count,
                 "active_orders_count": active_orders_count,
-                "cancelled_orders_count": cancelled_orders_count,
+                "cancelled_orders_count": summary["cancelled_orders_count"],
                 "avg_order_value": float(avg_order_value),
                 "reviews_count": reviews_count,
                 "avg_rating_overall": float(avg_rating_overall),
                 "avg_rating_taste": float(avg_rating_taste),
                 "avg_rating_appearance": float(avg_rating_appearance),
                 "avg_rating_service": float(avg_rating_service),
-                "top_dishes": [
-                    {
-                        "name": item["dish__name"],
-                        "count": item["count"],
-                        "revenue": float(item["revenue"]),
-                    }
-                    for item in top_dishes
-                ],
-                "top_toppings": top_toppings,
-                "chart_data": [
-                    {
-                        "date": item["date"].isoformat(),
-                        "revenue": float(item["revenue"]),
-                        "count": item["count"],
-                    }
-                    for item in chart_data
-                ],
+                "top_dishes": summary["top_dishes"],
+                "top_toppings": summary["top_toppings"],
+                "chart_data": summary["chart_data"],
             }
         )
 
@@ -1172,7 +1242,7 @@ class OrderViewSet(viewsets.ModelViewSet):
         now = timezone.now()
         dish_id = request.data.get("dish")
         try:
-            dish = Dish.objects.get(id=dish_id)
+            dish = model_cache_service.cached_get(Dish, dish_id)
         except Dish.DoesNotExist:
             return Response(
                 {"detail": "Dish not found"}, status=status.HTTP_400_BAD_REQUEST
@@ -1186,100 +1256,23 @@ class OrderViewSet(viewsets.ModelViewSet):
             quantity = 1
         if quantity <= 0:
             quantity = 1
-        base_delivery_price = float(
-            producer.delivery_price_to_building
-            if delivery_type == "BUILDING"
-            else producer.delivery_price_to_door
+        quote = DeliveryQuoteEngine().quote(
+            dish,
+            quantity,
+            request.data.get("delivery_latitude"),
+            request.data.get("delivery_longitude"),
+            now,
+            delivery_type,
         )
-        zone_for_distance = None
-        delivery_lat_raw = request.data.get("delivery_latitude")
-        delivery_lon_raw = request.data.get("delivery_longitude")
-        if (
-            producer.latitude is not None
-            and producer.longitude is not None
-            and delivery_lat_raw not in (None, "")
-            and delivery_lon_raw not in (None, "")
-            and producer.delivery_zones
-        ):
-            try:
-                lat1 = float(producer.latitude)
-                lon1 = float(producer.longitude)
-                lat2 = float(delivery_lat_raw)
-                lon2 = float(delivery_lon_raw)
-                distance_km = _haversine_km(lat1, lon1, lat2, lon2)
-                zones_sorted = sorted(
-                    producer.delivery_zones or [],
-                    key=lambda z: float(z.get("radius_km") or 0),
-                )
-                for z in zones_sorted:
-                    try:
-                        radius = float(z.get("radius_km") or 0)
-                    except (TypeError, ValueError):
-                        continue
-                    if radius <= 0:
-                        continue
-                    if distance_km <= radius:
-                        zone_for_distance = z
-                        break
-            except (TypeError, ValueError):
-                zone_for_distance = None
-        if zone_for_distance is not None:
-            if delivery_type == "BUILDING":
-                base_delivery_price = float(
-                    zone_for_distance.get("price_to_building", base_delivery_price)
-                )
-            else:
-                base_delivery_price = float(
-                    zone_for_distance.get("price_to_door", base_delivery_price)
-                )
-        surcharge = 0.0
-        current_time_str = now.strftime("%H:%M")
-        if producer.delivery_pricing_rules:
-            for rule in producer.delivery_pricing_rules:
-                start = rule.get("start")
-                end = rule.get("end")
-                raw_amount = rule.get("surcharge", 0)
-                try:
-                    amount = float(raw_amount)
-                except (TypeError, ValueError):
-                    continue
-                if start <= current_time_str <= end:
-                    surcharge += amount
-        delivery_price = base_delivery_price + surcharge
-        quantity = int(quantity_raw or 1)
-        base_time = dish.cooking_time_minutes
-        if quantity > 1:
-            total_time = base_time + (base_time * 0.5 * (quantity - 1))
-        else:
-            total_time = base_time
-        if zone_for_distance is not None:
-            try:
-                zone_time = int(zone_for_distance.get("time_minutes") or 0)
-                if zone_time > 0:
-                    total_time = total_time + zone_time
-            except (TypeError, ValueError):
-                pass
-        total_price = float(dish.price) * quantity
-        total_price += delivery_price
+        delivery_price = quote.delivery_price
+        total_time = quote.cooking_time_minutes
         promo_code_text = request.data.get("promo_code_text")
-        discount_amount = 0.0
+        promo = None
         if promo_code_text:
-            try:
-                promo = PromoCode.objects.get(
-                    producer=producer, code=promo_code_text, is_used=False
-                )
-                if promo.reward_type == "DISCOUNT":
-                    try:
-                        val = float(promo.reward_value)
-                        discount_amount = val
-                        total_price = max(0.0, total_price - discount_amount)
-                    except ValueError:
-                        pass
-                elif promo.reward_type == "FREE_DELIVERY":
-                    discount_amount = delivery_price
-                    total_price -= delivery_price
-            except PromoCode.DoesNotExist:
-                pass
+            promo = PromoCode.objects.filter(
+                producer=producer, code=promo_code_text, is_used=False
+            ).first()
+        total_price, discount_amount = quote.apply_promo(promo)
         return Response(
             {
                 "delivery_price": float(delivery_price),
@@ -1311,9 +1304,10 @@ class OrderViewSet(viewsets.ModelViewSet):
                 ]
             }
         """
-        from api.services.scheduling_service import SchedulingService
         from datetime import datetime
 
+        from api.services.scheduling_service import SchedulingService
+
         # Parse query parameters
         dish_id = request.query_params.get("dish")
         date_str = request.query_params.get("date")
@@ -1327,7 +1321,7 @@ class OrderViewSet(viewsets.ModelViewSet):
             )
 
         try:
-            dish = Dish.objects.get(id=dish_id)
+            dish = model_cache_service.cached_get(Dish, dish_id)
         except Dish.DoesNotExist:
             return Response(
                 {"detail": "Dish not found"},
@@ -1364,6 +1358,83 @@ class OrderViewSet(viewsets.ModelViewSet):
             "slots": slots
         })
 
+    @action(detail=False, methods=["get"], url_path="available-slots-calendar")
+    def available_slots_calendar(self, request):
+        """
+        Get available delivery time slots for several days in one request.
+
+        GET /api/orders/available-slots-calendar/?dish={id}&quantity={n}&start_date={YYYY-MM-DD}&days={n}
+
+        start_date defaults to today, days defaults to (and is capped by)
+        SchedulingService.MAX_ADVANCE_DAYS.
+
+        Returns:
+            {
+                "days": [
+                    {"date": "2026-02-15", "slots": [...]},
+                    ...
+                ]
+            }
+        """
+        from datetime import datetime
+
+        from api.services.scheduling_service import SchedulingService
+
+        dish_id = request.query_params.get("dish")
+        start_date_str = request.query_params.get("start_date")
+        quantity_str = request.query_params.get("quantity", "1")
+        days_str = request.query_params.get("days")
+
+        if not dish_id:
+            return Response(
+                {"detail": "dish parameter is required"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            dish = Dish.objects.select_related("producer").get(id=dish_id)
+        except Dish.DoesNotExist:
+            return Response(
+                {"detail": "Dish not found"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        start_date = None
+        if start_date_str:
+            try:
+                start_date = datetime.strptime(start_date_str, "%Y-%m-%d").date()
+            except ValueError:
+                return Response(
+                    {"detail": "Invalid date format. Use YYYY-MM-DD"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+        try:
+            quantity = int(quantity_str)
+        except (ValueError, TypeError):
+            quantity = 1
+
+        if quantity < 1:
+            quantity = 1
+
+        max_days = SchedulingService.MAX_ADVANCE_DAYS
+        try:
+            days = int(days_str) if days_str else max_days
+        except (ValueError, TypeError):
+            days = max_days
+        days = min(max(days, 1), max_days)
+
+        scheduling_service = SchedulingService()
+        calendar = scheduling_service.get_available_time_slots_for_range(
+            producer=dish.producer,
+            dish=dish,
+            quantity=quantity,
+            start_date=start_date,
+            days=days
+        )
+
+        return Response({"days": calendar})
+
     def perform_create(self, serializer):
         role = "CLIENT"
         if self.request.auth:
@@ -1386,7 +1457,7 @@ class OrderViewSet(viewsets.ModelViewSet):
 
         dish_id = self.request.data.get("dish")
         try:
-            dish = Dish.objects.get(id=dish_id)
+            dish = model_cache_service.cached_get(Dish, dish_id)
         except (Dish.DoesNotExist, ValueError, TypeError):
             raise serializers.ValidationError(
                 {"dish": "Блюдо не найдено или недоступно"}
@@ -1445,74 +1516,6 @@ class OrderViewSet(viewsets.ModelViewSet):
             deadline = now + timedelta(minutes=minutes_to_accept)
 
         delivery_type = self.request.data.get("delivery_type", "BUILDING")
-        base_delivery_price = float(
-            producer.delivery_price_to_building
-            if delivery_type == "BUILDING"
-            else producer.delivery_price_to_door
-        )
-
-        zone_for_distance = None
-        delivery_lat_raw = None
-        delivery_lon_raw = None
-        if not is_gift:
-            delivery_lat_raw = self.request.data.get("delivery_latitude")
-            delivery_lon_raw = self.request.data.get("delivery_longitude")
-            if (
-                producer.latitude is not None
-                and producer.longitude is not None
-                and delivery_lat_raw not in (None, "")
-                and delivery_lon_raw not in (None, "")
-                and producer.delivery_zones
-            ):
-                try:
-                    lat1 = float(producer.latitude)
-                    lon1 = float(producer.longitude)
-                    lat2 = float(delivery_lat_raw)
-                    lon2 = float(delivery_lon_raw)
-                    distance_km = _haversine_km(lat1, lon1, lat2, lon2)
-                    zones_sorted = sorted(
-                        producer.delivery_zones or [],
-                        key=lambda z: float(z.get("radius_km") or 0),
-                    )
-                    for z in zones_sorted:
-                        try:
-                            radius = float(z.get("radius_km") or 0)
-                        except (TypeError, ValueError):
-                            continue
-                        if radius <= 0:
-                            continue
-                        if distance_km <= radius:
-                            zone_for_distance = z
-                            break
-                except (TypeError, ValueError):
-                    zone_for_distance = None
-
-        if zone_for_distance is not None:
-            if delivery_type == "BUILDING":
-                base_delivery_price = float(
-                    zone_for_distance.get("price_to_building", base_delivery_price)
-                )
-            else:
-                base_delivery_price = float(
-                    zone_for_distance.get("price_to_door", base_delivery_price)
-                )
-
-        surcharge = 0.0
-        current_time_str = now.strftime("%H:%M")
-        if producer.delivery_pricing_rules:
-            for rule in producer.delivery_pricing_rules:
-                start = rule.get("start")
-                end = rule.get("end")
-                raw_amount = rule.get("surcharge", 0)
-                try:
-                    amount = float(raw_amount)
-                except (TypeError, ValueError):
-                    continue
-
-                if start <= current_time_str <= end:
-                    surcharge += amount
-
-        delivery_price = base_delivery_price + surcharge
 
         quantity_raw = self.request.data.get("quantity", 1)
         try:
@@ -1523,18 +1526,18 @@ class OrderViewSet(viewsets.ModelViewSet):
             raise serializers.ValidationError(
                 {"quantity": "Количество должно быть не меньше 1"}
             )
-        base_time = dish.cooking_time_minutes
-        if quantity > 1:
-            total_time = base_time + (base_time * 0.5 * (quantity - 1))
-        else:
-            total_time = base_time
-        if zone_for_distance is not None:
-            try:
-                zone_time = int(zone_for_distance.get("time_minutes") or 0)
-                if zone_time > 0:
-                    total_time = total_time + zone_time
-            except (TypeError, ValueError):
-                pass
+
+        # Подарок доставляется получателю, зона по адресу покупателя не считается
+        quote = DeliveryQuoteEngine().quote(
+            dish,
+            quantity,
+            None if is_gift else self.request.data.get("delivery_latitude"),
+            None if is_gift else self.request.data.get("delivery_longitude"),
+            now,
+            delivery_type,
+        )
+        delivery_price = quote.delivery_price
+        total_time = quote.cooking_time_minutes
 
         commission_rate = producer.total_commission_rate
 
@@ -1546,40 +1549,7 @@ class OrderViewSet(viewsets.ModelViewSet):
             if is_repeat:
                 commission_rate = max(0.0, float(commission_rate) - 0.01)
 
-        total_price = float(dish.price) * quantity
-        total_price += delivery_price
-
         promo_code_text = self.request.data.get("promo_code_text")
-        applied_promo = None
-        discount_amount = 0.0
-
-        if promo_code_text:
-            try:
-                promo = PromoCode.objects.get(
-                    producer=producer, code=promo_code_text, is_used=False
-                )
-
-                applied_promo = promo
-                promo.is_used = True
-                promo.save()
-
-                if promo.reward_type == "DISCOUNT":
-                    try:
-                        val = float(promo.reward_value)
-                        discount_amount = val
-                        total_price = max(0.0, total_price - discount_amount)
-                    except ValueError:
-                        pass
-                elif promo.reward_type == "FREE_DELIVERY":
-                    discount_amount = delivery_price
-                    total_price -= delivery_price
-                elif promo.reward_type == "GIFT":
-                    pass
-
-            except PromoCode.DoesNotExist:
-                pass
-
-        commission_amount = (total_price - delivery_price) * commission_rate
 
         delivery_address_text = self.request.data.get("delivery_address_text", "") or ""
 
@@ -1588,9 +1558,10 @@ class OrderViewSet(viewsets.ModelViewSet):
         scheduled_delivery_time = None
 
         if scheduled_time_str:
-            from api.services.scheduling_service import SchedulingService
             from dateutil import parser
 
+            from api.services.scheduling_service import SchedulingService
+
             try:
                 # Parse ISO datetime string
                 scheduled_delivery_time = parser.isoparse(scheduled_time_str)
@@ -1606,7 +1577,7 @@ class OrderViewSet(viewsets.ModelViewSet):
                     dish=dish,
                     quantity=quantity,
                     scheduled_time=scheduled_delivery_time,
-                    delivery_time_minutes=zone_for_distance.get('time_minutes') if zone_for_distance else None
+                    delivery_time_minutes=quote.zone_time_minutes
                 )
 
                 if not is_valid:
@@ -1627,21 +1598,51 @@ class OrderViewSet(viewsets.ModelViewSet):
                     {"scheduled_delivery_time": "Invalid datetime format"}
                 )
 
-        serializer.save(
-            producer=producer,
-            user=self.request.user if self.request.user.is_authenticated else None,
-            acceptance_deadline=deadline,
-            estimated_cooking_time=int(total_time),
-            status="WAITING_FOR_PAYMENT",
-            commission_rate_snapshot=commission_rate,
-            commission_amount=commission_amount,
-            total_price=total_price,
-            delivery_price=delivery_price,
-            delivery_address_text=delivery_address_text,
-            applied_promo_code=applied_promo,
-            discount_amount=discount_amount,
-            scheduled_delivery_time=scheduled_delivery_time,
-        )
+        with transaction.atomic():
+            # The promo is spent in the same transaction as the order, so a failed
+            # slot reservation rolls it back
+            applied_promo = None
+            if promo_code_text:
+                applied_promo = (
+                    PromoCode.objects.select_for_update()
+                    .filter(producer=producer, code=promo_code_text, is_used=False)
+                    .first()
+                )
+                # Conditional update: only one of concurrent orders gets the code
+                if applied_promo is not None:
+                    if PromoCode.objects.filter(pk=applied_promo.pk, is_used=False).update(is_used=True):
+                        applied_promo.is_used = True
+                    else:
+                        applied_promo = None
+
+            total_price, discount_amount = quote.apply_promo(applied_promo)
+            commission_amount = (total_price - delivery_price) * commission_rate
+
+            serializer.save(
+                producer=producer,
+                user=self.request.user if self.request.user.is_authenticated else None,
+                acceptance_deadline=deadline,
+                estimated_cooking_time=int(total_time),
+                status="WAITING_FOR_PAYMENT",
+                commission_rate_snapshot=commission_rate,
+                commission_amount=commission_amount,
+                total_price=total_price,
+                delivery_price=delivery_price,
+                delivery_address_text=delivery_address_text,
+                applied_promo_code=applied_promo,
+                discount_amount=discount_amount,
+                scheduled_delivery_time=scheduled_delivery_time,
+            )
+            if scheduled_delivery_time:
+                from api.services.slot_occupancy_service import SlotOccupancyService
+
+                # Занимаем место в слоте; при гонке за последнее место откатываем заказ
+                if not SlotOccupancyService().reserve(
+                    producer, scheduled_delivery_time, producer.max_orders_per_slot
+                ):
+                    raise serializers.ValidationError(
+                        {"scheduled_delivery_time": "Выбранное время уже заполнено. Пожалуйста, выберите другое время"}
+                    )
 
     @action(detail=True, methods=["post"], url_path="start_delivery")
     def start_delivery(self, request, pk=None):
@@ -1746,7 +1747,22 @@ class OrderViewSet(viewsets.ModelViewSet):
 
         serializer = OrderSerializer(data=new_order_data, context={"request": request})
         if serializer.is_valid():
-            new_order = serializer.save()
+            # Цена и время пересчитываются по текущим настройкам доставки магазина
+            dish = original_order.dish
+            quote = DeliveryQuoteEngine().quote(
+                dish,
+                original_order.quantity,
+                None if original_order.is_gift else original_order.delivery_latitude,
+                None if original_order.is_gift else original_order.delivery_longitude,
+                timezone.now(),
+                original_order.delivery_type,
+            )
+            new_order = serializer.save(
+                producer=dish.producer,
+                delivery_price=quote.delivery_price,
+                total_price=quote.total_price,
+                estimated_cooking_time=quote.cooking_time_minutes,
+            )
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         else:
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -2127,8 +2143,12 @@ class PaymentViewSet(viewsets.ReadOnlyModelViewSet):
             pass
         else:
             # Rejected -> Cancel Order, Penalty to Seller
+            previous_status = order.status
             order.status = "CANCELLED"
             order.save()
+            from api.services.order_summary_service import OrderSummaryService
+
+            OrderSummaryService().on_status_change(order, previous_status)
 
             producer = order.dish.producer
             producer.penalty_points += 1
@@ -2395,8 +2415,12 @@ class OrderApproveRescheduleView(APIView):
         producer = order.dish.producer
         producer.penalty_points = producer.penalty_points + 1
         producer.save()
+        previous_status = order.status
         order.status = "CANCELLED"
         order.save()
+        from api.services.order_summary_service import OrderSummaryService
+
+        OrderSummaryService().on_status_change(order, previous_status)
         return Response(
             {"detail": "Reschedule rejected, order cancelled, penalty applied"}
         )
@@ -2982,20 +3006,6 @@ def _parse_float(value):
         return None
 
 
-def _haversine_km(lat1, lon1, lat2, lon2):
-    r = 6371.0
-    phi1 = math.radians(lat1)
-    phi2 = math.radians(lat2)
-    dphi = math.radians(lat2 - lat1)
-    dlambda = math.radians(lon2 - lon1)
-    a = (
-        math.sin(dphi / 2) ** 2
-        + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
-    )
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    return r * c
-
-
 def _normalize_delivery_pricing_rules(value):
     if value is None:
         return None
@@ -3836,6 +3846,53 @@ class CartView(APIView):
         return Response(cart_data, status=status.HTTP_200_OK)
 
 
+class CartQuoteView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        cart, _ = Cart.objects.get_or_create(user=request.user)
+        data = CartQuoteService().quote_cart(
+            cart,
+            latitude=request.data.get("delivery_latitude"),
+            longitude=request.data.get("delivery_longitude"),
+            delivery_type=request.data.get("delivery_type", "BUILDING"),
+            promo_code_text=request.data.get("promo_code_text"),
+        )
+        return Response(data, status=status.HTTP_200_OK)
+
+
+class CartCheckoutView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        role = "CLIENT"
+        if request.auth:
+            try:
+                role = request.auth.get("role", "CLIENT")
+            except Exception:
+                pass
+        if role == "SELLER":
+            from rest_framework.exceptions import PermissionDenied
+
+            raise PermissionDenied(
+                "Продавцы не могут совершать покупки. Пожалуйста, войдите как Покупатель."
+            )
+        try:
+            result = CartCheckoutService().checkout(request.user, request.data)
+        except CheckoutError as exc:
+            return Response(exc.detail, status=status.HTTP_400_BAD_REQUEST)
+        return Response(
+            {
+                "checkout_id": str(result.checkout_id),
+                "total_price": result.total_price,
+                "orders": OrderSerializer(
+                    result.orders, many=True, context={"request": request}
+                ).data,
+            },
+            status=status.HTTP_201_CREATED,
+        )
+
+
 class CartAddView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -3854,7 +3911,7 @@ class CartAddView(APIView):
                 status=status.HTTP_400_BAD_REQUEST,
             )
         try:
-            dish = Dish.objects.get(id=dish_id)
+            dish = model_cache_service.cached_get(Dish, dish_id)
         except Dish.DoesNotExist:
             return Response(
                 {"detail": "Блюдо не найдено"}, status=status.HTTP_404_NOT_FOUND
@@ -3878,8 +3935,7 @@ class CartAddView(APIView):
         )
 
         if created:
-            dish.in_cart_count += 1
-            dish.save(update_fields=["in_cart_count"])
+            counter_service.increment(Dish, dish.pk, "in_cart_count")
 
         data = CartSerializer(cart).data
         return Response(data, status=status.HTTP_200_OK)
@@ -3902,8 +3958,7 @@ class CartRemoveView(APIView):
         try:
             item = cart.items.get(dish=dish, selected_toppings=selected_toppings)
             item.delete()
-            dish.in_cart_count = max(0, dish.in_cart_count - 1)
-            dish.save(update_fields=["in_cart_count"])
+            counter_service.increment(Dish, dish.pk, "in_cart_count", -1)
         except CartItem.DoesNotExist:
             pass
 
@@ -3918,10 +3973,8 @@ class CartClearView(APIView):
         cart, _ = Cart.objects.get_or_create(user=request.user)
 
         # Decrement counts before clearing
-        for item in cart.items.all():
-            dish = item.dish
-            dish.in_cart_count = max(0, dish.in_cart_count - 1)
-            dish.save(update_fields=["in_cart_count"])
+        for dish_id in cart.items.values_list("dish_id", flat=True):
+            counter_service.increment(Dish, dish_id, "in_cart_count", -1)
 
         cart.clear()
         data = CartSerializer(cart).data
@@ -4188,6 +4241,7 @@ class UserDeviceViewSet(viewsets.ReadOnlyModelViewSet):
 class NotificationViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = NotificationSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         return Notification.objects.filter(user=self.request.user).order_by(
@@ -4271,12 +4325,27 @@ class FavoriteDishViewSet(viewsets.ModelViewSet):
             )
 
 
-class HelpArticleViewSet(viewsets.ReadOnlyModelViewSet):
+class HelpArticleViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     queryset = HelpArticle.objects.filter(is_published=True)
     serializer_class = HelpArticleSerializer
     permission_classes = [AllowAny]
     search_fields = ["question", "answer", "category"]
     filter_backends = [SearchFilter]
+    conditional_tags = ["helparticle"]
+    cache_control = {"public": True, "max_age": 300}
+
+    def list(self, request, *args, **kwargs):
+        from core.cache import cache_service
+
+        # Help articles rarely change: the page is cached per query string (L1 + shared
+        # cache) until any HelpArticle is saved or deleted
+        key = cache_service.make_key("help:articles", dict(request.query_params.lists()))
+        data = cache_service.fetch(
+            key,
+            lambda: super(HelpArticleViewSet, self).list(request, *args, **kwargs).data,
+            tags=["helparticle"],
+        )
+        return Response(data)
 
 
 class BecomeSellerView(APIView):
@@ -1,3 +1,4 @@
+import json
 import os
 from datetime import timedelta
 from pathlib import Path
@@ -68,6 +69,8 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'backend.wsgi.application'
+# Поток событий /api/events/ (SSE) обслуживается только через ASGI
+ASGI_APPLICATION = 'backend.asgi.application'
 
 # Custom user model
 AUTH_USER_MODEL = 'users.User'
@@ -162,6 +165,56 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 20,
 }
 
+# Сэмплируемая инструментация DRF-представлений (core.instrumentation)
+QUERY_INSTRUMENTATION_ENABLED = os.getenv('QUERY_INSTRUMENTATION_ENABLED', 'False') == 'True'
+QUERY_INSTRUMENTATION_SAMPLE_RATE = float(os.getenv('QUERY_INSTRUMENTATION_SAMPLE_RATE', '0.1'))
+QUERY_INSTRUMENTATION_SINK = os.getenv(
+    'QUERY_INSTRUMENTATION_SINK', 'core.instrumentation.LoggingMetricsSink'
+)
+# Интервал записи счётчиков кэша (core.cache.CacheMetrics) в этот приёмник, секунды; 0 - не писать
+CACHE_METRICS_FLUSH_INTERVAL = int(os.getenv('CACHE_METRICS_FLUSH_INTERVAL', '60'))
+
+# Кэш в памяти процесса (L1) перед общим кэшем для префиксов ключей core.cache.
+# Инвалидация рассылается процессам через CACHE_L1_BROADCAST: с Redis - всем
+# процессам и узлам, без него общий кэш (LocMemCache) и так свой у каждого процесса
+CACHE_L1_PREFIXES = [
+    prefix for prefix in os.getenv('CACHE_L1_PREFIXES', 'categories,help').split(',') if prefix
+]
+CACHE_L1_MAX_ENTRIES = int(os.getenv('CACHE_L1_MAX_ENTRIES', '1000'))
+CACHE_L1_MAX_BYTES = int(os.getenv('CACHE_L1_MAX_BYTES', str(32 * 1024 * 1024)))
+# Верхняя граница устаревания L1, если сообщение об инвалидации потерялось, секунды
+CACHE_L1_TIMEOUT = int(os.getenv('CACHE_L1_TIMEOUT', '60'))
+CACHE_L1_BROADCAST = os.getenv(
+    'CACHE_L1_BROADCAST',
+    'core.cache.RedisCacheBroadcast' if redis_url else 'core.cache.LocalCacheBroadcast',
+)
+CACHE_L1_BROADCAST_OPTIONS = json.loads(os.getenv('CACHE_L1_BROADCAST_OPTIONS', '{}'))
+
+# Буферизованная запись истории поиска (api.services.search_history_service)
+SEARCH_HISTORY_ASYNC = os.getenv('SEARCH_HISTORY_ASYNC', 'True') == 'True'
+SEARCH_HISTORY_BUFFER_SIZE = int(os.getenv('SEARCH_HISTORY_BUFFER_SIZE', '1000'))
+SEARCH_HISTORY_FLUSH_BATCH = int(os.getenv('SEARCH_HISTORY_FLUSH_BATCH', '100'))
+SEARCH_HISTORY_FLUSH_INTERVAL = float(os.getenv('SEARCH_HISTORY_FLUSH_INTERVAL', '5'))
+
+# Публикация outbox-событий (api.services.outbox_publishers)
+OUTBOX_PUBLISHER = os.getenv(
+    'OUTBOX_PUBLISHER', 'api.services.outbox_publishers.DatabasePublisher'
+)
+# Аргументы конструктора публикатора в JSON, например {"path": "/var/log/outbox.jsonl"}
+OUTBOX_PUBLISHER_OPTIONS = json.loads(os.getenv('OUTBOX_PUBLISHER_OPTIONS', '{}'))
+
+# Push-доставка событий клиентам через SSE (api.services.push_service).
+# С Redis события раздаются всем процессам и узлам, без него - только своему процессу
+PUSH_BROKER = os.getenv(
+    'PUSH_BROKER',
+    'api.services.push_service.RedisPubSubBroker'
+    if redis_url
+    else 'api.services.push_service.InProcessBroker',
+)
+PUSH_BROKER_OPTIONS = json.loads(os.getenv('PUSH_BROKER_OPTIONS', '{}'))
+# Интервал комментария-heartbeat в открытом потоке, секунды
+PUSH_HEARTBEAT_SECONDS = float(os.getenv('PUSH_HEARTBEAT_SECONDS', '25'))
+
 # JWT Settings
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(hours=1),
@@ -1,12 +1,421 @@
 """
 Улучшенная система кэширования для приложения.
+
+Инвалидация по тегам: запись кэша может зависеть от тегов
+(например, producer:{id} или dish:{id}). У каждого тега есть счётчик
+поколения, и текущие поколения тегов входят в ключ записи.
+invalidate_tags увеличивает счётчики - прежние ключи больше не
+читаются и истекают по TTL. Инвалидация стоит O(число тегов) и не
+требует перебора ключей.
+
+CacheService.fetch - чтение через кэш с защитой от лавины пересчётов:
+пересчёт ключа выполняет один процесс (блокировка через cache.add),
+остальные тем временем получают устаревшее значение; пересчёт
+начинается вероятностно раньше истечения (XFetch) и тем раньше, чем
+дольше вычисление; отсутствующие объекты кэшируются коротким
+отрицательным TTL. Счётчики попаданий и пересчётов по префиксу ключа
+собирает CacheMetrics.
+
+Реестр моделей ModelCacheService: для зарегистрированной модели
+cached_get(Model, pk) читает экземпляр с проекцией полей через кэш.
+Сохранение и удаление объекта, а также update и bulk_update
+CachedModelQuerySet по полям проекции сбрасывают его записи.
+
+Двухуровневый кэш: для префиксов из CACHE_L1_PREFIXES перед общим
+кэшем (L2) стоит LocalLRUCache в памяти процесса (L1), ограниченный
+числом записей, объёмом и TTL. Попадание в L1 не обращается ни к
+значению, ни к поколениям тегов в L2. Инвалидация тегов и ключей
+рассылается остальным процессам через CacheBroadcast
+(CACHE_L1_BROADCAST); TTL L1 ограничивает устаревание, если сообщение
+потерялось. Значения из L1 общие для потоков процесса - их нельзя
+изменять на месте.
 """
 
 import hashlib
 import json
-from typing import Any, Optional, Union
+import math
+import os
+import pickle
+import random
+import sys
+import threading
+import time
+import uuid
+import warnings
+import weakref
+from collections import Counter, OrderedDict, defaultdict
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
 
+from django.conf import settings
 from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save
+from django.utils.module_loading import import_string
+
+from core.logging import get_logger
+
+logger = get_logger(__name__)
+
+# Бэкенды, данные которых не видны другим процессам
+PROCESS_LOCAL_CACHE_BACKENDS = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+
+
+def is_shared_cache(alias: str = "default") -> bool:
+    """
+    Видят ли записи кэша alias другие процессы (веб-воркеры и фоновые команды).
+
+    Буферы, которые наполняет веб-процесс, а сбрасывает фоновая команда,
+    на локальном кэше не работают: команда их не увидит.
+    """
+    backend = settings.CACHES.get(alias, {}).get("BACKEND", "")
+    return backend not in PROCESS_LOCAL_CACHE_BACKENDS
+
+
+@dataclass
+class CacheEntry:
+    """
+    Значение в кэше вместе с мягким сроком и временем вычисления.
+
+    Запись хранится дольше мягкого срока на stale_timeout: в это время
+    её можно отдать, пока другой процесс пересчитывает значение.
+    """
+
+    value: Any
+    expires_at: float
+    delta: float
+
+    def should_refresh(self, now: float, beta: float = 1.0) -> bool:
+        # XFetch: -log(U) > 0, поэтому пересчёт иногда начинается до expires_at
+        return now - self.delta * beta * math.log(1.0 - random.random()) >= self.expires_at
+
+
+class CacheMetrics:
+    """
+    Счётчики чтения через кэш по префиксу ключа (часть ключа до первого ":").
+
+    Раз в CACHE_METRICS_FLUSH_INTERVAL секунд накопленные счётчики
+    записываются в приёмник метрик QUERY_INSTRUMENTATION_SINK и обнуляются.
+    """
+
+    FIELDS = (
+        "hits",
+        "misses",
+        "stale_hits",
+        "early_refreshes",
+        "negative_hits",
+        "lock_waits",
+        "recomputes",
+        "l1_hits",
+    )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Counter] = defaultdict(Counter)
+        self._recompute_seconds: Dict[str, float] = defaultdict(float)
+        self._flushed_at = time.monotonic()
+
+    def incr(self, prefix: str, field: str) -> None:
+        with self._lock:
+            self._counters[prefix][field] += 1
+        self._maybe_flush()
+
+    def recomputed(self, prefix: str, seconds: float) -> None:
+        with self._lock:
+            self._counters[prefix]["recomputes"] += 1
+            self._recompute_seconds[prefix] += seconds
+        self._maybe_flush()
+
+    def snapshot(self, reset: bool = False) -> Dict[str, dict]:
+        """Счётчики по префиксам: {prefix: {hits, misses, ..., recompute_seconds}}."""
+        with self._lock:
+            result = {
+                prefix: {
+                    **{field: counters[field] for field in self.FIELDS},
+                    "recompute_seconds": round(self._recompute_seconds[prefix], 6),
+                }
+                for prefix, counters in self._counters.items()
+            }
+            if reset:
+                self._counters.clear()
+                self._recompute_seconds.clear()
+                self._flushed_at = time.monotonic()
+        return result
+
+    def flush(self) -> None:
+        """Записать счётчики и заполненность L1-кэшей в приёмник метрик, обнулить счётчики."""
+        from core.instrumentation import get_metrics_sink
+
+        sink = get_metrics_sink(settings.QUERY_INSTRUMENTATION_SINK)
+        for prefix, counters in self.snapshot(reset=True).items():
+            sink.record({"kind": "cache", "prefix": prefix, **counters})
+        for local_cache in list(LocalLRUCache.instances):
+            sink.record({"kind": "cache_l1", **local_cache.stats()})
+
+    def _maybe_flush(self) -> None:
+        interval = getattr(settings, "CACHE_METRICS_FLUSH_INTERVAL", 0)
+        if interval and time.monotonic() - self._flushed_at >= interval:
+            self.flush()
+
+
+cache_metrics = CacheMetrics()
+
+
+class LocalLRUCache:
+    """
+    LRU-кэш в памяти процесса (L1) с ограничением по числу записей,
+    объёму и TTL.
+
+    Объём записи оценивается по размеру pickle при сохранении. Записи
+    можно пометить тегами и сбрасывать по ним. Если задан broadcast,
+    delete и invalidate_tags рассылаются остальным процессам.
+    """
+
+    # Все экземпляры процесса - для отчёта о памяти в CacheMetrics.flush
+    instances: "weakref.WeakSet[LocalLRUCache]" = weakref.WeakSet()
+
+    def __init__(
+        self,
+        name: str = "default",
+        max_entries: int = 1000,
+        max_bytes: int = 32 * 1024 * 1024,
+        default_timeout: int = 60,
+        broadcast: Optional["CacheBroadcast"] = None,
+    ):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_timeout = default_timeout
+        self.origin = uuid.uuid4().hex
+        self._lock = threading.Lock()
+        # key -> (value, expires_at, size, tags)
+        self._entries: "OrderedDict[str, Tuple[Any, float, int, Tuple[str, ...]]]" = OrderedDict()
+        self._tag_keys: Dict[str, Set[str]] = defaultdict(set)
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self.broadcast = broadcast
+        if broadcast is not None:
+            broadcast.subscribe(self._on_message)
+        LocalLRUCache.instances.add(self)
+
+    @staticmethod
+    def _size(value: Any) -> int:
+        try:
+            return len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        except Exception:
+            return sys.getsizeof(value)
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """(найдено, значение); истёкшая запись удаляется."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self._misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return True, entry[0]
+
+    def set(
+        self,
+        key: str,
+        value: Any,
+        timeout: Optional[int] = None,
+        tags: Optional[Iterable[str]] = None,
+    ) -> bool:
+        """Сохранить значение; значение больше max_bytes не сохраняется."""
+        timeout = self.default_timeout if timeout is None else min(timeout, self.default_timeout)
+        size = self._size(value)
+        if timeout <= 0 or size > self.max_bytes:
+            return False
+        tags = tuple(sorted(set(tags or ())))
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (value, time.monotonic() + timeout, size, tags)
+            self._bytes += size
+            for tag in tags:
+                self._tag_keys[tag].add(key)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self._evictions += 1
+        return True
+
+    def _remove(self, key: str) -> None:
+        # Вызывается под self._lock
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._bytes -= entry[2]
+        for tag in entry[3]:
+            keys = self._tag_keys.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tag_keys[tag]
+
+    def _delete_local(self, keys: Iterable[str] = (), tags: Iterable[str] = ()) -> None:
+        with self._lock:
+            keys = set(keys)
+            for tag in tags:
+                keys.update(self._tag_keys.get(tag, ()))
+            for key in keys:
+                self._remove(key)
+
+    def _publish(self, keys: Iterable[str] = (), tags: Iterable[str] = ()) -> None:
+        if self.broadcast is None:
+            return
+        try:
+            self.broadcast.publish({"origin": self.origin, "keys": list(keys), "tags": list(tags)})
+        except Exception as exc:
+            # Остальные процессы увидят изменение по истечении TTL
+            logger.warning("cache_l1_broadcast_failed", cache=self.name, error=str(exc))
+
+    def delete(self, *keys: str) -> None:
+        """Удалить ключи здесь и в остальных процессах."""
+        self._delete_local(keys=keys)
+        self._publish(keys=keys)
+
+    def invalidate_tags(self, *tags: str) -> None:
+        """Удалить записи с любым из тегов здесь и в остальных процессах."""
+        self._delete_local(tags=tags)
+        self._publish(tags=tags)
+
+    def _on_message(self, message: dict) -> None:
+        if message.get("origin") == self.origin:
+            return
+        self._delete_local(message.get("keys") or (), message.get("tags") or ())
+
+    def clear(self) -> None:
+        """Очистить кэш этого процесса."""
+        with self._lock:
+            self._entries.clear()
+            self._tag_keys.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        """Заполненность и счётчики: entries, bytes, hits, misses, evictions."""
+        with self._lock:
+            return {
+                "name": self.name,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+            }
+
+
+class CacheBroadcast:
+    """Канал рассылки инвалидаций L1 между процессами."""
+
+    def publish(self, message: dict) -> None:
+        raise NotImplementedError
+
+    def subscribe(self, handler: Callable[[dict], None]) -> None:
+        raise NotImplementedError
+
+
+class LocalCacheBroadcast(CacheBroadcast):
+    """
+    Рассылка внутри процесса: обработчики вызываются синхронно.
+    Для одного процесса и для тестов.
+    """
+
+    def __init__(self):
+        self._handlers: List[Callable[[dict], None]] = []
+        self._lock = threading.Lock()
+
+    def publish(self, message: dict) -> None:
+        with self._lock:
+            handlers = list(self._handlers)
+        for handler in handlers:
+            handler(message)
+
+    def subscribe(self, handler: Callable[[dict], None]) -> None:
+        with self._lock:
+            self._handlers.append(handler)
+
+
+class RedisCacheBroadcast(LocalCacheBroadcast):
+    """
+    Рассылка через Redis PUBLISH/SUBSCRIBE: каждый процесс слушает канал
+    в фоновом потоке. Без url используется REDIS_URL; без Redis рассылка
+    не создаётся: процессы отдавали бы устаревшие записи до CACHE_L1_TIMEOUT.
+    """
+
+    def __init__(self, url: str = None, channel: str = "cache:l1"):
+        super().__init__()
+        self.channel = channel
+        self.client = self._connect(url or os.getenv("REDIS_URL"))
+        self._listener = None
+
+    @staticmethod
+    def _connect(url):
+        if not url:
+            raise ImproperlyConfigured(
+                "RedisCacheBroadcast requires REDIS_URL or an explicit url"
+            )
+        try:
+            import redis
+        except ImportError:
+            raise ImproperlyConfigured(
+                "RedisCacheBroadcast requires the 'redis' package"
+            ) from None
+        return redis.Redis.from_url(url)
+
+    def publish(self, message: dict) -> None:
+        self.client.publish(self.channel, json.dumps(message))
+
+    def subscribe(self, handler: Callable[[dict], None]) -> None:
+        super().subscribe(handler)
+        with self._lock:
+            if self._listener is not None:
+                return
+            pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{self.channel: self._on_message})
+            self._listener = pubsub.run_in_thread(sleep_time=0.1, daemon=True)
+
+    def _on_message(self, message) -> None:
+        try:
+            data = json.loads(message["data"])
+        except (TypeError, ValueError):
+            logger.warning("cache_l1_message_invalid", channel=self.channel)
+            return
+        super().publish(data)
+
+
+_local_cache = None
+_local_cache_lock = threading.Lock()
+
+
+def get_local_cache() -> LocalLRUCache:
+    """L1-кэш процесса из настроек CACHE_L1_* с рассылкой CACHE_L1_BROADCAST."""
+    global _local_cache
+    if _local_cache is None:
+        with _local_cache_lock:
+            if _local_cache is None:
+                path = getattr(settings, "CACHE_L1_BROADCAST", "core.cache.LocalCacheBroadcast")
+                options = getattr(settings, "CACHE_L1_BROADCAST_OPTIONS", {}) or {}
+                _local_cache = LocalLRUCache(
+                    "default",
+                    max_entries=getattr(settings, "CACHE_L1_MAX_ENTRIES", 1000),
+                    max_bytes=getattr(settings, "CACHE_L1_MAX_BYTES", 32 * 1024 * 1024),
+                    default_timeout=getattr(settings, "CACHE_L1_TIMEOUT", 60),
+                    broadcast=import_string(path)(**options),
+                )
+    return _local_cache
 
 
 class CacheService:
@@ -15,8 +424,27 @@ class CacheService:
     Предоставляет удобные методы для кэширования данных с префиксами и TTL.
     """
     
+    TAG_KEY = "cache:tag:{tag}"
+    # Время последней инвалидации тега модели (для Last-Modified); для тегов
+    # объектов ("dish:42") не хранится, чтобы не держать ключ на каждый объект
+    TAG_TIME_KEY = "cache:tag:{tag}:at"
+    # Срок жизни ключей тегов: не короче самой долгой записи (сутки и
+    # stale_timeout), чтобы тег не пропадал раньше зависящих от него записей.
+    # Истёкший тег создаётся заново из часов, старые записи не оживают
+    TAG_TIMEOUT = 7 * 24 * 3600
+    LOCK_SUFFIX = ":lock"
+
     def __init__(self):
         self.default_timeout = 300  # 5 минут по умолчанию
+        # Сколько после мягкого срока можно отдавать значение, пока идёт пересчёт
+        self.stale_timeout = 60
+        self.lock_timeout = 30
+        self.lock_wait = 2.0
+        self.lock_poll_interval = 0.05
+        self.early_refresh_beta = 1.0
+        self.metrics = cache_metrics
+        # L1 для префиксов из CACHE_L1_PREFIXES; None - get_local_cache()
+        self.local_cache: Optional[LocalLRUCache] = None
     
     def make_key(self, prefix: str, *args) -> str:
         """
@@ -38,20 +466,147 @@ class CacheService:
         
         return ":".join(key_parts)
     
-    def get(self, key: str, default: Any = None) -> Any:
+    def _local(self, key: str, tags: Optional[Iterable[str]] = None):
+        """
+        (L1-кэш, ключ L1) для префиксов из CACHE_L1_PREFIXES, иначе (None, None).
+        
+        Ключ L1 включает имена тегов, а не поколения: записи L1 сбрасываются
+        invalidate_tags напрямую, без чтения поколений из L2.
+        """
+        prefixes = getattr(settings, "CACHE_L1_PREFIXES", ())
+        if key.split(":", 1)[0] not in prefixes:
+            return None, None
+        local_cache = self.local_cache or get_local_cache()
+        if not tags:
+            return local_cache, key
+        return local_cache, f"{key}|{','.join(sorted(set(tags)))}"
+
+    @staticmethod
+    def _new_generation() -> int:
+        # Начальное поколение из часов: после вытеснения счётчика тега
+        # из кэша старые записи не станут снова читаемыми
+        return time.time_ns() // 1000
+
+    def tag_versions(self, tags: Iterable[str]) -> Dict[str, int]:
+        """
+        Текущие поколения тегов (одним get_many); отсутствующие создаются.
+        
+        Args:
+            tags: Теги записи
+        
+        Returns:
+            Словарь {тег: поколение}
+        """
+        tags = sorted(set(tags))
+        if not tags:
+            return {}
+        keys = {self.TAG_KEY.format(tag=tag): tag for tag in tags}
+        found = cache.get_many(list(keys))
+        versions = {}
+        for key, tag in keys.items():
+            version = found.get(key)
+            if version is None:
+                cache.add(key, self._new_generation(), self.TAG_TIMEOUT)
+                version = cache.get(key)
+            versions[tag] = version
+        return versions
+
+    def tag_stamps(self, tags: Iterable[str]):
+        """
+        Поколения тегов и время их последнего изменения одним get_many.
+        
+        Время хранится только для тегов моделей (без ":"). Для тега без
+        записанного времени берётся текущее: Last-Modified может
+        оказаться позже настоящего, но не раньше.
+        
+        Args:
+            tags: Теги
+        
+        Returns:
+            ({тег: поколение}, время последнего изменения любого из тегов в секундах)
+        """
+        tags = sorted(set(tags))
+        time_keys = [self.TAG_TIME_KEY.format(tag=tag) for tag in tags if ":" not in tag]
+        found = cache.get_many([self.TAG_KEY.format(tag=tag) for tag in tags] + time_keys)
+        missing = [tag for tag in tags if self.TAG_KEY.format(tag=tag) not in found]
+        versions = {tag: found[self.TAG_KEY.format(tag=tag)] for tag in tags if tag not in missing}
+        versions.update(self.tag_versions(missing))
+        stamps = []
+        for key in time_keys:
+            stamp = found.get(key)
+            if stamp is None:
+                stamp = time.time()
+                cache.add(key, stamp, self.TAG_TIMEOUT)
+            stamps.append(stamp)
+        return dict(sorted(versions.items())), max(stamps, default=time.time())
+
+    def tagged_key(self, key: str, tags: Optional[Iterable[str]] = None) -> str:
+        """
+        Ключ с поколениями тегов: после invalidate_tags любого из тегов
+        тот же key даёт другой ключ кэша.
+        
+        Args:
+            key: Базовый ключ
+            tags: Теги, от которых зависит запись
+        
+        Returns:
+            Ключ кэша
+        """
+        if not tags:
+            return key
+        versions = self.tag_versions(tags)
+        signature = ",".join(f"{tag}={version}" for tag, version in versions.items())
+        return f"{key}:t{hashlib.md5(signature.encode()).hexdigest()[:16]}"
+
+    def invalidate_tags(self, *tags: str) -> None:
+        """
+        Инвалидировать все записи, зависящие от любого из тегов.
+        
+        Args:
+            *tags: Теги, например "producer:42"
+        """
+        for tag in set(tags):
+            key = self.TAG_KEY.format(tag=tag)
+            try:
+                cache.incr(key)
+            except ValueError:
+                # Счётчика нет - записей с тегом тоже нет, а читатель создаст
+                # его из часов. Не записываем: иначе каждый изменённый объект
+                # оставлял бы в кэше ключ на TAG_TIMEOUT
+                pass
+        stamps = {self.TAG_TIME_KEY.format(tag=tag): time.time() for tag in set(tags) if ":" not in tag}
+        if stamps:
+            cache.set_many(stamps, self.TAG_TIMEOUT)
+        if getattr(settings, "CACHE_L1_PREFIXES", ()):
+            (self.local_cache or get_local_cache()).invalidate_tags(*tags)
+
+    def get(self, key: str, default: Any = None, tags: Optional[Iterable[str]] = None) -> Any:
         """
         Получить значение из кэша.
         
         Args:
             key: Ключ кэша
             default: Значение по умолчанию, если ключ не найден
+            tags: Теги, с которыми значение было сохранено
         
         Returns:
             Значение из кэша или default
         """
-        return cache.get(key, default)
+        local_cache, local_key = self._local(key, tags)
+        if local_cache is not None:
+            found, value = local_cache.get(local_key)
+            if found:
+                return value
+        value = cache.get(self.tagged_key(key, tags), default)
+        return value.value if isinstance(value, CacheEntry) else value
     
-    def set(self, key: str, value: Any, timeout: Optional[int] = None) -> bool:
+    def set(
+        self,
+        key: str,
+        value: Any,
+        timeout: Optional[int] = None,
+        tags: Optional[Iterable[str]] = None,
+    ) -> bool:
         """
         Сохранить значение в кэше.
         
@@ -59,6 +614,7 @@ class CacheService:
             key: Ключ кэша
             value: Значение для сохранения
             timeout: Время жизни в секундах (если None, используется значение по умолчанию)
+            tags: Теги, при инвалидации которых значение перестаёт читаться
         
         Returns:
             True, если успешно сохранено
@@ -66,41 +622,150 @@ class CacheService:
         if timeout is None:
             timeout = self.default_timeout
         
-        return cache.set(key, value, timeout)
+        local_cache, local_key = self._local(key, tags)
+        if local_cache is not None:
+            local_cache.delete(local_key)
+        return cache.set(self.tagged_key(key, tags), value, timeout)
     
-    def delete(self, key: str) -> bool:
+    def delete(self, key: str, tags: Optional[Iterable[str]] = None) -> bool:
         """
         Удалить значение из кэша.
         
         Args:
             key: Ключ кэша для удаления
+            tags: Теги, с которыми значение было сохранено
         
         Returns:
             True, если успешно удалено
         """
-        return cache.delete(key)
+        local_cache, local_key = self._local(key, tags)
+        if local_cache is not None:
+            local_cache.delete(local_key)
+        return cache.delete(self.tagged_key(key, tags))
     
-    def get_or_set(self, key: str, callable_func, timeout: Optional[int] = None) -> Any:
+    def get_or_set(
+        self,
+        key: str,
+        callable_func,
+        timeout: Optional[int] = None,
+        tags: Optional[Iterable[str]] = None,
+    ) -> Any:
         """
         Получить значение из кэша или установить его, если не существует.
+        Пересчёт защищён от лавины (см. fetch).
         
         Args:
             key: Ключ кэша
             callable_func: Функция для получения значения, если его нет в кэше
             timeout: Время жизни в секундах
+            tags: Теги, от которых зависит значение
         
         Returns:
             Значение из кэша или результат callable_func
         """
-        if timeout is None:
-            timeout = self.default_timeout
+        return self.fetch(key, callable_func, timeout, tags=tags)
+    
+    def fetch(
+        self,
+        key: str,
+        loader: Callable[[], Any],
+        timeout: Optional[int] = None,
+        tags: Optional[Iterable[str]] = None,
+        stale_timeout: Optional[int] = None,
+        negative_timeout: Optional[int] = None,
+    ) -> Any:
+        """
+        Прочитать значение через кэш с защитой от одновременного пересчёта.
+        
+        Для префиксов из CACHE_L1_PREFIXES значение сначала ищется в L1
+        процесса и сохраняется туда после чтения из L2.
         
-        return cache.get_or_set(key, callable_func, timeout)
+        Свежее значение возвращается сразу. Истёкшее (или выбранное для
+        раннего пересчёта) пересчитывает процесс, получивший блокировку
+        ключа; остальные отдают устаревшее значение, а если его нет -
+        ждут до lock_wait секунд и только затем считают сами.
+        
+        Args:
+            key: Ключ кэша
+            loader: Функция вычисления значения
+            timeout: Мягкий срок жизни значения в секундах
+            tags: Теги, от которых зависит значение
+            stale_timeout: Сколько после мягкого срока отдавать устаревшее значение
+            negative_timeout: Если задан, результат None кэшируется на это время
+        
+        Returns:
+            Значение из кэша или результат loader
+        """
+        timeout = self.default_timeout if timeout is None else timeout
+        stale_timeout = self.stale_timeout if stale_timeout is None else stale_timeout
+        prefix = key.split(":", 1)[0]
+
+        local_cache, local_key = self._local(key, tags)
+        if local_cache is None:
+            return self._fetch_shared(key, prefix, loader, timeout, tags, stale_timeout, negative_timeout)
+        found, value = local_cache.get(local_key)
+        if found:
+            self.metrics.incr(prefix, "l1_hits")
+            return value
+        value = self._fetch_shared(key, prefix, loader, timeout, tags, stale_timeout, negative_timeout)
+        if value is not None:
+            local_cache.set(local_key, value, timeout, tags)
+        return value
+
+    def _fetch_shared(self, key, prefix, loader, timeout, tags, stale_timeout, negative_timeout) -> Any:
+        # Чтение через L2 с защитой от лавины пересчётов (см. fetch)
+        cache_key = self.tagged_key(key, tags)
+        entry = cache.get(cache_key)
+        if not isinstance(entry, CacheEntry):
+            entry = None
+        if entry is not None and not entry.should_refresh(time.time(), self.early_refresh_beta):
+            self.metrics.incr(prefix, "hits" if entry.value is not None else "negative_hits")
+            return entry.value
+
+        lock_key = cache_key + self.LOCK_SUFFIX
+        if cache.add(lock_key, 1, self.lock_timeout):
+            try:
+                if entry is None:
+                    self.metrics.incr(prefix, "misses")
+                elif entry.expires_at > time.time():
+                    self.metrics.incr(prefix, "early_refreshes")
+                return self._recompute(cache_key, prefix, loader, timeout, stale_timeout, negative_timeout)
+            finally:
+                cache.delete(lock_key)
+
+        if entry is not None:
+            self.metrics.incr(prefix, "stale_hits")
+            return entry.value
+
+        # Значения нет, его уже считает другой процесс
+        self.metrics.incr(prefix, "lock_waits")
+        deadline = time.monotonic() + self.lock_wait
+        while time.monotonic() < deadline:
+            time.sleep(self.lock_poll_interval)
+            entry = cache.get(cache_key)
+            if isinstance(entry, CacheEntry):
+                self.metrics.incr(prefix, "hits")
+                return entry.value
+        self.metrics.incr(prefix, "misses")
+        return self._recompute(cache_key, prefix, loader, timeout, stale_timeout, negative_timeout)
+
+    def _recompute(self, cache_key, prefix, loader, timeout, stale_timeout, negative_timeout) -> Any:
+        started = time.perf_counter()
+        value = loader()
+        delta = time.perf_counter() - started
+        self.metrics.recomputed(prefix, delta)
+        if value is None:
+            if negative_timeout:
+                cache.set(cache_key, CacheEntry(None, time.time() + negative_timeout, delta), negative_timeout)
+            return None
+        cache.set(cache_key, CacheEntry(value, time.time() + timeout, delta), timeout + stale_timeout)
+        return value
     
     def delete_pattern(self, pattern: str) -> int:
         """
         Удалить все ключи, соответствующие паттерну.
         ВНИМАНИЕ: Может быть медленной операцией в больших кэшах.
+        Устарело: используйте теги и invalidate_tags.
         
         Args:
             pattern: Паттерн для поиска ключей (например, 'users:*')
@@ -108,6 +773,11 @@ class CacheService:
         Returns:
             Количество удаленных ключей
         """
+        warnings.warn(
+            "CacheService.delete_pattern is deprecated, use invalidate_tags",
+            DeprecationWarning,
+            stacklevel=2,
+        )
         # Django не предоставляет встроенного метода для удаления по паттерну
         # Это базовая реализация, которая может быть улучшена в зависимости от бэкенда кэша
         try:
@@ -123,11 +793,218 @@ class CacheService:
         return 0
 
 
+@dataclass(frozen=True)
+class CachedModel:
+    """Настройки модели в реестре ModelCacheService."""
+
+    # Проекция: only(*fields) или defer(*defer); изменение полей вне неё не сбрасывает кэш экземпляров
+    fields: Tuple[str, ...]
+    defer: Tuple[str, ...]
+    # Внешние ключи: связанный объект берётся через cached_get, его тег сбрасывается вместе с нашим
+    related: Tuple[str, ...]
+    # Счётчики популярности: их пакетная запись не сбрасывает ни экземпляры,
+    # ни тег модели (ETag списков не меняется от каждого сброса счётчиков)
+    counters: Tuple[str, ...]
+    timeout: Optional[int]
+
+    def projection(self, model_class) -> Set[str]:
+        """Имена полей, которые загружает cached_get."""
+        concrete = {field.name for field in model_class._meta.concrete_fields}
+        if self.fields:
+            return set(self.fields) | {model_class._meta.pk.name}
+        return concrete - set(self.defer)
+
+
+# Внутри bulk_update: сброс выполняет bulk_update, а не вложенный update
+_bulk_updating: ContextVar[bool] = ContextVar("model_cache_bulk_updating", default=False)
+
+
+class CachedModelQuerySet(models.QuerySet):
+    """
+    QuerySet моделей из реестра ModelCacheService: update и bulk_update
+    сбрасывают тег модели, а по полям проекции - и закэшированные
+    экземпляры (сигналы post_save для них не отправляются). Запись
+    только счётчиков (counters из register) ничего не сбрасывает.
+    """
+
+    def update(self, **kwargs):
+        service = model_cache_service
+        if _bulk_updating.get() or not service.tracks_changes(self.model, kwargs):
+            return super().update(**kwargs)
+        # Тег модели сбрасывается всегда (по нему считаются ETag списков),
+        # теги экземпляров - только при изменении полей проекции
+        rows = service.cache_rows(self) if service.affects_cache(self.model, kwargs) else []
+        updated = super().update(**kwargs)
+        service.invalidate_rows(self.model, rows)
+        return updated
+
+    update.alters_data = True
+
+    def bulk_update(self, objs, fields, batch_size=None):
+        objs = list(objs)
+        token = _bulk_updating.set(True)
+        try:
+            updated = super().bulk_update(objs, fields, batch_size=batch_size)
+        finally:
+            _bulk_updating.reset(token)
+        service = model_cache_service
+        if service.tracks_changes(self.model, fields):
+            affected = service.affects_cache(self.model, fields)
+            service.invalidate_rows(self.model, [service.cache_row(obj) for obj in objs] if affected else [])
+        return updated
+
+    bulk_update.alters_data = True
+
+
 class ModelCacheService(CacheService):
     """
     Специализированный сервис кэширования для Django моделей.
+    
+    Экземпляр кэшируется с тегами "<model>:<pk>" и "<model>", выборка -
+    с тегом "<model>" и дополнительными тегами вызывающего. Отсутствие
+    экземпляра кэшируется на negative_timeout секунд: сохранение любого
+    объекта модели сбрасывает тег "<model>" и эту запись.
+    
+    Модели из реестра (register) читаются через cached_get и
+    инвалидируются автоматически.
     """
     
+    negative_timeout = 30
+    registry: Dict[type, CachedModel] = {}
+    
+    def register(
+        self,
+        model_class,
+        fields: Iterable[str] = (),
+        defer: Iterable[str] = (),
+        related: Iterable[str] = (),
+        counters: Iterable[str] = (),
+        timeout: Optional[int] = None,
+    ) -> None:
+        """
+        Зарегистрировать модель для cached_get.
+        
+        Сохранение и удаление объекта сбрасывают теги "<model>",
+        "<model>:<pk>" и теги связанных объектов из related. Для
+        update и bulk_update менеджер модели должен быть
+        CachedModelQuerySet.as_manager().
+        
+        Args:
+            model_class: Класс Django модели
+            fields: Загружаемые поля (only); по умолчанию все, кроме defer
+            defer: Поля, которые не загружаются и не сбрасывают кэш при update
+            related: Внешние ключи, связанные объекты которых подставляются через cached_get
+            counters: Поля-счётчики, update и bulk_update которых ничего не сбрасывают
+            timeout: Время жизни кэша
+        """
+        self.registry[model_class] = CachedModel(
+            tuple(fields), tuple(defer), tuple(related), tuple(counters), timeout
+        )
+        dispatch_uid = f"model_cache:{model_class._meta.label_lower}"
+        post_save.connect(self._on_change, sender=model_class, weak=False, dispatch_uid=dispatch_uid)
+        post_delete.connect(self._on_change, sender=model_class, weak=False, dispatch_uid=dispatch_uid)
+    
+    def _on_change(self, sender, instance, **kwargs) -> None:
+        self.invalidate_rows(sender, [self.cache_row(instance)])
+    
+    def tracks_changes(self, model_class, fields: Iterable[str]) -> bool:
+        """Сбрасывает ли update полей fields теги модели (модель в реестре, не только счётчики)."""
+        config = self.registry.get(model_class)
+        if config is None:
+            return False
+        names = {model_class._meta.get_field(name).name for name in fields}
+        return not names <= set(config.counters)
+
+    def affects_cache(self, model_class, fields: Iterable[str]) -> bool:
+        """Затрагивает ли изменение полей fields закэшированные экземпляры модели."""
+        config = self.registry.get(model_class)
+        if config is None:
+            return False
+        names = {model_class._meta.get_field(name).name for name in fields}
+        return bool(names & config.projection(model_class))
+    
+    def cache_row(self, instance) -> tuple:
+        """(pk, id связанных объектов из related) экземпляра."""
+        config = self.registry[type(instance)]
+        meta = instance._meta
+        return (instance.pk, *(getattr(instance, meta.get_field(name).attname) for name in config.related))
+    
+    def cache_rows(self, queryset) -> List[tuple]:
+        """cache_row для всех объектов выборки одним запросом."""
+        config = self.registry[queryset.model]
+        meta = queryset.model._meta
+        return list(
+            queryset.order_by().values_list("pk", *(meta.get_field(name).attname for name in config.related))
+        )
+    
+    def invalidate_rows(self, model_class, rows: Iterable[tuple]) -> None:
+        """Сбросить теги объектов (строк cache_row) сейчас и после коммита."""
+        config = self.registry[model_class]
+        meta = model_class._meta
+        tags = {self.model_tag(model_class)}
+        for pk, *related_ids in rows:
+            tags.add(self.model_tag(model_class, pk))
+            for name, related_id in zip(config.related, related_ids, strict=True):
+                if related_id is not None:
+                    tags.add(self.model_tag(meta.get_field(name).related_model, related_id))
+        tags = sorted(tags)
+        self.invalidate_tags(*tags)
+        # Повторно после коммита: экземпляр, прочитанный другим процессом
+        # до коммита, не должен остаться закэшированным под новым поколением
+        transaction.on_commit(lambda: self.invalidate_tags(*tags))
+    
+    def cached_get(self, model_class, pk: Union[str, int], timeout: Optional[int] = None) -> Any:
+        """
+        Экземпляр зарегистрированной модели с проекцией полей из кэша.
+        
+        Запись помечена только тегом "<model>:<pk>", поэтому изменения
+        других объектов модели её не сбрасывают. Связанные объекты из
+        related подставляются тоже через cached_get. Для изменения и
+        сохранения объект читается из БД: копия из кэша может отставать.
+        
+        Args:
+            model_class: Класс зарегистрированной модели
+            pk: Первичный ключ
+            timeout: Время жизни кэша (по умолчанию - из register)
+        
+        Returns:
+            Экземпляр модели
+        
+        Raises:
+            model_class.DoesNotExist: Объекта нет
+        """
+        config = self.registry.get(model_class)
+        if config is None:
+            raise ImproperlyConfigured(f"{model_class.__name__} is not registered in ModelCacheService")
+        queryset = model_class._default_manager.all()
+        if config.fields:
+            queryset = queryset.only(*config.fields)
+        elif config.defer:
+            queryset = queryset.defer(*config.defer)
+        
+        instance = self.fetch(
+            self.make_key(f"{model_class._meta.label_lower}:cached", pk),
+            lambda: queryset.filter(pk=pk).first(),
+            timeout if timeout is not None else config.timeout,
+            tags=[self.model_tag(model_class, pk)],
+        )
+        if instance is None:
+            raise model_class.DoesNotExist(f"{model_class.__name__} {pk} does not exist")
+        
+        meta = model_class._meta
+        for name in config.related:
+            field = meta.get_field(name)
+            related_id = getattr(instance, field.attname)
+            if related_id is not None and field.related_model in self.registry:
+                setattr(instance, name, self.cached_get(field.related_model, related_id))
+        return instance
+    
+    @staticmethod
+    def model_tag(model_class, pk: Union[str, int, None] = None) -> str:
+        """Тег модели ("dish") или её экземпляра ("dish:42")."""
+        name = model_class._meta.model_name
+        return name if pk is None else f"{name}:{pk}"
+    
     def get_model_instance(self, model_class, pk: Union[str, int], timeout: Optional[int] = None) -> Any:
         """
         Получить экземпляр модели из кэша или базы данных.
@@ -141,15 +1018,27 @@ class ModelCacheService(CacheService):
             Экземпляр модели
         """
         key = self.make_key(f"{model_class._meta.label_lower}:instance", pk)
+        tags = [self.model_tag(model_class, pk), self.model_tag(model_class)]
         
-        instance = self.get(key)
+        instance = self.fetch(
+            key,
+            lambda: model_class.objects.filter(pk=pk).first(),
+            timeout,
+            tags=tags,
+            negative_timeout=self.negative_timeout,
+        )
         if instance is None:
-            instance = model_class.objects.get(pk=pk)
-            self.set(key, instance, timeout)
+            raise model_class.DoesNotExist(f"{model_class.__name__} {pk} does not exist")
         
         return instance
     
-    def get_model_queryset(self, model_class, filter_kwargs: dict, timeout: Optional[int] = None) -> Any:
+    def get_model_queryset(
+        self,
+        model_class,
+        filter_kwargs: dict,
+        timeout: Optional[int] = None,
+        tags: Optional[Iterable[str]] = None,
+    ) -> Any:
         """
         Получить QuerySet модели из кэша.
         
@@ -157,46 +1046,34 @@ class ModelCacheService(CacheService):
             model_class: Класс Django модели
             filter_kwargs: Аргументы фильтрации
             timeout: Время жизни кэша
+            tags: Дополнительные теги, например "producer:42" для выборки блюд магазина
         
         Returns:
             QuerySet модели
         """
         key = self.make_key(f"{model_class._meta.label_lower}:queryset", filter_kwargs)
+        tags = [self.model_tag(model_class), *(tags or [])]
         
-        queryset = self.get(key)
-        if queryset is None:
-            queryset = model_class.objects.filter(**filter_kwargs)
-            self.set(key, queryset, timeout)
-        
-        return queryset
+        return self.fetch(key, lambda: model_class.objects.filter(**filter_kwargs), timeout, tags=tags)
     
-    def invalidate_model_instance(self, model_class, pk: Union[str, int]) -> bool:
+    def invalidate_model_instance(self, model_class, pk: Union[str, int]) -> None:
         """
-        Инвалидировать кэш экземпляра модели.
+        Инвалидировать кэш экземпляра модели и всё, что помечено его тегом.
         
         Args:
             model_class: Класс Django модели
             pk: Первичный ключ
-        
-        Returns:
-            True, если успешно удалено
         """
-        key = self.make_key(f"{model_class._meta.label_lower}:instance", pk)
-        return self.delete(key)
+        self.invalidate_tags(self.model_tag(model_class, pk))
     
-    def invalidate_model_queryset(self, model_class, filter_kwargs: dict) -> bool:
+    def invalidate_model(self, model_class) -> None:
         """
-        Инвалидировать кэш QuerySet модели.
+        Инвалидировать все кэшированные экземпляры и выборки модели.
         
         Args:
             model_class: Класс Django модели
-            filter_kwargs: Аргументы фильтрации
-        
-        Returns:
-            True, если успешно удалено
         """
-        key = self.make_key(f"{model_class._meta.label_lower}:queryset", filter_kwargs)
-        return self.delete(key)
+        self.invalidate_tags(self.model_tag(model_class))
 
 
 # Глобальный экземпляр сервиса кэширования
@@ -206,29 +1083,64 @@ model_cache_service = ModelCacheService()
 
 # Утилиты для часто используемых кэшей
 class CommonCacheKeys:
-    """Класс для часто используемых ключей кэша."""
+    """
+    Класс для часто используемых ключей кэша.
+    
+    Каждый метод возвращает (ключ, timeout, теги) для методов CacheService:
+    
+        key, timeout, tags = CommonCacheKeys.producer_detail(producer.id)
+        cache_service.get_or_set(key, load, timeout, tags=tags)
+    """
+    
+    @staticmethod
+    def producer_tag(producer_id: Union[str, int]) -> str:
+        """Тег всех записей о производителе."""
+        return f"producer:{producer_id}"
+    
+    @staticmethod
+    def dish_tag(dish_id: Union[str, int]) -> str:
+        """Тег всех записей о блюде."""
+        return f"dish:{dish_id}"
+    
+    @staticmethod
+    def user_tag(user_id: Union[str, int]) -> str:
+        """Тег всех записей о пользователе."""
+        return f"user:{user_id}"
     
     @staticmethod
     def categories_list(timeout: int = 3600) -> tuple:
         """Ключ для списка категорий."""
-        return ("categories:list", timeout)
+        return ("categories:list", timeout, ["category"])
     
     @staticmethod
     def producer_detail(producer_id: Union[str, int], timeout: int = 300) -> tuple:
         """Ключ для деталей производителя."""
-        return (f"producer:{producer_id}", timeout)
+        return (f"producer:{producer_id}", timeout, [CommonCacheKeys.producer_tag(producer_id)])
     
     @staticmethod
     def dish_detail(dish_id: Union[str, int], timeout: int = 300) -> tuple:
         """Ключ для деталей блюда."""
-        return (f"dish:{dish_id}", timeout)
+        return (f"dish:{dish_id}", timeout, [CommonCacheKeys.dish_tag(dish_id)])
     
     @staticmethod
     def user_orders(user_id: Union[str, int], timeout: int = 60) -> tuple:
         """Ключ для списка заказов пользователя."""
-        return (f"user:{user_id}:orders", timeout)
+        return (f"user:{user_id}:orders", timeout, [f"user:{user_id}:orders"])
     
     @staticmethod
     def producer_orders(producer_id: Union[str, int], timeout: int = 60) -> tuple:
         """Ключ для списка заказов производителя."""
-        return (f"producer:{producer_id}:orders", timeout)
\ No newline at end of file
+        return (
+            f"producer:{producer_id}:orders",
+            timeout,
+            [CommonCacheKeys.producer_tag(producer_id), f"producer:{producer_id}:orders"],
+        )
+    
+    @staticmethod
+    def order_tags(order) -> List[str]:
+        """Теги, которые сбрасывает изменение заказа."""
+        producer_id = order.producer_id or getattr(order.dish, "producer_id", None)
+        tags = [f"user:{order.user_id}:orders"] if order.user_id else []
+        if producer_id:
+            tags.append(f"producer:{producer_id}:orders")
+        return tags
@@ -0,0 +1,99 @@
+"""
+Условные GET (ETag, Last-Modified) для DRF-представлений каталога.
+
+Валидаторы ответа строятся по поколениям тегов core.cache (см.
+CacheService.tag_stamps), а не по данным: изменение объекта сбрасывает
+тег его модели, и ETag меняется. Проверка If-None-Match и
+If-Modified-Since стоит одного get_many к кэшу и выполняется до
+выборки и сериализации - совпадающий запрос получает 304 без тела.
+"""
+
+import hashlib
+import json
+from typing import Dict, List, Optional, Sequence
+
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
+)
+from django.utils.http import http_date, quote_etag
+
+from core.cache import cache_service
+
+
+class NotModified(Exception):
+    """Ответ 304/412 из проверки условий; возвращается из handle_exception."""
+
+    def __init__(self, response):
+        super().__init__()
+        self.response = response
+
+
+class ConditionalGetMixin:
+    """
+    Миксин для ViewSet: ETag и Last-Modified для list и retrieve.
+
+    conditional_tags - теги core.cache, от которых зависит ответ;
+    conditional_per_user - ответ зависит от пользователя (ETag включает
+    его id, добавляется Vary: Authorization); cache_control - аргументы
+    patch_cache_control для ответов этих действий. Если ответ меняется и
+    со временем, без сброса тегов, get_conditional_changed_at возвращает
+    момент последнего такого изменения.
+    """
+
+    conditional_tags: Sequence[str] = ()
+    conditional_actions: Sequence[str] = ("list", "retrieve")
+    conditional_per_user = False
+    cache_control: Dict = {"max_age": 0}
+
+    _validators = None
+
+    def get_conditional_tags(self) -> List[str]:
+        return list(self.conditional_tags)
+
+    def get_conditional_changed_at(self) -> Optional[float]:
+        """Время (timestamp) последнего изменения ответа, не отражённого тегами."""
+        return None
+
+    def _conditional(self, request) -> bool:
+        return request.method in ("GET", "HEAD") and getattr(self, "action", None) in self.conditional_actions
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if not self._conditional(request):
+            return
+
+        versions, modified_at = cache_service.tag_stamps(self.get_conditional_tags())
+        parts = [request.get_full_path(), versions]
+        if self.conditional_per_user:
+            parts.append(str(request.user.pk) if request.user.is_authenticated else None)
+        changed_at = self.get_conditional_changed_at()
+        if changed_at is not None:
+            parts.append(changed_at)
+            modified_at = max(modified_at, changed_at)
+        etag = quote_etag(hashlib.md5(json.dumps(parts, sort_keys=True).encode()).hexdigest())
+        last_modified = int(modified_at)
+        self._validators = (etag, last_modified)
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is not None:
+            raise NotModified(response)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, NotModified):
+            return exc.response
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if self._validators is None or response.status_code not in (200, 304):
+            return response
+
+        etag, last_modified = self._validators
+        response.headers.setdefault("ETag", etag)
+        response.headers.setdefault("Last-Modified", http_date(last_modified))
+        patch_cache_control(response, **self.cache_control)
+        if self.conditional_per_user:
+            patch_vary_headers(response, ["Authorization"])
+        return response
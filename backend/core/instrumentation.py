@@ -0,0 +1,110 @@
+"""
+Сэмплируемая инструментация DRF-представлений.
+
+Для доли запросов записывает в приёмник метрик число SQL-запросов,
+время БД, время сериализации и общее время обработки представления.
+"""
+
+import random
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection
+from django.utils.module_loading import import_string
+
+from .logging import StructuredLogger
+
+
+class LoggingMetricsSink:
+    """Приёмник метрик, пишущий их в структурированный лог."""
+
+    def __init__(self):
+        self.logger = StructuredLogger("core.instrumentation")
+
+    def record(self, metrics: dict) -> None:
+        self.logger.info("view_metrics", **metrics)
+
+
+@lru_cache(maxsize=None)
+def get_metrics_sink(path: str):
+    """Получить экземпляр приёмника метрик по пути к классу."""
+    return import_string(path)()
+
+
+class QueryRecorder:
+    """Обёртка выполнения SQL (connection.execute_wrapper), считающая запросы и время БД."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+
+def is_sampled() -> bool:
+    """Проверить, нужно ли инструментировать текущий запрос."""
+    if not getattr(settings, "QUERY_INSTRUMENTATION_ENABLED", False):
+        return False
+    return random.random() < getattr(settings, "QUERY_INSTRUMENTATION_SAMPLE_RATE", 0.0)
+
+
+class QueryInstrumentationMixin:
+    """
+    Миксин для APIView/ViewSet с сэмплируемым сбором метрик.
+
+    Управляется настройками QUERY_INSTRUMENTATION_ENABLED,
+    QUERY_INSTRUMENTATION_SAMPLE_RATE и QUERY_INSTRUMENTATION_SINK.
+    При выключенной инструментации стоимость - одна проверка флага.
+    """
+
+    _serializer_time = None
+
+    def dispatch(self, request, *args, **kwargs):
+        if not is_sampled():
+            return super().dispatch(request, *args, **kwargs)
+
+        recorder = QueryRecorder()
+        self._serializer_time = 0.0
+        start = time.perf_counter()
+        with connection.execute_wrapper(recorder):
+            response = super().dispatch(request, *args, **kwargs)
+        total_time = time.perf_counter() - start
+
+        get_metrics_sink(settings.QUERY_INSTRUMENTATION_SINK).record(
+            {
+                "view": self.__class__.__name__,
+                "action": getattr(self, "action", None),
+                "method": request.method,
+                "path": request.path,
+                "status_code": response.status_code,
+                "queries": recorder.count,
+                "db_time_ms": round(recorder.duration * 1000, 3),
+                "serializer_time_ms": round(self._serializer_time * 1000, 3),
+                "total_time_ms": round(total_time * 1000, 3),
+            }
+        )
+        return response
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        if self._serializer_time is None:
+            return serializer
+
+        to_representation = serializer.to_representation
+
+        def timed_to_representation(instance):
+            start = time.perf_counter()
+            try:
+                return to_representation(instance)
+            finally:
+                self._serializer_time += time.perf_counter() - start
+
+        serializer.to_representation = timed_to_representation
+        return serializer
@@ -2,11 +2,19 @@
 Улучшенная система пагинации для API.
 """
 
+import base64
+import binascii
+import json
 from collections import OrderedDict
+from datetime import datetime
 from urllib.parse import urlencode
 
-from rest_framework.pagination import PageNumberPagination
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
 from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 
 class StandardResultsSetPagination(PageNumberPagination):
@@ -171,4 +179,142 @@ class LargeResultsSetPagination(PageNumberPagination):
                 ('next', next_url),
                 ('previous', previous_url),
             ]))
-        ]))
\ No newline at end of file
+        ]))
+
+
+class KeysetPagination(BasePagination):
+    """
+    Курсорная (keyset) пагинация по (created_at, id) для больших списков.
+
+    Страница выбирается условием по ключу последней строки предыдущей
+    страницы вместо OFFSET, поэтому глубокие страницы не медленнее первых.
+    Ответ в том же конверте success/data/pagination, что и у
+    StandardResultsSetPagination; вместо номеров страниц - курсоры в
+    ссылках next/previous.
+
+    Число строк выбирается параметром ?count=:
+      exact    - COUNT(*) (по умолчанию);
+      estimate - оценка планировщика на PostgreSQL, на других СУБД
+                 точное число, но не больше estimate_limit;
+      none     - без подсчёта, count = null.
+
+    Направление задаёт атрибут view keyset_ordering ("-created_at" или
+    "created_at"); ?ordering= для таких списков не применяется.
+    """
+
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    ordering = '-created_at'
+    count_mode = 'exact'
+    COUNT_MODES = ('exact', 'estimate', 'none')
+    estimate_limit = 1000
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def get_count_mode(self, request):
+        mode = request.query_params.get(self.count_query_param, self.count_mode)
+        return mode if mode in self.COUNT_MODES else self.count_mode
+
+    @staticmethod
+    def encode_cursor(created_at, pk, reverse=False):
+        raw = json.dumps({'c': created_at.isoformat(), 'i': str(pk), 'r': reverse})
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    @staticmethod
+    def decode_cursor(value):
+        try:
+            padded = value + '=' * (-len(value) % 4)
+            data = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+            return datetime.fromisoformat(data['c']), data['i'], bool(data.get('r'))
+        except (TypeError, ValueError, KeyError, binascii.Error):
+            raise NotFound('Invalid cursor') from None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size_value = self.get_page_size(request)
+        self.descending = getattr(view, 'keyset_ordering', self.ordering).startswith('-')
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        position, reverse = None, False
+        if cursor:
+            created_at, pk, reverse = self.decode_cursor(cursor)
+            position = (created_at, pk)
+
+        self.count = self.get_count(queryset, self.get_count_mode(request))
+
+        # Назад по списку - выборка в обратном порядке, затем разворот
+        forward = self.descending != reverse
+        prefix = '-' if forward else ''
+        page = queryset.order_by(f'{prefix}created_at', f'{prefix}id')
+        if position is not None:
+            lookup = 'lt' if forward else 'gt'
+            created_at, pk = position
+            page = page.filter(
+                Q(**{f'created_at__{lookup}': created_at})
+                | Q(created_at=created_at, **{f'id__{lookup}': pk})
+            )
+        rows = list(page[: self.page_size_value + 1])
+        has_more = len(rows) > self.page_size_value
+        rows = rows[: self.page_size_value]
+        if reverse:
+            rows.reverse()
+            self.has_previous, self.has_next = has_more, True
+        else:
+            self.has_previous, self.has_next = position is not None, has_more
+        self.first, self.last = (rows[0], rows[-1]) if rows else (None, None)
+        return rows
+
+    def get_count(self, queryset, mode):
+        if mode == 'none':
+            return None
+        if mode == 'estimate':
+            return self.estimate_count(queryset)
+        return queryset.count()
+
+    def estimate_count(self, queryset):
+        """Оценка числа строк без полного подсчёта."""
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql':
+            sql, params = queryset.order_by().query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+                plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return int(plan[0]['Plan']['Plan Rows'])
+        return queryset.order_by()[: self.estimate_limit].count()
+
+    def get_next_link(self):
+        if not self.has_next or self.last is None:
+            return None
+        cursor = self.encode_cursor(self.last.created_at, self.last.pk)
+        return replace_query_param(self.request.get_full_path(), self.cursor_query_param, cursor)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if self.first is None:
+            return remove_query_param(self.request.get_full_path(), self.cursor_query_param)
+        cursor = self.encode_cursor(self.first.created_at, self.first.pk, reverse=True)
+        return replace_query_param(self.request.get_full_path(), self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('success', True),
+            ('data', data),
+            ('pagination', OrderedDict([
+                ('count', self.count),
+                ('count_mode', self.get_count_mode(self.request)),
+                ('page_size', self.page_size_value),
+                ('next', self.get_next_link()),
+                ('previous', self.get_previous_link()),
+            ]))
+        ]))
@@ -369,37 +369,18 @@ def cleanup_expired_orders():
 
 
 def update_producer_ratings():
-    """Фоновая задача для обновления рейтингов производителей."""
-    from django.db.models import Avg
+    """Фоновая задача для обновления рейтингов производителей и блюд."""
+    from api.services.bulk_rating_service import BulkRatingService
+
+    producers, dishes = BulkRatingService().recalc_all()
 
-    from api.models import Producer, Review
-    
-    producers = Producer.objects.all()
-    updated_count = 0
-    
-    for producer in producers:
-        ratings = Review.objects.filter(producer=producer).aggregate(
-            avg_taste=Avg('rating_taste'),
-            avg_appearance=Avg('rating_appearance'),
-            avg_service=Avg('rating_service')
-        )
-        
-        taste = ratings['avg_taste'] or 0
-        appearance = ratings['avg_appearance'] or 0
-        service = ratings['avg_service'] or 0
-        
-        new_rating = round((taste + appearance + service) / 3, 2)
-        producer.rating = new_rating
-        producer.rating_count = Review.objects.filter(producer=producer).count()
-        producer.save(update_fields=['rating', 'rating_count'])
-        updated_count += 1
-    
     logger.info(
         'producer_ratings_updated',
-        count=updated_count
+        count=producers,
+        dishes=dishes
     )
-    
-    return f"Updated ratings for {updated_count} producers"
+
+    return f"Updated ratings for {producers} producers and {dishes} dishes"
 
 
 def send_daily_reports():